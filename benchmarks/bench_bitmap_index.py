@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark the tag → resource bitmap index against set-of-int posting lists.
+
+Builds a synthetic corpus (each resource gets a few tags drawn from a skewed
+distribution) and reports memory and latency for OR/AND/AND-NOT/popcount.
+
+Usage:
+    python benchmarks/bench_bitmap_index.py                      # 1M resources
+    python benchmarks/bench_bitmap_index.py -r 1000000 10000000  # 1M and 10M
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from htfs.bitmap_index import Bitmap, BitmapIndex
+
+
+def deep_size(obj):
+    """Approximate memory of dicts/sets of ints and Bitmaps."""
+    if isinstance(obj, Bitmap):
+        return sys.getsizeof(obj) + deep_size(obj.chunks)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_size(k) + deep_size(v) for k, v in obj.items())
+    if isinstance(obj, (set, list)):
+        return sys.getsizeof(obj) + sum(sys.getsizeof(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def timed(label, fn, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<34} {best * 1000:10.2f} ms")
+    return result
+
+
+def run(n_resources, n_tags, tags_per_resource, seed):
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(n_tags)]
+    links = []
+    for resource_id in range(1, n_resources + 1):
+        for tag_id in set(rng.choices(range(1, n_tags + 1), weights, k=tags_per_resource)):
+            links.append((resource_id, tag_id))
+    print(f"{n_resources:,} resources, {n_tags:,} tags, {len(links):,} links")
+
+    start = time.perf_counter()
+    index = BitmapIndex.from_links(links)
+    print(f"  {'build bitmap index':<34} {(time.perf_counter() - start) * 1000:10.2f} ms")
+    postings = {}
+    for resource_id, tag_id in links:
+        postings.setdefault(tag_id, set()).add(resource_id)
+    del links
+
+    print(f"  {'memory: bitmaps':<34} {deep_size(index.bitmaps) / 2**20:10.1f} MiB")
+    print(f"  {'memory: set posting lists':<34} {deep_size(postings) / 2**20:10.1f} MiB")
+
+    wide = list(range(1, 51))
+    universe = timed("universe bitmap from IDs", lambda: Bitmap.from_ids(range(1, n_resources + 1)), repeat=1)
+    timed("OR of 50 tags (bitmap)", lambda: index.union(wide))
+    timed("OR of 50 tags (sets)", lambda: set().union(*(postings[t] for t in wide)))
+    timed("AND of 2 tags (bitmap)", lambda: index.get(1) & index.get(2))
+    timed("AND of 2 tags (sets)", lambda: postings[1] & postings[2])
+    timed("NOT tag (bitmap)", lambda: universe - index.get(1))
+    timed("count OR of 50 tags (bitmap)", lambda: len(index.union(wide)))
+    timed("count OR of 50 tags (sets)", lambda: len(set().union(*(postings[t] for t in wide))))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--resources", type=int, nargs="+", default=[1000000])
+    parser.add_argument("-t", "--tags", type=int, default=1000)
+    parser.add_argument("-k", "--tags-per-resource", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for n_resources in args.resources:
+        run(n_resources, args.tags, args.tags_per_resource, args.seed)
+
+
+if __name__ == "__main__":
+    main()
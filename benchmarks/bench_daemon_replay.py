@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Replay a synthetic inotify event stream through TagfsInotifyDaemon.
+
+Creates a boundary with a set of tracked files, then feeds the daemon a
+stream of rename pairs (IN_MOVED_FROM + IN_MOVED_TO with a shared cookie)
+interleaved with renames of untracked editor temp files and with directories
+moved out of the boundary, whose IN_MOVED_FROM never gets a match. The daemon runs on a simulated clock advancing by
+1/rate seconds per event, and tick() is called after every event as in run(),
+so cookie expiry, group commits and flushes all happen as they would live.
+
+Reports throughput per slice of the stream (it should stay flat), the
+largest number of cookies ever waiting for a match (it should stay near
+rate * cookie timeout) and the daemon's event counters. Exits non-zero if
+the pending cookies are not bounded or the database does not end up with
+the expected URLs.
+
+Usage:
+    python benchmarks/bench_daemon_replay.py
+    python benchmarks/bench_daemon_replay.py -n 100000 --files 500 --out-every 50
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+import tempfile
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from htfs import HTFS  # noqa: E402
+from tagfs_inotify_daemon import TagfsInotifyDaemon  # noqa: E402
+
+FakeEvent = namedtuple("FakeEvent", "cookie")
+
+
+def create_boundary(directory, files, leaving):
+    """Track files f<i>.0 and, for each directory that will leave, gone<n>/x."""
+    htfs = HTFS(directory)
+    htfs.initialize()
+    urls = [f"f{i}.0" for i in range(files)] + [f"gone{n}/x" for n in leaving]
+    htfs.add_resources([os.path.join(directory, url) for url in urls])
+    htfs.close()
+
+
+def event_stream(directory, moves, files, out_every, temp_every):
+    """
+    Yield inotify-style events: moves renaming f<i>.<gen> -> f<i>.<gen+1>,
+    untracked temp file renames and unmatched directory moves.
+    """
+    cookie = 0
+    for n in range(moves):
+        cookie += 1
+        i, generation = n % files, n // files
+        if out_every and n % out_every == 0:
+            yield (FakeEvent(cookie), ["IN_MOVED_FROM", "IN_ISDIR"], directory, f"gone{n}")
+            cookie += 1
+        if temp_every and n % temp_every == 0:
+            yield (FakeEvent(cookie), ["IN_MOVED_FROM"], directory, f".f{i}.swp")
+            yield (FakeEvent(cookie), ["IN_MOVED_TO"], directory, f"f{i}~")
+            cookie += 1
+        yield (FakeEvent(cookie), ["IN_MOVED_FROM"], directory, f"f{i}.{generation}")
+        yield (FakeEvent(cookie), ["IN_MOVED_TO"], directory, f"f{i}.{generation + 1}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--moves", type=int, default=1_000_000, help="rename pairs to replay")
+    parser.add_argument("--files", type=int, default=1000, help="tracked files being renamed")
+    parser.add_argument("--out-every", type=int, default=100, help="one directory leaves the boundary per N moves (0: never)")
+    parser.add_argument("--temp-every", type=int, default=1, help="one untracked temp file rename per N moves (0: never)")
+    parser.add_argument("--rate", type=float, default=20000.0, help="simulated events per second")
+    parser.add_argument("--slices", type=int, default=10, help="throughput reports over the run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.realpath(tmp)
+        leaving = range(0, args.moves, args.out_every) if args.out_every else ()
+        create_boundary(directory, args.files, leaving)
+        daemon = TagfsInotifyDaemon(directory)
+        now = [0.0]
+        daemon.clock = lambda: now[0]
+        daemon._last_flush = 0.0
+        step = 1.0 / args.rate
+        # Directories leaving per timeout window, plus the one match in flight
+        events_per_move = 2 + (1 / args.out_every if args.out_every else 0)
+        events_per_move += 2 / args.temp_every if args.temp_every else 0
+        leaving_per_event = (1 / args.out_every / events_per_move) if args.out_every else 0
+        bound = math.ceil(args.rate * daemon.cookie_timeout * leaving_per_event) + 2
+
+        slice_size = max(1, args.moves // args.slices)
+        peak_cookies = events = reported = 0
+        print(f"  {'moves':>10} {'events/s':>10} {'pending cookies':>16}")
+        start = slice_start = time.perf_counter()
+        for event in event_stream(directory, args.moves, args.files, args.out_every, args.temp_every):
+            now[0] += step
+            daemon.handle_event(event)
+            daemon.tick()
+            peak_cookies = max(peak_cookies, len(daemon.cookies))
+            events += 1
+            if daemon.counters["matched"] % slice_size == 0 and daemon.counters["matched"] != reported:
+                reported = daemon.counters["matched"]
+                elapsed = time.perf_counter() - slice_start
+                print(f"  {daemon.counters['matched']:>10} {events / elapsed:>10.0f} {len(daemon.cookies):>16}")
+                slice_start, events = time.perf_counter(), 0
+        now[0] += daemon.cookie_timeout + daemon.commit_window
+        daemon.tick()
+        total = time.perf_counter() - start
+        stats = daemon.stats()
+        daemon.close()
+
+        htfs = HTFS(directory, read_only=True)
+        urls = set(htfs.th.get_resource_urls_under("."))
+        htfs.close()
+
+    expected = {f"f{i}.{(args.moves - i - 1) // args.files + 1}" for i in range(min(args.files, args.moves))}
+    expected |= {f"f{i}.0" for i in range(args.moves, args.files)}
+    print(f"\n{args.moves} moves in {total:.1f} s ({args.moves / total:.0f} moves/s)")
+    print(f"peak pending cookies: {peak_cookies} (bound {bound})")
+    print(f"counters: {stats}")
+
+    failures = []
+    if peak_cookies > bound:
+        failures.append(f"pending cookies reached {peak_cookies}, over {bound}")
+    if stats["pending"]:
+        failures.append(f"{stats['pending']} cookies never expired")
+    if urls != expected:
+        failures.append(f"{len(urls ^ expected)} URLs differ from the replayed renames")
+    for failure in failures:
+        print(f"  {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold start of the tagfs CLI, one subcommand at a time.
+
+Creates a small boundary in a temporary directory, then for each subcommand
+runs the CLI in a fresh interpreter:
+
+  - `python -X importtime` to list the slowest top-level imports
+  - repeated plain runs for the best wall time, checked against a budget
+
+Bytecode is written to a temporary cache directory and every command is run
+once before timing, so results reflect an installed package rather than
+first-run compilation. Forwarding to `tagfs serve` is disabled.
+
+Exits non-zero if a command exceeds its budget or imports rdflib without
+needing it.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py -n 20 --budget lstags=40
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# argv after `tagfs` for each measured command
+COMMANDS = {
+    "help": ["help"],
+    "getboundary": ["getboundary"],
+    "lstags": ["lstags"],
+    "lsresources": ["lsresources", "Project"],
+    "getresourcetags": ["getresourcetags", "a.txt"],
+    "ls": ["ls"],
+    "prompt": ["prompt"],
+    "lsresources-sparql": ["lsresources", "--engine", "sparql", "Project"],
+}
+# Wall-time budgets in milliseconds
+BUDGETS_MS = {"getboundary": 50.0, "lstags": 50.0}
+# Only these may load rdflib
+RDFLIB_COMMANDS = {"lsresources-sparql"}
+
+_RUN_CLI = "import sys; sys.argv[0] = 'tagfs'; from htfs.cli import main; main()"
+
+
+def make_env(pycache_dir):
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPYCACHEPREFIX"] = pycache_dir
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["TAGFS_NO_SERVER"] = "1"
+    return env
+
+
+def run_cli(argv, cwd, env, importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", _RUN_CLI, *argv]
+    return subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, text=True)
+
+
+def create_boundary(directory, env):
+    """Initialize a boundary with a few tags, files and links."""
+    steps = [
+        ["init"],
+        ["addtags", "Project/Alpha", "Project/Beta", "Reports"],
+    ]
+    for name in ("a.txt", "b.txt", "c.txt"):
+        with open(os.path.join(directory, name), "w") as fp:
+            fp.write(name)
+        steps.append(["addresource", name])
+    steps += [["tagresource", "a.txt", "Alpha"], ["tagresource", "b.txt", "Beta", "Reports"]]
+    for argv in steps:
+        result = run_cli(argv, directory, env)
+        if result.returncode != 0:
+            raise RuntimeError(f"tagfs {' '.join(argv)} failed:\n{result.stderr}")
+
+
+def parse_importtime(stderr):
+    """Return ({module: cumulative us} for top-level imports, set of all modules)."""
+    top, modules = {}, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the column header
+        modules.add(name.strip())
+        # Nested imports are indented below the module that caused them
+        if not name.startswith("  "):
+            top[name.strip()] = int(cumulative)
+    return top, modules
+
+
+def best_wall_ms(argv, cwd, env, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_cli(argv, cwd, env)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def interpreter_ms(env, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], env=env, capture_output=True)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="timed runs per command (best is reported)")
+    parser.add_argument("--top", type=int, default=5, help="slowest imports to show per command")
+    parser.add_argument("--budget", action="append", default=[], metavar="CMD=MS", help="override a budget")
+    parser.add_argument("commands", nargs="*", metavar="command", help=f"commands to measure (default all): {', '.join(COMMANDS)}")
+    args = parser.parse_args()
+    unknown = [name for name in args.commands if name not in COMMANDS]
+    if unknown:
+        parser.error(f"unknown commands: {', '.join(unknown)}")
+
+    budgets = dict(BUDGETS_MS)
+    for spec in args.budget:
+        name, _, ms = spec.partition("=")
+        budgets[name] = float(ms)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        boundary = os.path.join(tmp, "boundary")
+        os.mkdir(boundary)
+        env = make_env(os.path.join(tmp, "pycache"))
+        create_boundary(boundary, env)
+
+        base = interpreter_ms(env, args.repeat)
+        print(f"python startup: {base:.1f} ms\n")
+        print(f"  {'command':<20} {'wall ms':>9} {'over python':>12} {'budget':>8}   slowest imports (cumulative ms)")
+        for name in args.commands or COMMANDS:
+            argv = COMMANDS[name]
+            warm = run_cli(argv, boundary, env)  # also fills the bytecode cache
+            if warm.returncode != 0:
+                failures.append(f"{name}: exited {warm.returncode}: {warm.stderr.strip()}")
+                continue
+            top, modules = parse_importtime(run_cli(argv, boundary, env, importtime=True).stderr)
+            wall = best_wall_ms(argv, boundary, env, args.repeat)
+
+            budget = budgets.get(name)
+            slowest = sorted(top.items(), key=lambda item: -item[1])[:args.top]
+            imports = ", ".join(f"{module} {us / 1000:.1f}" for module, us in slowest)
+            print(f"  {name:<20} {wall:9.1f} {wall - base:12.1f} {budget if budget else '-':>8}   {imports}")
+
+            if budget is not None and wall > budget:
+                failures.append(f"{name}: {wall:.1f} ms is over its {budget:.0f} ms budget")
+            if "rdflib" in modules and name not in RDFLIB_COMMANDS:
+                failures.append(f"{name}: imports rdflib")
+
+    if failures:
+        print("\nregressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+"""
+HTFS - Hierarchically Tagged File System.
+
+The public names are resolved on first access, so importing a submodule
+(e.g. htfs.cli or htfs.boundary) does not load the database layer.
+"""
+
+__all__ = ["HTFS", "find_tagfs_boundary"]
+
+
+def __getattr__(name):
+    if name == "HTFS":
+        from htfs.core import HTFS
+        return HTFS
+    if name == "find_tagfs_boundary":
+        from htfs.boundary import find_tagfs_boundary
+        return find_tagfs_boundary
+    raise AttributeError(f"module 'htfs' has no attribute {name!r}")
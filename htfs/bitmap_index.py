@@ -0,0 +1,211 @@
+"""
+bitmap_index - Inverted index from tag ID to a compressed bitmap of resource IDs.
+
+A Bitmap splits resource IDs into 65536-wide chunks (``id >> 16``) and keeps
+each non-empty chunk as a Python int bitset, so sparse tags stay small and
+set algebra is a handful of big-int AND/OR operations per chunk.
+
+The index is persisted next to the relationship snapshot
+(``.tagfs.ttl.bitmaps``) and stamped with the snapshot header it was derived
+from; RDFHandler replays the journal's hasTag entries on top of it.
+
+    header:  magic, version, snapshot header, tag count
+    entries: tag id, chunk count, then per chunk: key, byte length, bytes
+"""
+
+import os
+import struct
+
+from htfs.edge_store import SNAPSHOT_HEADER_SIZE
+
+BITMAP_MAGIC = b"HTFSBMP1"
+BITMAP_VERSION = 1
+CHUNK_BITS = 16
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+_HEADER = struct.Struct(f"<8sI{SNAPSHOT_HEADER_SIZE}sI")
+_ENTRY = struct.Struct("<iI")
+_CHUNK = struct.Struct("<II")
+
+# Set bit positions for every byte value, used to enumerate IDs quickly
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256))
+
+
+class BitmapError(Exception):
+    """Raised when a bitmap index file is missing, stale or corrupt."""
+
+
+def _popcount(bits):
+    try:
+        return bits.bit_count()
+    except AttributeError:  # Python < 3.10
+        return bin(bits).count("1")
+
+
+class Bitmap:
+    """A set of non-negative integers stored as chunked bitsets."""
+
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks if chunks is not None else {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        buffers = {}
+        for value in ids:
+            key, offset = value >> CHUNK_BITS, value & _CHUNK_MASK
+            buf = buffers.get(key)
+            if buf is None:
+                buf = buffers[key] = bytearray(1 << (CHUNK_BITS - 3))
+            buf[offset >> 3] |= 1 << (offset & 7)
+        return cls({key: int.from_bytes(buf, "little") for key, buf in buffers.items()})
+
+    def add(self, value):
+        key = value >> CHUNK_BITS
+        self.chunks[key] = self.chunks.get(key, 0) | (1 << (value & _CHUNK_MASK))
+
+    def discard(self, value):
+        key = value >> CHUNK_BITS
+        bits = self.chunks.get(key, 0) & ~(1 << (value & _CHUNK_MASK))
+        if bits:
+            self.chunks[key] = bits
+        else:
+            self.chunks.pop(key, None)
+
+    def __contains__(self, value):
+        return bool(self.chunks.get(value >> CHUNK_BITS, 0) >> (value & _CHUNK_MASK) & 1)
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __len__(self):
+        return sum(_popcount(bits) for bits in self.chunks.values())
+
+    def __iter__(self):
+        """Iterate over the stored integers in ascending order."""
+        for key in sorted(self.chunks):
+            bits = self.chunks[key]
+            base = key << CHUNK_BITS
+            data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+            for byte_index, byte in enumerate(data):
+                if byte:
+                    offset = base + (byte_index << 3)
+                    for bit in _BYTE_BITS[byte]:
+                        yield offset + bit
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for key, bits in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | bits
+        return Bitmap(chunks)
+
+    def __and__(self, other):
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        chunks = {}
+        for key, bits in small.items():
+            both = bits & large.get(key, 0)
+            if both:
+                chunks[key] = both
+        return Bitmap(chunks)
+
+    def __sub__(self, other):
+        chunks = {}
+        for key, bits in self.chunks.items():
+            rest = bits & ~other.chunks.get(key, 0)
+            if rest:
+                chunks[key] = rest
+        return Bitmap(chunks)
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and self.chunks == other.chunks
+
+
+class BitmapIndex:
+    """Maps tag IDs to Bitmaps of the resource IDs linked to them."""
+
+    def __init__(self, bitmaps=None):
+        self.bitmaps = bitmaps if bitmaps is not None else {}
+
+    @classmethod
+    def from_links(cls, links):
+        """Build from (resource_id, tag_id) pairs."""
+        ids_by_tag = {}
+        for resource_id, tag_id in links:
+            ids_by_tag.setdefault(tag_id, []).append(resource_id)
+        return cls({tag_id: Bitmap.from_ids(ids) for tag_id, ids in ids_by_tag.items()})
+
+    def add(self, resource_id, tag_id):
+        bitmap = self.bitmaps.get(tag_id)
+        if bitmap is None:
+            bitmap = self.bitmaps[tag_id] = Bitmap()
+        bitmap.add(resource_id)
+
+    def remove(self, resource_id, tag_id):
+        bitmap = self.bitmaps.get(tag_id)
+        if bitmap is None:
+            return
+        bitmap.discard(resource_id)
+        if not bitmap:
+            del self.bitmaps[tag_id]
+
+    def get(self, tag_id) -> Bitmap:
+        return self.bitmaps.get(tag_id, Bitmap())
+
+    def union(self, tag_ids) -> Bitmap:
+        """Resources linked to any of the given tags."""
+        chunks = {}
+        for tag_id in tag_ids:
+            bitmap = self.bitmaps.get(tag_id)
+            if bitmap is None:
+                continue
+            for key, bits in bitmap.chunks.items():
+                chunks[key] = chunks.get(key, 0) | bits
+        return Bitmap(chunks)
+
+    # -------------------------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------------------------
+
+    def save(self, path, snapshot_header):
+        """Write the index atomically, stamped with the snapshot header it matches."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(_HEADER.pack(BITMAP_MAGIC, BITMAP_VERSION, snapshot_header, len(self.bitmaps)))
+            for tag_id, bitmap in self.bitmaps.items():
+                fp.write(_ENTRY.pack(tag_id, len(bitmap.chunks)))
+                for key, bits in bitmap.chunks.items():
+                    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+                    fp.write(_CHUNK.pack(key, len(data)))
+                    fp.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, snapshot_header):
+        """Read an index file, rejecting it unless it was built from the given snapshot."""
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+        except OSError as e:
+            raise BitmapError(str(e)) from e
+        try:
+            magic, version, stamp, n_tags = _HEADER.unpack_from(data)
+            if magic != BITMAP_MAGIC or version != BITMAP_VERSION:
+                raise BitmapError(f"unsupported bitmap index format: {path}")
+            if stamp != snapshot_header:
+                raise BitmapError(f"bitmap index is stale: {path}")
+            offset = _HEADER.size
+            bitmaps = {}
+            for _ in range(n_tags):
+                tag_id, n_chunks = _ENTRY.unpack_from(data, offset)
+                offset += _ENTRY.size
+                chunks = {}
+                for _ in range(n_chunks):
+                    key, length = _CHUNK.unpack_from(data, offset)
+                    offset += _CHUNK.size
+                    chunks[key] = int.from_bytes(data[offset:offset + length], "little")
+                    offset += length
+                bitmaps[tag_id] = Bitmap(chunks)
+        except struct.error as e:
+            raise BitmapError(f"truncated bitmap index: {path}") from e
+        return cls(bitmaps)
@@ -0,0 +1,45 @@
+"""
+boundary - Locate a tagfs boundary and fingerprint its database files.
+
+Kept free of database imports so that commands which only need to find the
+boundary (and the CLI's server forwarding) start quickly.
+"""
+
+import os
+
+TAGFS_DB = ".tagfs.db"
+TAGFS_TTL = ".tagfs.ttl"
+# Every file whose change means the stored tags may have changed
+_STORAGE_FILES = (TAGFS_DB, TAGFS_DB + "-wal", TAGFS_TTL, TAGFS_TTL + ".journal", TAGFS_TTL + ".snap")
+
+
+def find_tagfs_boundary(start_dir=''):
+    """
+    Find the tagfs boundary by searching for .tagfs.db upward.
+    Returns the directory path containing the tagfs database.
+    """
+    current = os.path.realpath(os.path.expanduser(start_dir or os.curdir))
+    if not os.path.isdir(current):
+        current = os.path.dirname(current)
+    while True:
+        if os.path.exists(os.path.join(current, TAGFS_DB)):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def storage_generation(tagfs_boundary):
+    """
+    A cheap fingerprint of the boundary's database files (mtime and size of
+    each). It changes whenever any process modifies tags or links.
+    """
+    generation = []
+    for name in _STORAGE_FILES:
+        try:
+            st = os.stat(os.path.join(str(tagfs_boundary), name))
+            generation.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            generation.append(None)
+    return tuple(generation)
@@ -7,29 +7,40 @@ Usage: tagfs <command> [options]
 
 import os
 import sys
-import shutil
 import logging
 import argparse
-from pathlib import Path
 
 # Add parent directory to sys.path to allow standalone execution
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 
-from htfs import HTFS, find_tagfs_boundary
+from htfs.boundary import find_tagfs_boundary
 
-logging.basicConfig(level='INFO')
 logobj = logging.getLogger(__name__)
 
+# While `tagfs serve` runs a command, the HTFS session it keeps open
+_session = None
 
-def get_tagfs_utils():
-    """Get HTFS instance, searching for tagfs boundary."""
-    tagfs_boundary = find_tagfs_boundary()
+
+def use_session(session):
+    """Make commands use an already-open HTFS session (None to stop)."""
+    global _session
+    _session = session
+
+
+def get_tagfs_utils(read_only=False, tagfs_boundary=None):
+    """Get HTFS instance for tagfs_boundary, by default the one around the current directory."""
+    if _session is not None and (tagfs_boundary is None or str(_session.tagfs_boundary) == str(tagfs_boundary)):
+        return _session
+    if tagfs_boundary is None:
+        tagfs_boundary = find_tagfs_boundary()
 
     if tagfs_boundary is None:
         logobj.error('db not initialized')
         print_usage([])
         return None
-    th_utils = HTFS(tagfs_boundary)
+    from htfs.core import HTFS
+
+    th_utils = HTFS(tagfs_boundary, read_only=read_only)
     return th_utils
 
 
@@ -45,9 +56,14 @@ def _get_tag_fs_boundary(args):
 
 def _init_tag_fs(args):
     """Initialize a new tagfs database in the current directory."""
+    from pathlib import Path
+    from htfs.core import HTFS
+
     ts = HTFS(Path.cwd())
-    ts.initialize()
+    initialized = ts.initialize(args.links)
     ts.close()  # Ensure RDF is saved
+    if not initialized:
+        return 1
 
     if not (Path.cwd() / ".tagfs.db").exists():
         return 1
@@ -57,7 +73,7 @@ def _init_tag_fs(args):
 
 def _get_tags_list(args):
     tags = args.tags
-    th_utils = get_tagfs_utils()
+    th_utils = get_tagfs_utils(read_only=True)
     if th_utils is None:
         return 1
     try:
@@ -114,13 +130,37 @@ def _delete_tag(args):
         th_utils.close()
 
 
+def _read_lines(source):
+    """Read non-empty lines from a file, or from stdin when source is '-'."""
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, "r", encoding="utf-8") as fp:
+            lines = fp.read().splitlines()
+    return [line for line in lines if line.strip()]
+
+
 def _add_resource(args):
-    resource_url = args.path
+    if (args.path is None) == (args.from_file is None):
+        logobj.error("give either a path or --from-file")
+        return 1
     th_utils = get_tagfs_utils()
     if th_utils is None:
         return 1
     try:
-        th_utils.add_resource(resource_url)
+        if args.recursive:
+            if args.from_file is not None or not os.path.isdir(args.path):
+                logobj.error("--recursive needs a directory path")
+                return 1
+            added = th_utils.add_tree(args.path, include=args.include, exclude=args.exclude,
+                                      tags=args.tag, workers=args.jobs)
+            if added is None:
+                return 1
+            logobj.info("%d new resources tracked", len(added))
+        elif args.from_file is not None:
+            th_utils.add_resources(_read_lines(args.from_file))
+        else:
+            th_utils.add_resource(args.path)
         return 0
     finally:
         th_utils.close()
@@ -138,15 +178,42 @@ def _del_resource(args):
             if os.path.isfile(resource_url):
                 os.remove(resource_url)
             elif os.path.isdir(resource_url):
+                import shutil
                 shutil.rmtree(resource_url)
         return 0
     finally:
         th_utils.close()
 
 
+def _tag_resources_from_stdin(args):
+    """Tag resources listed on stdin as 'path<TAB>tag [tag ...]' lines."""
+    if args.path is not None or args.tags:
+        logobj.error("--stdin does not take a path or tags")
+        return 1
+    resource_tags = []
+    for line in _read_lines('-'):
+        resource_url, _, tags = line.partition('\t')
+        resource_tags.append((resource_url, tags.split()))
+    th_utils = get_tagfs_utils()
+    if th_utils is None:
+        return 1
+    try:
+        unsuccessful = th_utils.tag_resources(resource_tags)
+        for resource_url, tags in unsuccessful.items():
+            logobj.error("could not tag %s: %s", resource_url, str(tags))
+        return 1 if unsuccessful else 0
+    finally:
+        th_utils.close()
+
+
 def _tag_resource(args):
+    if args.stdin:
+        return _tag_resources_from_stdin(args)
     resource_url = args.path
     tags = args.tags
+    if resource_url is None or not tags:
+        logobj.error("a path and at least one tag are required")
+        return 1
     th_utils = get_tagfs_utils()
     if th_utils is None:
         return 1
@@ -197,35 +264,79 @@ def _move_resource(args):
     target_url = args.newpath
     make_fs_change = args.makefschange.lower() == 'true'
 
-    src_is_file = os.path.isfile(resource_url)
+    # Like mv: a path that has not moved yet goes inside an existing directory
+    src_exists = os.path.exists(resource_url)
     target_is_dir = os.path.isdir(target_url)
-    if target_is_dir and src_is_file:
-        target_url = os.path.join(target_url, os.path.basename(resource_url))
+    if target_is_dir and src_exists:
+        target_url = os.path.join(target_url, os.path.basename(resource_url.rstrip(os.sep)))
 
     if make_fs_change:
+        import shutil
         shutil.move(resource_url, target_url)
 
     th_utils = get_tagfs_utils()
     if th_utils is None:
         return 1
     try:
-        th_utils.move_resource(resource_url, target_url)
+        if not th_utils.move_resource(resource_url, target_url):
+            logobj.error("could not move %s to %s", resource_url, target_url)
+            return 1
         return 0
     finally:
         th_utils.close()
 
 
+def _sanitize(args):
+    th_utils = get_tagfs_utils(read_only=args.dry_run)
+    if th_utils is None:
+        return 1
+    try:
+        checked, missing = th_utils.sanitize(dry_run=args.dry_run, workers=args.jobs)
+    finally:
+        th_utils.close()
+    if args.format == 'jsonl':
+        import json
+        for path in missing:
+            print(json.dumps({"path": path, "untracked": not args.dry_run}))
+    else:
+        for path in missing:
+            print(path)
+    action = "would be untracked" if args.dry_run else "untracked"
+    logobj.info("%d of %d tracked resources missing, %s", len(missing), checked, action)
+    return 0
+
+
+def _relocate(args):
+    th_utils = get_tagfs_utils(read_only=args.dry_run)
+    if th_utils is None:
+        return 1
+    try:
+        moved = th_utils.relocate(dry_run=args.dry_run, workers=args.jobs)
+    finally:
+        th_utils.close()
+    if args.format == 'jsonl':
+        import json
+        for path, new_path in moved:
+            print(json.dumps({"path": path, "newpath": new_path, "moved": not args.dry_run}))
+    else:
+        for path, new_path in moved:
+            print(path + "\t" + new_path)
+    action = "would be moved" if args.dry_run else "moved"
+    logobj.info("%d resources found at a new path, %s", len(moved), action)
+    return 0
+
+
 def _get_resources_by_tag_expr(args):
     tagsexpr = args.tagexpr
-    th_utils = get_tagfs_utils()
+    th_utils = get_tagfs_utils(read_only=True)
     if th_utils is None:
         return 1
     try:
         if args.count:
-            count = th_utils.get_resources_by_tag_expr(tagsexpr, count=True)
+            count = th_utils.get_resources_by_tag_expr(tagsexpr, count=True, engine=args.engine)
             print(count)
         else:
-            resource_urls = th_utils.get_resources_by_tag_expr(tagsexpr)
+            resource_urls = th_utils.get_resources_by_tag_expr(tagsexpr, engine=args.engine)
             for res_url in resource_urls:
                 print(res_url)
         return 0
@@ -249,21 +360,74 @@ def _link_tags(args):
         th_utils.close()
 
 
+def _print_resource_tags(path, tags, output_format):
+    """Print a resource as 'path<TAB>tag tag ...' (tsv) or as a JSON line; tags is None if untracked."""
+    if output_format == 'jsonl':
+        import json
+        print(json.dumps({"path": path, "tracked": tags is not None, "tags": tags or []}))
+    else:
+        print(path + "\t" + " ".join(tags or []))
+
+
 def _get_resource_tags(args):
-    resource_url = args.path
-    th_utils = get_tagfs_utils()
+    paths = list(args.paths)
+    if args.stdin:
+        paths.extend(_read_lines('-'))
+    if not paths:
+        logobj.error("no resources specified")
+        return 1
+    th_utils = get_tagfs_utils(read_only=True)
     if th_utils is None:
         return 1
     try:
-        if not th_utils.is_resource_tracked(resource_url):
+        tags_by_path = th_utils.get_resources_tags(paths)
+    finally:
+        th_utils.close()
+
+    if len(paths) == 1 and not args.stdin and args.format is None:
+        # One path: one tag per line, as always
+        tags = tags_by_path[paths[0]]
+        if tags is None:
             logobj.error("resource not tracked")
             return 1
-        tags = th_utils.get_resource_tags(resource_url)
         for tag in tags:
             print(tag)
         return 0
-    finally:
-        th_utils.close()
+
+    code = 0
+    for path in paths:
+        tags = tags_by_path[path]
+        if tags is None:
+            logobj.error("resource not tracked: %s", path)
+            code = 1
+        _print_resource_tags(path, tags, args.format)
+    return code
+
+
+def _list_directory(args):
+    """List a directory's entries with their tags, resolved in one bulk lookup."""
+    try:
+        with os.scandir(args.dir) as entries:
+            names = sorted(entry.name for entry in entries if args.all or not entry.name.startswith('.'))
+    except OSError as e:
+        logobj.error("cannot list %s: %s", args.dir, e)
+        return 1
+    paths = [os.path.join(args.dir, name) for name in names]
+
+    tags_by_path = {}
+    # The boundary is the listed directory's, wherever tagfs runs from;
+    # outside any boundary this is a plain listing
+    tagfs_boundary = find_tagfs_boundary(args.dir)
+    if tagfs_boundary is not None:
+        th_utils = get_tagfs_utils(read_only=True, tagfs_boundary=tagfs_boundary)
+        try:
+            tags_by_path = th_utils.get_resources_tags(paths)
+        finally:
+            th_utils.close()
+
+    for name, path in zip(names, paths):
+        _print_resource_tags(name, tags_by_path.get(path), args.format)
+    return 0
 
 
 def _rm_resource_tags(args):
@@ -271,7 +435,7 @@ def _rm_resource_tags(args):
 
 
 def _export_graph(args):
-    th_utils = get_tagfs_utils()
+    th_utils = get_tagfs_utils(read_only=True)
     if th_utils is None:
         return 1
     try:
@@ -305,10 +469,60 @@ def _unlink_tags(args):
         th_utils.close()
 
 
+def _link_backend(args):
+    """Show the link backend, or convert the boundary's links to another one."""
+    th_utils = get_tagfs_utils()
+    if th_utils is None:
+        return 1
+    try:
+        if args.backend is None:
+            print(th_utils.get_link_backend())
+            return 0
+        if not th_utils.set_link_backend(args.backend):
+            return 1
+        return 0
+    finally:
+        th_utils.close()
+
+
+def _prompt(args):
+    """Print '{tag, ...}' for the current directory, for use in a shell prompt."""
+    from htfs.boundary import storage_generation
+    from htfs.prompt import PromptCache, format_tags, prompt_tags
+
+    tagfs_boundary = find_tagfs_boundary()
+    if tagfs_boundary is None:
+        print("")
+        return 0
+    directory = os.getcwd()
+    cache = PromptCache(tagfs_boundary, storage_generation(tagfs_boundary))
+    text = cache.get(directory)
+    if text is None:
+        th_utils = get_tagfs_utils(read_only=True)
+        try:
+            text = format_tags(prompt_tags(th_utils, directory))
+        finally:
+            th_utils.close()
+        cache.put(directory, text)
+    print(text)
+    return 0
+
+
+def _serve(args):
+    """Keep the boundary loaded and answer forwarded CLI commands."""
+    from htfs import server
+
+    tagfs_boundary = find_tagfs_boundary()
+    if tagfs_boundary is None:
+        logobj.error('db not initialized')
+        return 1
+    return server.serve(tagfs_boundary)
+
+
 def print_usage(args):
     print("HTFS: Hierarchically Tagged File System")
     cmd = "\t" + os.path.basename(sys.argv[0])
-    print(cmd + " init \t\t\t initialize the tags db")
+    print(cmd + " init [--links rdf|sqlite] \t initialize the tags db")
     print(cmd + " getboundary \t\t fs boundary starting which tags are tracked")
     print(cmd + " lstags [tag] \t\t list tags")
     print(cmd + " addtags [tag]* \t\t add new tags or create a tag hierarchy")
@@ -316,23 +530,25 @@ def print_usage(args):
     print(cmd + " rmtag tag \t\t delete an existing tag")
     print(cmd + " linktags tag parenttag \t add an extra parent-child link")
     print(cmd + " unlinktags tag parenttag \t remove a parent-child link")
-    print(cmd + " addresource path \t\t track a new resource")
-    print(cmd + " tagresource path [tag]* \t add tags to tracked resources")
+    print(cmd + " addresource path | --from-file f \t track new resources ('-' reads stdin)")
+    print(cmd + " addresource -r dir [--include g] [--exclude g] [--tag t] \t track a directory tree")
+    print(cmd + " tagresource path [tag]* | --stdin \t add tags to tracked resources")
     print(cmd + " untagresource path [tag]* [--all] \t remove tags on tracked resources")
-    print(cmd + " lsresources tagexpr \t list resources with given tags")
-    print(cmd + " getresourcetags path \t list all the tags of the resource")
+    print(cmd + " lsresources [--engine e] tagexpr \t list resources with given tags")
+    print(cmd + " getresourcetags path* [--stdin] [--format f] \t list the tags of resources")
+    print(cmd + " ls [dir] [-a] [--format tsv|jsonl] \t list directory entries with their tags")
     print(cmd + " rmresourcetags path \t legacy alias for untagresource --all")
     print(cmd + " rmresource path \t\t untrack the resource in the db")
     print(cmd + " mvresource path newpath\t move resource to a new path")
+    print(cmd + " sanitize [--dry-run] [--format tsv|jsonl] \t untrack resources missing from disk")
+    print(cmd + " relocate [--dry-run] [--format tsv|jsonl] \t find resources moved while no daemon ran")
     print(cmd + " exportgraph [-o output.dot] \t export the HTFS graph as Graphviz DOT")
+    print(cmd + " linkbackend [rdf|sqlite] \t show or convert where tag and resource links are stored")
+    print(cmd + " prompt \t\t\t print the tags around the current directory for a shell prompt")
+    print(cmd + " serve \t\t\t keep the db loaded and serve other tagfs calls over a socket")
     return 0
 
 
-def unimplemented_feature_error(args):
-    logobj.error("unimplemented feature")
-    return 1
-
-
 def improper_usage(args):
     logobj.error("improper usage")
     print_usage(args)
@@ -353,85 +569,169 @@ COMMANDS = {
     'untagresource': _untag_resource,
     'lsresources': _get_resources_by_tag_expr,
     'getresourcetags': _get_resource_tags,
+    'ls': _list_directory,
     'rmresourcetags': _rm_resource_tags,
     'rmresource': _del_resource,
     'mvresource': _move_resource,
     'exportgraph': _export_graph,
-    'sanitize': unimplemented_feature_error,
+    'linkbackend': _link_backend,
+    'sanitize': _sanitize,
+    'relocate': _relocate,
+    'prompt': _prompt,
+    'serve': _serve,
     'help': print_usage
 }
 
 
-def create_parser():
-    parser = argparse.ArgumentParser(description='HTFS: Hierarchically Tagged File System')
+class _SkippedParser:
+    """Stands in for subcommands that are not being run; see create_parser()."""
+
+    def add_argument(self, *args, **kwargs):
+        pass
+
+
+class _HelpFormatter(argparse.HelpFormatter):
+    """
+    argparse builds a formatter for every add_argument() call, and the default
+    one imports shutil just to read the terminal width; ask os directly.
+    """
+
+    def __init__(self, prog, **kwargs):
+        if kwargs.get('width') is None:
+            try:
+                columns = int(os.environ.get('COLUMNS', '')) or os.get_terminal_size(sys.__stdout__.fileno()).columns
+            except (AttributeError, ValueError, OSError):
+                columns = 80
+            kwargs['width'] = columns - 2
+        super().__init__(prog, **kwargs)
+
+
+def create_parser(command=None):
+    """
+    Build the argument parser. With a command name, only that subcommand's
+    arguments are defined, which keeps per-invocation start-up cheap.
+    """
+    parser = argparse.ArgumentParser(description='HTFS: Hierarchically Tagged File System',
+                                     formatter_class=_HelpFormatter)
     subparsers = parser.add_subparsers(dest='command')
 
-    init_parser = subparsers.add_parser('init')
-    tags_parser = subparsers.add_parser('lstags')
+    def add_parser(name):
+        if command is None or name == command:
+            return subparsers.add_parser(name, formatter_class=_HelpFormatter)
+        return _SkippedParser()
+
+    init_parser = add_parser('init')
+    init_parser.add_argument('--links', choices=['rdf', 'sqlite'], help='store tag and resource links as RDF (default) or in SQLite tables')
+    tags_parser = add_parser('lstags')
     tags_parser.add_argument('tags', nargs='*')
 
-    getboundary_parser = subparsers.add_parser('getboundary')
+    getboundary_parser = add_parser('getboundary')
 
-    addtags_parser = subparsers.add_parser('addtags')
+    addtags_parser = add_parser('addtags')
     addtags_parser.add_argument('tags', nargs='+')
 
-    renametag_parser = subparsers.add_parser('renametag')
+    renametag_parser = add_parser('renametag')
     renametag_parser.add_argument('tag')
     renametag_parser.add_argument('newtag')
 
-    rmtag_parser = subparsers.add_parser('rmtag')
+    rmtag_parser = add_parser('rmtag')
     rmtag_parser.add_argument('tag')
 
-    linktags_parser = subparsers.add_parser('linktags')
+    linktags_parser = add_parser('linktags')
     linktags_parser.add_argument('tag')
     linktags_parser.add_argument('parenttag')
 
-    unlinktags_parser = subparsers.add_parser('unlinktags')
+    unlinktags_parser = add_parser('unlinktags')
     unlinktags_parser.add_argument('tag')
     unlinktags_parser.add_argument('parenttag')
 
-    addresource_parser = subparsers.add_parser('addresource')
-    addresource_parser.add_argument('path')
-
-    tagresource_parser = subparsers.add_parser('tagresource')
-    tagresource_parser.add_argument('path')
-    tagresource_parser.add_argument('tags', nargs='+')
-
-    untagresource_parser = subparsers.add_parser('untagresource')
+    addresource_parser = add_parser('addresource')
+    addresource_parser.add_argument('path', nargs='?')
+    addresource_parser.add_argument('--from-file', metavar='FILE', help="track every path listed in FILE, one per line ('-' for stdin)")
+    addresource_parser.add_argument('--recursive', '-r', action='store_true', help='track every file below the directory path')
+    addresource_parser.add_argument('--include', action='append', default=[], metavar='GLOB', help='with --recursive, only track files matching GLOB')
+    addresource_parser.add_argument('--exclude', action='append', default=[], metavar='GLOB', help='with --recursive, skip files and directories matching GLOB')
+    addresource_parser.add_argument('--tag', action='append', default=[], metavar='TAG', help='with --recursive, tag every newly tracked file')
+    addresource_parser.add_argument('--jobs', '-j', type=int, metavar='N', help='with --recursive, number of scanning threads')
+
+    tagresource_parser = add_parser('tagresource')
+    tagresource_parser.add_argument('path', nargs='?')
+    tagresource_parser.add_argument('tags', nargs='*')
+    tagresource_parser.add_argument('--stdin', action='store_true', help="read 'path<TAB>tag [tag ...]' lines from stdin")
+
+    untagresource_parser = add_parser('untagresource')
     untagresource_parser.add_argument('path')
     untagresource_parser.add_argument('tags', nargs='*')
     untagresource_parser.add_argument('--all', action='store_true')
 
-    lsresources_parser = subparsers.add_parser('lsresources')
+    lsresources_parser = add_parser('lsresources')
     lsresources_parser.add_argument('--count', '-c', action='store_true', help='show the count of resources, instead of the resources list')
+    lsresources_parser.add_argument('--engine', choices=['native', 'sparql'], default='native', help='query engine: set algebra (default) or SPARQL')
     lsresources_parser.add_argument('tagexpr')
 
-    getresourcetags_parser = subparsers.add_parser('getresourcetags')
-    getresourcetags_parser.add_argument('path')
+    getresourcetags_parser = add_parser('getresourcetags')
+    getresourcetags_parser.add_argument('paths', nargs='*', metavar='path')
+    getresourcetags_parser.add_argument('--stdin', action='store_true', help='also read paths from stdin, one per line')
+    getresourcetags_parser.add_argument('--format', choices=['tsv', 'jsonl'], help="print 'path<TAB>tags' lines (default for several paths) or JSON lines")
 
-    rmresourcetags_parser = subparsers.add_parser('rmresourcetags')
+    ls_parser = add_parser('ls')
+    ls_parser.add_argument('dir', nargs='?', default='.')
+    ls_parser.add_argument('--all', '-a', action='store_true', help='include entries starting with .')
+    ls_parser.add_argument('--format', choices=['tsv', 'jsonl'], default='tsv')
+
+    rmresourcetags_parser = add_parser('rmresourcetags')
     rmresourcetags_parser.add_argument('path')
 
-    rmresource_parser = subparsers.add_parser('rmresource')
+    rmresource_parser = add_parser('rmresource')
     rmresource_parser.add_argument('path')
     rmresource_parser.add_argument('makefschange', nargs='?', default='true')
 
-    mvresource_parser = subparsers.add_parser('mvresource')
+    mvresource_parser = add_parser('mvresource')
     mvresource_parser.add_argument('path')
     mvresource_parser.add_argument('newpath')
     mvresource_parser.add_argument('makefschange', nargs='?', default='true')
 
-    exportgraph_parser = subparsers.add_parser('exportgraph')
+    exportgraph_parser = add_parser('exportgraph')
     exportgraph_parser.add_argument('-o', '--output', help='write DOT output to a file')
 
-    sanitize_parser = subparsers.add_parser('sanitize')
-    help_parser = subparsers.add_parser('help')
+    linkbackend_parser = add_parser('linkbackend')
+    linkbackend_parser.add_argument('backend', nargs='?', choices=['rdf', 'sqlite'])
+
+    sanitize_parser = add_parser('sanitize')
+    sanitize_parser.add_argument('--dry-run', '-n', action='store_true', help='only report missing resources, keep them tracked')
+    sanitize_parser.add_argument('--format', choices=['tsv', 'jsonl'], default='tsv', help='print missing paths one per line or as JSON lines')
+    sanitize_parser.add_argument('--jobs', '-j', type=int, metavar='N', help='number of checking threads')
+
+    relocate_parser = add_parser('relocate')
+    relocate_parser.add_argument('--dry-run', '-n', action='store_true', help='only report where moved resources are, keep their old paths')
+    relocate_parser.add_argument('--format', choices=['tsv', 'jsonl'], default='tsv', help="print 'path<TAB>newpath' lines or JSON lines")
+    relocate_parser.add_argument('--jobs', '-j', type=int, metavar='N', help='number of threads checking for missing resources')
+
+    prompt_parser = add_parser('prompt')
+
+    serve_parser = add_parser('serve')
+
+    help_parser = add_parser('help')
 
     return parser
 
 
 def main():
-    parser = create_parser()
+    from htfs import server
+
+    logging.basicConfig(level='INFO')
+
+    # Hand the command to a running `tagfs serve` if there is one
+    forwarded = server.forward(sys.argv[1:])
+    if forwarded is not None:
+        code, out, err = forwarded
+        sys.stdout.write(out)
+        sys.stderr.write(err)
+        sys.exit(code)
+
+    # Unknown commands get the full parser so its error lists every choice
+    command = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] in COMMANDS else None
+    parser = create_parser(command)
     args = parser.parse_args(sys.argv[1:])
 
     if not args.command or args.command not in COMMANDS:
@@ -9,29 +9,12 @@ import re
 import logging
 from pathlib import Path
 
-from htfs.query_evaluator import QueryEvaluator
+from htfs.boundary import TAGFS_DB, find_tagfs_boundary, storage_generation  # noqa: F401 (re-exported)
 from htfs.tag_service import TagService
 
-_tagfsdb = ".tagfs.db"
-_tagfsttl = ".tagfs.ttl"
-
-logging.basicConfig(level='INFO')
 logobj = logging.getLogger(__name__)
 
 
-def find_tagfs_boundary(start_dir=''):
-    """
-    Find the tagfs boundary by searching for .tagfs.db upward.
-    Returns the directory path containing the tagfs database.
-    """
-    start_path = Path(start_dir or os.curdir).expanduser().resolve()
-    current = start_path if start_path.is_dir() else start_path.parent
-    for candidate in (current, *current.parents):
-        if (candidate / _tagfsdb).exists():
-            return str(candidate)
-    return None
-
-
 def is_hierarchical_tag(tag):
     """Check if tag contains hierarchical separator."""
     return '/' in tag
@@ -50,21 +33,46 @@ class HTFS:
     RDF is flushed to disk only when close() is called or at session end.
     """
 
-    def __init__(self, tagfs_boundary):
+    def __init__(self, tagfs_boundary, read_only=False):
         """
         Initialize the HTFS tagging library at the specified boundary.
+
+        With read_only=True, relationship queries run directly on the
+        memory-mapped edge snapshot and tag/link mutations are rejected.
         """
         self.tagfs_boundary = Path(tagfs_boundary).expanduser().resolve()
-        tagsdb_file_path = self.tagfs_boundary / _tagfsdb
-        self.th = TagService(str(tagsdb_file_path))
+        tagsdb_file_path = self.tagfs_boundary / TAGFS_DB
+        self.th = TagService(str(tagsdb_file_path), read_only=read_only)
 
     def close(self):
         """Close the database, flushing RDF to disk."""
         self.th.close()
 
-    def initialize(self):
-        """Initialize the database schema."""
-        self.th.initialize()
+    def initialize(self, link_backend=None):
+        """
+        Initialize the database schema. link_backend is 'rdf' (default) or
+        'sqlite' and selects where tag hierarchy and resource tags are stored.
+        """
+        return self.th.initialize(link_backend)
+
+    def get_link_backend(self):
+        """Name of the backend storing tag and resource links."""
+        return self.th.get_link_backend()
+
+    def set_link_backend(self, backend):
+        """Convert the boundary's links to another backend. Returns False if unknown."""
+        return self.th.set_link_backend(backend)
+
+    def batch(self):
+        """
+        Context manager for bulk changes: SQLite is committed and RDF flushed
+        once at the end of the block, and both are rolled back if it raises.
+
+            with htfs.batch():
+                for path in paths:
+                    htfs.add_resource(path)
+        """
+        return self.th.transaction()
 
     def normalize_url(self, resource_url):
         """Normalize a resource URL to be relative to the tagfs boundary."""
@@ -72,6 +80,25 @@ class HTFS:
         normalized_url = os.path.relpath(str(resource_path), str(self.tagfs_boundary))
         return Path(normalized_url).as_posix()
 
+    def normalize_urls(self, resource_urls):
+        """
+        Normalize many resource URLs. Each parent directory is resolved once,
+        so only symlinked entries pay for a full resolve().
+        """
+        resolved_parents = {}
+        normalized = []
+        for resource_url in resource_urls:
+            path = Path(resource_url).expanduser()
+            if path.name in ("", ".", "..") or path.is_symlink():
+                normalized.append(self.normalize_url(resource_url))
+                continue
+            parent = resolved_parents.get(path.parent)
+            if parent is None:
+                parent = resolved_parents[path.parent] = path.parent.resolve()
+            normalized_url = os.path.relpath(str(parent / path.name), str(self.tagfs_boundary))
+            normalized.append(Path(normalized_url).as_posix())
+        return normalized
+
     def full_url(self, normalized_resource_url):
         """Convert a normalized URL back to a full path."""
         return str(self.tagfs_boundary / Path(normalized_resource_url))
@@ -127,8 +154,129 @@ class HTFS:
         rid = self.th.get_resource_id(resource_url)
         if rid < 0:
             rid = self.th.add_resource(resource_url)
+            self._record_stats({resource_url: rid})
         return rid
 
+    def add_resources(self, resource_urls):
+        """Add many resources for tracking in one batch. Returns their IDs in input order."""
+        normalized_urls = self.normalize_urls(resource_urls)
+        with self.batch():
+            res_ids = self.th.add_resources(normalized_urls)
+            self._record_stats(res_ids)
+        return [res_ids[url] for url in normalized_urls]
+
+    def _record_stats(self, res_ids, recorded=None):
+        """
+        Record the inode fingerprint of each {url: resource ID} that exists, for relocate().
+        recorded maps resource IDs to their stored fingerprints; unchanged ones are not rewritten.
+        """
+        from htfs.scanner import stat_fingerprint
+
+        root = str(self.tagfs_boundary)
+        recorded = recorded or {}
+        stats = {}
+        for url, rid in res_ids.items():
+            try:
+                fingerprint = stat_fingerprint(os.lstat(os.path.join(root, url)))
+            except OSError:
+                continue
+            if recorded.get(rid) != fingerprint:
+                stats[rid] = fingerprint
+        if stats:
+            self.th.set_resource_stats(stats)
+
+    def refresh_stats(self, resource_urls):
+        """
+        Re-record the inode fingerprints of tracked, normalized URLs whose
+        files were created, edited or moved since they were recorded.
+        """
+        res_ids = self.th.get_resource_ids_by_url(resource_urls)
+        self._record_stats(res_ids, self.th.get_resource_stats(res_ids.values()))
+
+    def add_tree(self, directory, include=(), exclude=(), tags=None, workers=None):
+        """
+        Track every file below a directory in one batch, optionally tagging them.
+
+        The tree is scanned in parallel (see htfs.scanner); include/exclude
+        globs and `.tagfsignore` files at the boundary and in the directory
+        are honoured. Already-tracked files are skipped.
+        Returns the full paths of the newly tracked files, or None if the
+        directory is not inside the tagfs boundary.
+        """
+        from htfs.scanner import IGNORE_FILE, scan_tree
+
+        root = Path(directory).expanduser().resolve()
+        if root != self.tagfs_boundary and self.tagfs_boundary not in root.parents:
+            logobj.error("directory is outside the tagfs boundary: %s", directory)
+            return None
+
+        ignore_files = [str(self.tagfs_boundary / IGNORE_FILE)] if root != self.tagfs_boundary else []
+        paths = scan_tree(root, include, exclude, ignore_files, workers)
+        base = os.path.relpath(str(root), str(self.tagfs_boundary))
+        prefix = "" if base == "." else Path(base).as_posix() + "/"
+        urls = [prefix + Path(os.path.relpath(path, str(root))).as_posix() for path in paths]
+
+        tracked = set(self.th.get_resource_urls_under(base))
+        new_urls = [url for url in urls if url not in tracked]
+        with self.batch():
+            self._record_stats(self.th.add_resources(new_urls))
+            if tags:
+                self.th.tag_resources((url, tags) for url in new_urls)
+        return [self.full_url(url) for url in new_urls]
+
+    def sanitize(self, dry_run=False, workers=None):
+        """
+        Find tracked resources that no longer exist and, unless dry_run,
+        untrack them all in one batch. Every directory holding tracked
+        resources is checked once, in parallel (see htfs.scanner).
+        Returns (number of resources checked, full paths of the missing ones).
+        """
+        from htfs.scanner import find_missing
+
+        urls = self.th.get_resource_urls_under(".")
+        missing = find_missing(str(self.tagfs_boundary), urls, workers)
+        if missing and not dry_run:
+            with self.batch():
+                for url in missing:
+                    self.th.del_resource(url)
+        return len(urls), [self.full_url(url) for url in missing]
+
+    def relocate(self, dry_run=False, workers=None):
+        """
+        Find tracked resources that were moved while no daemon was watching
+        and, unless dry_run, point them at their new paths in one batch.
+
+        Missing resources are matched by the device and inode recorded for
+        them, in a single streaming walk of the boundary. The fingerprints of
+        present resources are refreshed on every pass (recorded for the first
+        time if they were tracked before fingerprints existed), so later moves
+        are told apart from reused inodes.
+        Returns [(old full path, new full path)].
+        """
+        from htfs.scanner import find_missing, find_moved
+
+        root = str(self.tagfs_boundary)
+        urls = self.th.get_resource_urls_under(".")
+        missing = find_missing(root, urls, workers)
+        moved = {}
+        if missing:
+            res_ids = self.th.get_resource_ids_by_url(missing)
+            stats = self.th.get_resource_stats(res_ids.values())
+            fingerprints = {url: stats[rid] for url, rid in res_ids.items() if rid in stats}
+            if fingerprints:
+                moved = find_moved(root, fingerprints)
+            # Never move onto a path that is tracked already
+            taken = self.th.get_resource_ids_by_url(moved.values())
+            moved = {url: new_url for url, new_url in moved.items() if new_url not in taken}
+
+        if not dry_run:
+            missing = set(missing)
+            with self.batch():
+                for url, new_url in moved.items():
+                    self.th.update_resource_url(url, new_url)
+                self.refresh_stats([url for url in urls if url not in missing] + list(moved.values()))
+        return [(self.full_url(url), self.full_url(new_url)) for url, new_url in sorted(moved.items())]
+
     def is_resource_tracked(self, resource_url):
         """Check if a resource is tracked."""
         resource_url = self.normalize_url(resource_url)
@@ -145,16 +293,34 @@ class HTFS:
         resource_url = self.normalize_url(resource_url)
         return self.th.add_resource_tags(resource_url, tags)
 
+    def tag_resources(self, resource_tags):
+        """
+        Assign tags to many resources in one batch from (resource_url, tags) pairs.
+        Returns {resource_url: unsuccessful tags} for resources with failures,
+        keyed by the URLs as given; untracked resources fail all their tags.
+        """
+        resource_tags = list(resource_tags)
+        normalized_urls = self.normalize_urls(url for url, _ in resource_tags)
+        original_urls = dict(zip(normalized_urls, (url for url, _ in resource_tags)))
+        with self.batch():
+            unsuccessful = self.th.tag_resources(
+                (url, tags) for url, (_, tags) in zip(normalized_urls, resource_tags)
+            )
+        return {original_urls[url]: tags for url, tags in unsuccessful.items()}
+
     def untag_resource(self, resource_url, tags):
         """Remove tags from a resource."""
         resource_url = self.normalize_url(resource_url)
         return self.th.del_resource_tags(resource_url, tags)
 
     def move_resource(self, resource_url, target_url):
-        """Move a resource to a new path."""
+        """
+        Move a resource to a new path. For a directory every tracked resource
+        below it moves too. Returns False if nothing could be moved.
+        """
         resource_url = self.normalize_url(resource_url)
         target_url = self.normalize_url(target_url)
-        self.th.update_resource_url(resource_url, target_url)
+        return self.th.move_resource(resource_url, target_url)
 
     def get_resources_by_tag(self, tags):
         """Get resources matching given tags (AND semantics)."""
@@ -162,9 +328,15 @@ class HTFS:
         resource_urls = self.th.get_resources_by_tag(tags_closure)
         return [self.full_url(url) for url in resource_urls]
 
-    def get_resources_by_tag_expr(self, tagsexpr, count=False):
-        """Get resources matching a tag expression (e.g., '(proj1|proj2)&research')."""
-        qe = QueryEvaluator(self.th)
+    def get_resources_by_tag_expr(self, tagsexpr, count=False, engine=None):
+        """
+        Get resources matching a tag expression (e.g., '(proj1|proj2)&research').
+        engine is 'native' (set algebra, default) or 'sparql'.
+        """
+        # Only query commands pay for loading the query engine
+        from htfs.query_evaluator import QueryEvaluator, DEFAULT_ENGINE
+
+        qe = QueryEvaluator(self.th, engine=engine or DEFAULT_ENGINE)
         if count:
             return qe.evaluate(tagsexpr, count=True)
         resource_urls = qe.evaluate(tagsexpr)
@@ -179,6 +351,17 @@ class HTFS:
         resource_url = self.normalize_url(resource_url)
         return self.th.get_resource_tags(resource_url)
 
+    def get_resources_tags(self, resource_urls):
+        """
+        Get the tags of many resources at once.
+        Returns {resource_url: [tags]} keyed by the URLs as given, with None
+        for resources that are not tracked.
+        """
+        resource_urls = list(resource_urls)
+        normalized_urls = self.normalize_urls(resource_urls)
+        tags = self.th.get_resources_tags(normalized_urls)
+        return {url: tags.get(normalized) for url, normalized in zip(resource_urls, normalized_urls)}
+
     def export_graphviz_dot(self):
         """Export the HTFS graph as Graphviz DOT."""
         return self.th.export_graphviz_dot()
@@ -5,21 +5,47 @@ Architecture:
   SQLite (.tagfs.db):  tag name↔id, resource url↔id  (O(1) lookups, fast)
   RDF    (.tagfs.ttl): tag hierarchy (skos:broader), resource-tag links (htfs:hasTag)
 
+The relationships go through a link backend (see link_backend): RDF by
+default, or TAGLINKS/RESOURCELINKS tables inside .tagfs.db when the boundary
+is switched to the "sqlite" backend with set_link_backend().
+
 Key behaviors:
   - RDF is loaded lazily (only when needed)
   - RDF is serialized only on close() or flush()
   - SQLite commits immediately (for data integrity)
   - Tag/Resource operations use SQLite; links use RDF
+  - The transitive closure of the tag hierarchy is materialized in SQLite
+    (TAGCLOSURE) and maintained incrementally alongside RDF link changes.
+    Because RDF is written separately from SQLite, the table is stamped with
+    the RDF generation it matches and rebuilt when another process (or a
+    crash) leaves the two apart
 """
 
 import os
 import logging
 from pathlib import Path
-from htfs.sqlite_handler import SQLiteManager, TagRepository as SQLTagRepo, ResourceRepository as SQLResRepo
-from htfs.rdf_handler import RDFHandler
+from contextlib import contextmanager
+from htfs.sqlite_handler import (
+    SQLiteManager,
+    TagRepository as SQLTagRepo,
+    ResourceRepository as SQLResRepo,
+    TagClosureRepository,
+    SettingsRepository,
+    ResourceStatRepository,
+)
+from htfs.link_backend import (
+    DEFAULT_LINK_BACKEND,
+    LINK_BACKEND_SETTING,
+    LINK_BACKENDS,
+    SQLITE_BACKEND,
+    copy_links,
+)
 
 logobj = logging.getLogger(__name__)
 
+# SETTINGS row holding the link generation TAGCLOSURE was last brought up to
+CLOSURE_GENERATION_SETTING = "TAGCLOSURE_GENERATION"
+
 
 class DatabaseManager:
     """
@@ -41,7 +67,7 @@ class DatabaseManager:
         db.close()  # RDF is serialized here
     """
 
-    def __init__(self, tagfs_boundary):
+    def __init__(self, tagfs_boundary, read_only=False):
         self.tagfs_boundary = Path(tagfs_boundary).expanduser().resolve()
         self.db_path = str(self.tagfs_boundary / ".tagfs.db")
         self.ttl_path = str(self.tagfs_boundary / ".tagfs.ttl")
@@ -49,30 +75,135 @@ class DatabaseManager:
         self.sqlite = SQLiteManager(self.db_path)
         self.tag_repo = SQLTagRepo(self.sqlite)
         self.res_repo = SQLResRepo(self.sqlite)
-        self.rdf = RDFHandler(self.ttl_path)
+        self.closure_repo = TagClosureRepository(self.sqlite)
+        self.settings = SettingsRepository(self.sqlite)
+        self.stat_repo = ResourceStatRepository(self.sqlite)
+        self.read_only = read_only
+        # Opened on first use, once the boundary's backend setting can be read
+        self._links = None
 
         self._dirty = False
+        # Unchecked (None), in step with the links (True), or stale and left
+        # alone by a read-only session (False)
+        self._closure_ready = None
+        self._closure_changed = False
+        self._in_transaction = False
 
-    def initialize(self):
-        """Initialize SQLite schema. RDF is created on first close if needed."""
+    def initialize(self, link_backend=None):
+        """
+        Initialize SQLite schema. RDF is created on first close if needed.
+        link_backend selects where relationships are stored (default: RDF).
+        """
         self.sqlite.initialize_schema()
         logobj.info("SQLite schema initialized at %s", self.db_path)
+        if link_backend is not None:
+            return self.set_link_backend(link_backend)
+        return True
+
+    @property
+    def links(self):
+        """The boundary's link backend (an RDFHandler or SQLiteLinkHandler)."""
+        if self._links is None:
+            self._links = self._open_links(self.get_link_backend())
+        return self._links
+
+    @property
+    def rdf(self):
+        """Former name of `links`, kept for existing callers."""
+        return self.links
+
+    def _open_links(self, backend):
+        # Imported here: commands that only look up IDs never load a backend
+        if backend == SQLITE_BACKEND:
+            from htfs.sqlite_links import SQLiteLinkHandler
+            links = SQLiteLinkHandler(self.sqlite, read_only=self.read_only)
+        else:
+            from htfs.rdf_handler import RDFHandler
+            # Read-only sessions map the relationship snapshot instead of copying it
+            links = RDFHandler(self.ttl_path, read_only=self.read_only)
+        links.on_save = self._links_saved
+        return links
+
+    def get_link_backend(self):
+        """Name of the backend holding this boundary's relationships."""
+        self.sqlite.connect()
+        return self.settings.get(LINK_BACKEND_SETTING, DEFAULT_LINK_BACKEND)
+
+    def set_link_backend(self, backend):
+        """
+        Move every relationship to another backend and make it the boundary's
+        backend. The new copy is complete before the setting changes, and the
+        old store is emptied only afterwards, so an interruption never loses
+        links. Returns False for an unknown backend name.
+        """
+        if backend not in LINK_BACKENDS:
+            logobj.error("unknown link backend: %s", backend)
+            return False
+        if self.read_only:
+            raise RuntimeError("cannot change the link backend of a read-only session")
+        if backend == self.get_link_backend():
+            return True
+        self.flush()
+        source, target = self.links, self._open_links(backend)
+        with self.sqlite.transaction():
+            n_tag_links, n_resource_links = copy_links(source, target)
+            self.settings.set(LINK_BACKEND_SETTING, backend)
+        if n_tag_links or n_resource_links:
+            source.replace_all([], [])
+        source.close()
+        self._links = target
+        logobj.info("moved %d tag links and %d resource links to the %s backend",
+                    n_tag_links, n_resource_links, backend)
+        return True
 
     def connect(self):
-        """Connect to SQLite. RDF is lazy-loaded."""
+        """
+        Connect to SQLite. RDF is lazy-loaded by the first RDFHandler call
+        that needs relationships, so name/URL-only commands never parse it.
+        """
         self.sqlite.connect()
-        self.rdf.connect()  # Ensure RDF is connected too
         return self
 
     def close(self):
         """Close SQLite and serialize RDF if dirty."""
+        if self._links is not None:
+            self._links.close()
         self.sqlite.close()
-        self.rdf.close()
         # logobj.info("Database closed. RDF saved if modified.")
 
     def flush(self):
-        """Force-save RDF to disk."""
-        self.rdf.flush()
+        """Force-save RDF to disk. Inside transaction() this waits for the block to end."""
+        if not self._in_transaction and self._links is not None:
+            self._links.flush()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group many changes into one unit of work.
+
+        SQLite commits and the RDF journal flush happen once, when the block
+        exits. If the block raises, SQLite is rolled back and every in-memory
+        relationship change made inside it is undone. Nested blocks join the
+        outermost one.
+        """
+        if self._in_transaction:
+            yield self
+            return
+        self._in_transaction = True
+        savepoint = self.links.savepoint()
+        closure_changed = self._closure_changed
+        try:
+            with self.sqlite.transaction():
+                yield self
+        except BaseException:
+            self.links.rollback(savepoint)
+            # Closure rows and stamps written inside the block were rolled back too
+            self._closure_ready = None
+            self._closure_changed = closure_changed
+            raise
+        finally:
+            self._in_transaction = False
+        self.links.flush()
 
     def __enter__(self):
         self.connect()
@@ -101,6 +232,12 @@ class DatabaseManager:
         """Get tag name by ID. O(1) lookup via SQLite."""
         return self.tag_repo.get_tag_name(tag_id)
 
+    def get_tag_names(self, tag_ids):
+        """Get tag names for many IDs at once, in input order, skipping unknown IDs."""
+        tag_ids = list(tag_ids)
+        names = self.tag_repo.get_tag_names(tag_ids)
+        return [names[tid] for tid in tag_ids if names.get(tid)]
+
     def get_tag_list(self):
         """Get all tag names."""
         return self.tag_repo.get_tag_list()
@@ -115,8 +252,12 @@ class DatabaseManager:
         if tag_id < 0:
             return False
 
-        self.rdf.remove_all_links_for_tag(tag_id)
+        closure = self._mutable_closure()
+        descendants = closure.get_descendant_ids([tag_id])
+        self.links.remove_all_links_for_tag(tag_id)
         self._dirty = True
+        closure.delete_tag(tag_id)
+        self._refresh_tag_closure(descendants)
         return self.tag_repo.delete_tag(tag_id)
 
     # -------------------------------------------------------------------------
@@ -125,25 +266,131 @@ class DatabaseManager:
 
     def add_tag_link(self, tag_id, parent_tag_id):
         """Create a parent-child link between tags."""
-        self.rdf.add_tag_link(tag_id, parent_tag_id)
+        closure = self._mutable_closure()
+        self.links.add_tag_link(tag_id, parent_tag_id)
         self._dirty = True
+        closure.add_link(tag_id, parent_tag_id)
 
     def remove_tag_link(self, tag_id, parent_tag_id):
         """Remove a parent-child link between tags."""
-        self.rdf.remove_tag_link(tag_id, parent_tag_id)
+        closure = self._mutable_closure()
+        affected = closure.get_descendant_ids([tag_id]) | {tag_id}
+        self.links.remove_tag_link(tag_id, parent_tag_id)
         self._dirty = True
+        # Other paths may still connect these tags to the old ancestors
+        self._refresh_tag_closure(affected)
 
     def get_parent_tag_ids(self, tag_id):
         """Get immediate parent tag IDs."""
-        return self.rdf.get_parent_tag_ids(tag_id)
+        return self.links.get_parent_tag_ids(tag_id)
 
     def get_child_tag_ids(self, tag_id):
         """Get immediate child tag IDs."""
-        return self.rdf.get_child_tag_ids(tag_id)
+        return self.links.get_child_tag_ids(tag_id)
 
     def get_tag_closure_ids(self, tag_ids):
         """Get transitive closure: given tag IDs, return all descendant IDs."""
-        return self.rdf.get_tag_closure_ids(tag_ids)
+        closure = self._closure()
+        if closure is None:
+            return self.links.get_tag_closure_ids(tag_ids)
+        return set(tag_ids) | closure.get_descendant_ids(tag_ids)
+
+    # -------------------------------------------------------------------------
+    # Materialized Tag Closure (SQLite)
+    # -------------------------------------------------------------------------
+
+    def _closure(self):
+        """
+        Return the closure repository, or None when closure queries must be
+        answered from the links. On first use the table is compared with the
+        links' generation and rebuilt if it is missing or stale; read-only
+        sessions never write it and fall back to the links instead.
+        """
+        if self._closure_ready is None:
+            if self._closure_is_current():
+                self._closure_ready = True
+            elif self.read_only:
+                logobj.info("tag closure is out of date; reading the hierarchy instead")
+                self._closure_ready = False
+            else:
+                self.rebuild_tag_closure()
+        return self.closure_repo if self._closure_ready else None
+
+    def _closure_is_current(self):
+        """True if TAGCLOSURE exists and was last brought up to the links' generation."""
+        if not self.closure_repo.exists():
+            return False
+        generation = self.links.generation()
+        return generation is None or self.settings.get(CLOSURE_GENERATION_SETTING) == generation
+
+    def _mutable_closure(self):
+        """
+        Return the closure repository for a hierarchy change. Until the links
+        are saved the table is ahead of them on disk, so its stamp is cleared
+        first: a crash before the save then leaves it marked stale.
+        """
+        if self.read_only:
+            raise RuntimeError("cannot change the tag hierarchy of a read-only session")
+        closure = self._closure()
+        if not self._closure_changed and self.links.generation() is not None:
+            self.settings.set(CLOSURE_GENERATION_SETTING, "")
+            self._closure_changed = True
+        return closure
+
+    def _links_saved(self, before, after):
+        """
+        Called by the link backend, with other writers held off, once it has
+        written relationships to disk. Stamps the closure table with the new
+        generation, rebuilding it first unless it matched the old one.
+        """
+        if self.settings.get(CLOSURE_GENERATION_SETTING) != before or not self.closure_repo.exists():
+            self._rebuild_closure_table()
+        self.settings.set(CLOSURE_GENERATION_SETTING, after)
+        self._closure_changed = False
+
+    def _live_tag_closure_pairs(self):
+        """All (ancestor, descendant) pairs derived from the RDF hierarchy."""
+        pairs = set()
+        for parent_id in {parent_id for _, parent_id in self.links.get_all_tag_links()}:
+            for descendant_id in self.links.get_tag_closure_ids([parent_id]):
+                if descendant_id != parent_id:
+                    pairs.add((parent_id, descendant_id))
+        return pairs
+
+    def _refresh_tag_closure(self, tag_ids):
+        """Recompute the ancestor rows of the given tags from the RDF hierarchy."""
+        self.closure_repo.set_ancestors({
+            tag_id: self.links.get_tag_ancestor_ids([tag_id]) - {tag_id}
+            for tag_id in tag_ids
+        })
+
+    def _rebuild_closure_table(self):
+        if not self.closure_repo.exists():
+            self.closure_repo.create_table()
+        pairs = self._live_tag_closure_pairs()
+        self.closure_repo.replace_all(pairs)
+        logobj.info("tag closure rebuilt: %d pairs", len(pairs))
+        return len(pairs)
+
+    def rebuild_tag_closure(self):
+        """Rebuild the whole closure table from the RDF hierarchy and stamp it."""
+        with self.links.synchronized():
+            n_pairs = self._rebuild_closure_table()
+            generation = self.links.generation()
+            if generation is not None:
+                self.settings.set(CLOSURE_GENERATION_SETTING, generation)
+        self._closure_ready = True
+        return n_pairs
+
+    def check_tag_closure(self):
+        """
+        Compare the closure table with the RDF hierarchy.
+        Returns (missing, extra): sorted (ancestor, descendant) pairs absent
+        from, or wrongly present in, the table.
+        """
+        expected = self._live_tag_closure_pairs()
+        stored = self.closure_repo.get_all_pairs() if self.closure_repo.exists() else set()
+        return sorted(expected - stored), sorted(stored - expected)
 
     def _resolve_tag_spec(self, tag_spec, create_missing_flat=False):
         """
@@ -187,14 +434,40 @@ class DatabaseManager:
             return -1
         return self.res_repo.add_resource(resource_url)
 
+    def add_resources(self, resource_urls):
+        """
+        Track many resources at once. New resources get a contiguous block of
+        IDs and are inserted with a single executemany.
+        Returns {url: resource_id} for every given URL, new or already tracked.
+        """
+        resource_urls = list(dict.fromkeys(resource_urls))
+        res_ids = self.res_repo.get_resource_ids_by_url(resource_urls)
+        new_urls = [url for url in resource_urls if url not in res_ids]
+        res_ids.update(self.res_repo.add_resources(new_urls))
+        return res_ids
+
     def get_resource_id(self, resource_url):
         """Get resource ID by URL. O(1) lookup via SQLite."""
         return self.res_repo.get_resource_id(resource_url)
 
+    def get_resource_ids_by_url(self, resource_urls):
+        """Get {url: resource_id} for the tracked URLs among resource_urls."""
+        return self.res_repo.get_resource_ids_by_url(resource_urls)
+
     def get_resource_url(self, resource_id):
         """Get resource URL by ID."""
         return self.res_repo.get_resource_url(resource_id)
 
+    def get_resource_urls(self, resource_ids):
+        """Get resource URLs for many IDs at once, in input order, skipping unknown IDs."""
+        resource_ids = list(resource_ids)
+        urls = self.res_repo.get_resource_urls(resource_ids)
+        return [urls[rid] for rid in resource_ids if urls.get(rid)]
+
+    def get_resource_urls_under(self, directory):
+        """Get the URLs of all resources below a normalized directory."""
+        return self.res_repo.get_resource_urls_under(directory)
+
     def get_resource_ids(self):
         """Get all resource IDs."""
         return self.res_repo.get_resource_ids()
@@ -205,41 +478,64 @@ class DatabaseManager:
         if res_id < 0:
             return False
         # Remove tag links from RDF
-        self.rdf.remove_all_tags_for_resource(res_id)
+        self.links.remove_all_tags_for_resource(res_id)
         self._dirty = True
         # Remove from SQLite
         self.res_repo.delete_resource(resource_url)
+        self.stat_repo.delete_stats(res_id)
         return True
 
     def update_resource_url(self, old_url, new_url):
         """Update a resource's URL."""
         return self.res_repo.update_resource_url(old_url, new_url)
 
+    def update_resource_url_prefix(self, old_directory, new_directory):
+        """Move every resource below a directory in one statement. Returns the count, or -1."""
+        return self.res_repo.update_resource_url_prefix(old_directory, new_directory)
+
+    def set_resource_stats(self, stats):
+        """Record {resource_id: (dev, ino, size, mtime_ns)} for offline move detection."""
+        self.stat_repo.set_stats(stats)
+
+    def get_resource_stats(self, resource_ids):
+        """Recorded (dev, ino, size, mtime_ns) by resource ID."""
+        return self.stat_repo.get_stats(resource_ids)
+
     # -------------------------------------------------------------------------
     # Resource-Tag Link Operations (RDF)
     # -------------------------------------------------------------------------
 
     def add_resource_tag_link(self, resource_id, tag_id):
         """Link a resource to a tag."""
-        self.rdf.add_resource_tag_link(resource_id, tag_id)
+        self.links.add_resource_tag_link(resource_id, tag_id)
         self._dirty = True
 
     def remove_resource_tag_link(self, resource_id, tag_id):
         """Remove a resource-tag link."""
-        self.rdf.remove_resource_tag_link(resource_id, tag_id)
+        self.links.remove_resource_tag_link(resource_id, tag_id)
         self._dirty = True
 
     def get_resource_tag_ids(self, resource_id):
         """Get all tag IDs linked to a resource."""
-        return self.rdf.get_resource_tag_ids(resource_id)
+        return self.links.get_resource_tag_ids(resource_id)
 
-    def get_resources_by_tag_ids(self, tag_ids):
-        """Get all resource IDs that have any of the given tags."""
-        return self.rdf.get_resources_by_tag_ids(tag_ids)
+    def get_resources_by_tag_ids(self, tag_ids, closed=False):
+        """Get all resource IDs that have any of the given tags (or their descendants)."""
+        return self.links.get_resources_by_tag_ids(tag_ids, closed=closed)
 
     def get_all_resource_tag_links(self):
         """Get all resource-tag links."""
-        return self.rdf.get_all_resource_tag_links()
+        return self.links.get_all_resource_tag_links()
+
+    def get_resource_bitmap(self, tag_ids):
+        """Bitmap of resource IDs linked to any of the given tags (no closure applied)."""
+        return self.links.get_resource_bitmap(tag_ids)
+
+    def get_all_resources_bitmap(self):
+        """Bitmap of every tracked resource ID."""
+        from htfs.bitmap_index import Bitmap
+
+        return Bitmap.from_ids(self.get_resource_ids())
 
     def export_graphviz_dot(self):
         """
@@ -263,8 +559,8 @@ class DatabaseManager:
 
         tag_ids = self.tag_repo.get_tag_ids()
         resource_ids = self.res_repo.get_resource_ids()
-        tag_links = self.rdf.get_all_tag_links()
-        resource_links = self.rdf.get_all_resource_tag_links()
+        tag_links = self.links.get_all_tag_links()
+        resource_links = self.links.get_all_resource_tag_links()
 
         lines = [
             "digraph htfs {",
@@ -273,8 +569,11 @@ class DatabaseManager:
             '  edge [fontname="Helvetica"];',
         ]
 
+        tag_names = self.tag_repo.get_tag_names(tag_ids)
+        resource_urls = self.res_repo.get_resource_urls(resource_ids)
+
         for tag_id in tag_ids:
-            tag_name = self.get_tag_name(tag_id)
+            tag_name = tag_names.get(tag_id)
             if not tag_name:
                 continue
             lines.append(
@@ -282,7 +581,7 @@ class DatabaseManager:
             )
 
         for resource_id in resource_ids:
-            resource_url = self.get_resource_url(resource_id)
+            resource_url = resource_urls.get(resource_id)
             if not resource_url:
                 continue
             lines.append(
@@ -339,13 +638,54 @@ class DatabaseManager:
 
         return unsuccessful
 
+    def get_resources_tags(self, resource_urls):
+        """
+        Get tag names for many resources with one bulk URL lookup and one bulk
+        name lookup. Returns {url: [tag names]} for the tracked URLs only.
+        """
+        res_ids = self.res_repo.get_resource_ids_by_url(resource_urls)
+        tag_ids = {url: self.get_resource_tag_ids(res_id) for url, res_id in res_ids.items()}
+        names = self.tag_repo.get_tag_names({tid for tids in tag_ids.values() for tid in tids})
+        return {url: [names[tid] for tid in tids if names.get(tid)] for url, tids in tag_ids.items()}
+
+    def tag_resources(self, resource_tags):
+        """
+        Add tags to many resources from (resource_url, tag_names) pairs.
+        Each distinct tag spec is resolved once (creating missing flat tags)
+        and all links are added in one pass.
+        Returns {resource_url: unsuccessful tag names} for resources with failures.
+        """
+        resource_tags = [(url, list(tags)) for url, tags in resource_tags]
+        res_ids = self.res_repo.get_resource_ids_by_url(url for url, _ in resource_tags)
+        tag_ids = {}
+        unsuccessful = {}
+        links = []
+        for resource_url, tag_names in resource_tags:
+            res_id = res_ids.get(resource_url)
+            if res_id is None:
+                logobj.error("resource not tracked: %s", resource_url)
+                unsuccessful.setdefault(resource_url, []).extend(tag_names)
+                continue
+            for tag_name in tag_names:
+                if tag_name not in tag_ids:
+                    tag_ids[tag_name] = self._resolve_tag_spec(tag_name, create_missing_flat=True)
+                tag_id = tag_ids[tag_name]
+                if tag_id < 0:
+                    logobj.error("invalid tag specification for tagging resources: %s", tag_name)
+                    unsuccessful.setdefault(resource_url, []).append(tag_name)
+                    continue
+                links.append((res_id, tag_id))
+
+        self.links.add_resource_tag_links(links)
+        self._dirty = True
+        return unsuccessful
+
     def get_resource_tags(self, resource_url):
         """Get all tag names for a resource."""
         res_id = self.get_resource_id(resource_url)
         if res_id < 0:
             return []
-        tag_ids = self.get_resource_tag_ids(res_id)
-        return [self.get_tag_name(tid) for tid in tag_ids if self.get_tag_name(tid)]
+        return self.get_tag_names(self.get_resource_tag_ids(res_id))
 
     def del_resource_tags(self, resource_url, tag_names):
         """
@@ -400,9 +740,9 @@ class DatabaseManager:
         all_tag_ids = self.get_tag_closure_ids(tag_ids)
 
         # Get resources that have ANY of these tags (OR semantics, with transitive closure)
-        resource_ids = set(self.get_resources_by_tag_ids(list(all_tag_ids)))
+        resource_ids = self.get_resources_by_tag_ids(all_tag_ids, closed=True)
 
-        return [self.get_resource_url(rid) for rid in resource_ids if self.get_resource_url(rid)]
+        return self.get_resource_urls(resource_ids)
 
     def link_tag_to_parent(self, tag_name, parent_tag_name):
         """
@@ -0,0 +1,328 @@
+"""
+edge_store - Compact integer storage for HTFS relationships.
+
+Each relationship (skos:broader child→parent, htfs:hasTag resource→tag) is an
+EdgeIndex: an immutable base of sorted int32 columns plus a small in-memory
+delta of pairs added/removed since the base was written. The base is stored
+on disk as a binary snapshot (``.tagfs.ttl.snap``):
+
+    header:  magic, version, broader count, hasTag count, crc32 of payload
+    payload: for each relation, four int32 columns of equal length
+             (src, dst) sorted by (src, dst), then (dst, src) sorted by (dst, src)
+
+Loading a snapshot is a handful of array reads; no RDF parsing is involved.
+Read-only sessions can instead map the file (map_snapshot) and run lookups on
+memoryviews over the page cache, so concurrent processes share one copy.
+"""
+
+import os
+import sys
+import mmap
+import zlib
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+
+SNAPSHOT_MAGIC = b"HTFSEDG1"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<8sIIII")
+SNAPSHOT_HEADER_SIZE = _HEADER.size
+
+_TURTLE_PREFIXES = (
+    "@prefix htfs: <http://htfs.example.org/ontology#> .\n"
+    "@prefix skos: <http://www.w3.org/2004/02/skos/core#> .\n\n"
+)
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, truncated or corrupt."""
+
+
+def _int_column(values=()):
+    column = array("i", values)
+    if column.itemsize != 4:
+        raise SnapshotError("int32 arrays are not available on this platform")
+    return column
+
+
+class EdgeIndex:
+    """
+    Set of (src, dst) integer pairs with fast lookups in both directions.
+
+    The base columns are never modified in place; changes live in the delta
+    until compacted() produces a new base.
+    """
+
+    def __init__(self, fwd_src=None, fwd_dst=None, rev_dst=None, rev_src=None):
+        self.fwd_src = fwd_src if fwd_src is not None else _int_column()
+        self.fwd_dst = fwd_dst if fwd_dst is not None else _int_column()
+        self.rev_dst = rev_dst if rev_dst is not None else _int_column()
+        self.rev_src = rev_src if rev_src is not None else _int_column()
+        self._added_fwd = {}
+        self._added_rev = {}
+        self._removed = set()
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Build a base index from an iterable of (src, dst) pairs."""
+        fwd = sorted(set(pairs))
+        rev = sorted((dst, src) for src, dst in fwd)
+        return cls(
+            _int_column(src for src, _ in fwd),
+            _int_column(dst for _, dst in fwd),
+            _int_column(dst for dst, _ in rev),
+            _int_column(src for _, src in rev),
+        )
+
+    # -------------------------------------------------------------------------
+    # Base lookups
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _range(keys, key):
+        return bisect_left(keys, key), bisect_right(keys, key)
+
+    def _in_base(self, src, dst):
+        lo, hi = self._range(self.fwd_src, src)
+        i = bisect_left(self.fwd_dst, dst, lo, hi)
+        return i < hi and self.fwd_dst[i] == dst
+
+    # -------------------------------------------------------------------------
+    # Set interface
+    # -------------------------------------------------------------------------
+
+    def __contains__(self, pair):
+        src, dst = pair
+        if dst in self._added_fwd.get(src, ()):
+            return True
+        return pair not in self._removed and self._in_base(src, dst)
+
+    def __len__(self):
+        added = sum(len(dsts) for dsts in self._added_fwd.values())
+        return len(self.fwd_src) + added - len(self._removed)
+
+    def add(self, src, dst) -> bool:
+        """Add a pair. Returns True if the index changed."""
+        if (src, dst) in self._removed:
+            self._removed.discard((src, dst))
+            return True
+        if (src, dst) in self:
+            return False
+        self._added_fwd.setdefault(src, set()).add(dst)
+        self._added_rev.setdefault(dst, set()).add(src)
+        return True
+
+    def remove(self, src, dst) -> bool:
+        """Remove a pair. Returns True if the index changed."""
+        added = self._added_fwd.get(src)
+        if added and dst in added:
+            added.discard(dst)
+            self._added_rev[dst].discard(src)
+            return True
+        if (src, dst) not in self._removed and self._in_base(src, dst):
+            self._removed.add((src, dst))
+            return True
+        return False
+
+    def targets(self, src) -> list:
+        """All dst values paired with src."""
+        lo, hi = self._range(self.fwd_src, src)
+        result = [dst for dst in self.fwd_dst[lo:hi] if (src, dst) not in self._removed]
+        result.extend(self._added_fwd.get(src, ()))
+        return result
+
+    def sources(self, dst) -> list:
+        """All src values paired with dst."""
+        lo, hi = self._range(self.rev_dst, dst)
+        result = [src for src in self.rev_src[lo:hi] if (src, dst) not in self._removed]
+        result.extend(self._added_rev.get(dst, ()))
+        return result
+
+    def pairs(self):
+        """Iterate over all (src, dst) pairs."""
+        removed = self._removed
+        for src, dst in zip(self.fwd_src, self.fwd_dst):
+            if (src, dst) not in removed:
+                yield src, dst
+        for src, dsts in self._added_fwd.items():
+            for dst in dsts:
+                yield src, dst
+
+    def has_changes(self) -> bool:
+        return bool(self._removed) or any(self._added_fwd.values())
+
+    def compacted(self):
+        """Return a new index whose base holds every pair and whose delta is empty."""
+        if not self.has_changes():
+            return self
+        return EdgeIndex.from_pairs(self.pairs())
+
+
+# -----------------------------------------------------------------------------
+# Snapshot files
+# -----------------------------------------------------------------------------
+
+def _columns(index):
+    return (index.fwd_src, index.fwd_dst, index.rev_dst, index.rev_src)
+
+
+def write_snapshot(path, broader, has_tag):
+    """Write the base columns of both relations to a snapshot file atomically."""
+    broader = broader.compacted()
+    has_tag = has_tag.compacted()
+    chunks = []
+    for index in (broader, has_tag):
+        for column in _columns(index):
+            if sys.byteorder != "little":
+                column = array("i", column)
+                column.byteswap()
+            chunks.append(column.tobytes())
+    crc = 0
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(broader.fwd_src), len(has_tag.fwd_src), crc)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(header)
+        for chunk in chunks:
+            fp.write(chunk)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+    return broader, has_tag
+
+
+def snapshot_header(path):
+    """Return the raw header bytes of a snapshot, which identify its contents."""
+    try:
+        with open(path, "rb") as fp:
+            header = fp.read(_HEADER.size)
+    except OSError as e:
+        raise SnapshotError(str(e)) from e
+    if len(header) != _HEADER.size:
+        raise SnapshotError(f"snapshot too short: {path}")
+    return header
+
+
+def _parse_header(path, data):
+    """Validate the header against the buffer size. Returns (n_broader, n_has_tag, crc, payload)."""
+    if len(data) < _HEADER.size:
+        raise SnapshotError(f"snapshot too short: {path}")
+    magic, version, n_broader, n_has_tag, crc = _HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"unsupported snapshot format: {path}")
+    payload = memoryview(data)[_HEADER.size:]
+    if len(payload) != 4 * 4 * (n_broader + n_has_tag):
+        payload.release()
+        raise SnapshotError(f"snapshot size does not match header: {path}")
+    return n_broader, n_has_tag, crc, payload
+
+
+def read_snapshot(path):
+    """Read a snapshot file. Returns (broader, has_tag) EdgeIndex objects."""
+    try:
+        with open(path, "rb") as fp:
+            data = fp.read()
+    except OSError as e:
+        raise SnapshotError(str(e)) from e
+
+    n_broader, n_has_tag, crc, payload = _parse_header(path, data)
+    if zlib.crc32(payload) != crc:
+        raise SnapshotError(f"snapshot checksum mismatch: {path}")
+
+    indexes = []
+    offset = 0
+    for count in (n_broader, n_has_tag):
+        columns = []
+        for _ in range(4):
+            column = _int_column()
+            column.frombytes(payload[offset:offset + 4 * count])
+            if sys.byteorder != "little":
+                column.byteswap()
+            columns.append(column)
+            offset += 4 * count
+        indexes.append(EdgeIndex(*columns))
+    return indexes[0], indexes[1]
+
+
+class SnapshotMapping:
+    """
+    A snapshot mapped read-only into memory.
+
+    ``broader`` and ``has_tag`` are EdgeIndex objects whose base columns are
+    int32 memoryviews over the mapping; nothing is copied or parsed. The
+    checksum is not verified here since that would touch every page; files
+    are only ever replaced whole by write_snapshot().
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise SnapshotError("snapshots can only be mapped on little-endian hosts")
+        try:
+            with open(path, "rb") as fp:
+                self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(str(e)) from e
+
+        self._views = []
+        try:
+            n_broader, n_has_tag, _, payload = _parse_header(path, self._mmap)
+        except SnapshotError:
+            self._mmap.close()
+            raise
+        self._views.append(payload)
+        ints = payload.cast("i")
+        self._views.append(ints)
+
+        indexes = []
+        offset = 0
+        for count in (n_broader, n_has_tag):
+            columns = []
+            for _ in range(4):
+                column = ints[offset:offset + count]
+                self._views.append(column)
+                columns.append(column)
+                offset += count
+            indexes.append(EdgeIndex(*columns))
+        self.broader, self.has_tag = indexes
+
+    def close(self):
+        """Release the views and unmap the file."""
+        self.broader = None
+        self.has_tag = None
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller still holds a slice of a column; the mapping is
+            # released when that slice is garbage collected.
+            pass
+
+
+def map_snapshot(path):
+    """Map a snapshot file read-only. Returns a SnapshotMapping."""
+    return SnapshotMapping(path)
+
+
+def write_turtle(path, broader, has_tag):
+    """
+    Write both relations as plain Turtle triples atomically.
+
+    Emitting the triples directly keeps the interchange export linear in the
+    number of links instead of going through rdflib's serializer.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        fp.write(_TURTLE_PREFIXES)
+        fp.writelines(
+            f"htfs:tag_{child} skos:broader htfs:tag_{parent} .\n"
+            for child, parent in sorted(broader.pairs())
+        )
+        fp.writelines(
+            f"htfs:resource_{res} htfs:hasTag htfs:tag_{tag} .\n"
+            for res, tag in sorted(has_tag.pairs())
+        )
+    os.replace(tmp_path, path)
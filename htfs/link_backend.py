@@ -0,0 +1,169 @@
+"""
+link_backend - Interface for the stores that hold HTFS relationships.
+
+DatabaseManager keeps tag names and resource URLs in SQLite and delegates the
+two relations between IDs to a link backend:
+
+  - the tag hierarchy: (tag_id, parent_tag_id) pairs (skos:broader)
+  - resource tagging:  (resource_id, tag_id) pairs (htfs:hasTag)
+
+Two backends are available, chosen per boundary by the LINK_BACKEND setting
+in `.tagfs.db`:
+
+  - "rdf" (default): RDFHandler, an in-memory edge index persisted as
+    Turtle + binary snapshot + journal next to the database
+  - "sqlite": SQLiteLinkHandler, TAGLINKS/RESOURCELINKS tables in the same
+    database as the IDs, so links commit and roll back together with them
+
+Either backend can produce an rdflib graph for SPARQL queries and export.
+copy_links() moves every link from one backend to another.
+"""
+
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+
+RDF_BACKEND = "rdf"
+SQLITE_BACKEND = "sqlite"
+LINK_BACKENDS = (RDF_BACKEND, SQLITE_BACKEND)
+DEFAULT_LINK_BACKEND = RDF_BACKEND
+
+# Name of the SETTINGS row selecting a boundary's backend
+LINK_BACKEND_SETTING = "LINK_BACKEND"
+
+
+class LinkBackend(ABC):
+    """
+    The operations DatabaseManager performs on relationships. Backends must
+    implement every abstract method; a missing one fails at instantiation.
+
+    Mutating methods raise RuntimeError on a backend opened read-only.
+    savepoint()/rollback() undo in-memory state after the SQLite transaction
+    of a DatabaseManager.transaction() block has been rolled back.
+    """
+
+    read_only = False
+    # Backends that store links outside .tagfs.db call on_save(before, after)
+    # with their generation() on either side of every write, while holding
+    # other writers off, so DatabaseManager can keep TAGCLOSURE in step.
+    on_save = None
+
+    def generation(self):
+        """
+        Fingerprint of the links as stored on disk, or None when they live in
+        .tagfs.db and so commit together with everything else there.
+        """
+        return None
+
+    def synchronized(self):
+        """Context in which no other process changes the stored links."""
+        return nullcontext(self)
+
+    @abstractmethod
+    def connect(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def flush(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def savepoint(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def rollback(self, savepoint):
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace_all(self, tag_links, resource_links):
+        """Replace every stored link with the given (tag, parent) and (resource, tag) pairs."""
+        raise NotImplementedError
+
+    # Tag hierarchy
+
+    @abstractmethod
+    def add_tag_link(self, tag_id, parent_tag_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_tag_link(self, tag_id, parent_tag_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_parent_tag_ids(self, tag_id) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_child_tag_ids(self, tag_id) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_tag_closure_ids(self, tag_ids) -> set:
+        """The given tags and all their descendants."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_tag_ancestor_ids(self, tag_ids) -> set:
+        """The given tags and all their ancestors."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_tag_links(self) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_all_links_for_tag(self, tag_id):
+        raise NotImplementedError
+
+    # Resource tagging
+
+    @abstractmethod
+    def add_resource_tag_link(self, resource_id, tag_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_resource_tag_links(self, links):
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_resource_tag_link(self, resource_id, tag_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_all_tags_for_resource(self, resource_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_resource_tag_ids(self, resource_id) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_resources_by_tag_ids(self, tag_ids, closed=False) -> list:
+        """Resource IDs (ascending) linked to any of the tags or, unless closed, their descendants."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_resource_bitmap(self, tag_ids):
+        """Bitmap of the resource IDs linked to any of the given tags (no closure applied)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_resource_tag_links(self) -> list:
+        raise NotImplementedError
+
+    def get_graph(self):
+        """An rdflib Graph of all relationships, for SPARQL and export."""
+        from htfs.rdf_handler import graph_from_links
+        return graph_from_links(self.get_all_tag_links(), self.get_all_resource_tag_links())
+
+
+def copy_links(source, target):
+    """Replace target's links with source's. Returns (tag link count, resource link count)."""
+    tag_links = source.get_all_tag_links()
+    resource_links = source.get_all_resource_tag_links()
+    target.replace_all(tag_links, resource_links)
+    return len(tag_links), len(resource_links)
@@ -0,0 +1,110 @@
+"""
+prompt - Shell prompt summary of the tags around the current directory.
+
+prompt_tags() reports the tags of the nearest directory (walking up to the
+tagfs boundary) that has any; failing that, the union of the tags of the
+entries in the current directory. Both lookups are a single bulk query.
+
+Results are cached in one small JSON file per boundary under
+$XDG_CACHE_HOME/tagfs, keyed by the directory and its mtime and invalidated
+as a whole when the database generation changes, so repeated prompts in an
+unchanged directory are answered without opening the database. The file is
+kept out of the boundary: writing it there would change the boundary
+directory's mtime and invalidate its own entry.
+"""
+
+import os
+import json
+import zlib
+import logging
+
+CACHE_DIR = "tagfs"
+CACHE_VERSION = 1
+MAX_CACHE_ENTRIES = 256
+
+logobj = logging.getLogger(__name__)
+
+
+def cache_path(tagfs_boundary) -> str:
+    """Where the prompt cache of a boundary is kept."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    # crc32, as hashlib takes milliseconds to import; a collision only costs
+    # a miss, since the file records the boundary it belongs to
+    digest = zlib.crc32(str(tagfs_boundary).encode("utf-8", "surrogateescape"))
+    return os.path.join(cache_home, CACHE_DIR, f"prompt-{digest:08x}.json")
+
+
+def format_tags(tags) -> str:
+    return "{" + ", ".join(tags) + "}"
+
+
+def prompt_tags(htfs, directory) -> list:
+    """Tags to show for a directory inside htfs's boundary."""
+    directory = os.path.abspath(directory)
+    boundary = str(htfs.tagfs_boundary)
+    ancestors = [directory]
+    while ancestors[-1] != boundary:
+        parent = os.path.dirname(ancestors[-1])
+        if parent == ancestors[-1]:
+            break
+        ancestors.append(parent)
+    try:
+        with os.scandir(directory) as entries:
+            children = [entry.path for entry in entries if not entry.name.startswith(".")]
+    except OSError:
+        children = []
+
+    tags_by_path = htfs.get_resources_tags(ancestors + children)
+    for path in ancestors:
+        if tags_by_path[path]:
+            return tags_by_path[path]
+    return sorted({tag for path in children for tag in tags_by_path[path] or ()})
+
+
+class PromptCache:
+    """Directory → prompt text, valid for one database generation."""
+
+    def __init__(self, tagfs_boundary, generation):
+        self.path = cache_path(tagfs_boundary)
+        self.boundary = str(tagfs_boundary)
+        # JSON has no tuples; compare in the form it is stored in
+        self.generation = json.loads(json.dumps(generation))
+        self.entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+            if (data.get("version") == CACHE_VERSION and data.get("boundary") == self.boundary
+                    and data.get("generation") == self.generation):
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    @staticmethod
+    def _dir_stamp(directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self, directory):
+        entry = self.entries.get(directory)
+        if entry and entry[0] == self._dir_stamp(directory):
+            return entry[1]
+        return None
+
+    def put(self, directory, text):
+        self.entries.pop(directory, None)
+        self.entries[directory] = [self._dir_stamp(directory), text]
+        # Dicts keep insertion order; drop the least recently stored entries
+        while len(self.entries) > MAX_CACHE_ENTRIES:
+            del self.entries[next(iter(self.entries))]
+        data = {"version": CACHE_VERSION, "boundary": self.boundary,
+                "generation": self.generation, "entries": self.entries}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(data, fp)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logobj.debug("could not write prompt cache: %s", e)
@@ -1,21 +1,27 @@
 """
-QueryEvaluator - Compiles tag expressions to SPARQL queries.
+QueryEvaluator - Evaluates tag expressions against the relationship store.
 
 Architecture:
   - Tokenizer: Split expression into tokens
   - Parser: Build AST with operator precedence
-  - ASTEvaluator: Compile AST to SPARQL and execute against RDF graph
+  - SetEvaluator: Evaluate AST as set algebra over resource IDs (default)
+  - ASTEvaluator: Compile AST to SPARQL and execute against RDF graph (fallback)
 """
 
 import re
-from htfs.rdf_handler import HTFS
-from rdflib.namespace import SKOS
+from htfs.bitmap_index import Bitmap
+from htfs.rdf_handler import HTFS_NS, SKOS_NS
 
 # Module-level constants for Parser
 VALID_OPERATORS = set(['|', '&', '~'])
 LEFT_PAREN = '('
 RIGHT_PAREN = ')'
 
+# Evaluation engines selectable by QueryEvaluator
+ENGINE_NATIVE = 'native'
+ENGINE_SPARQL = 'sparql'
+DEFAULT_ENGINE = ENGINE_NATIVE
+
 
 class Tokenizer:
     @staticmethod
@@ -91,21 +97,74 @@ class Parser:
         return tok
 
 
+class SetEvaluator:
+    """
+    Evaluates an AST directly as set algebra over resource-ID bitmaps.
+
+    Each tag resolves to the OR of the bitmaps of its materialized closure;
+    '&', '|' and '~' become bitmap AND, OR and AND-NOT against the bitmap of
+    all tracked resources, and counting is a popcount.
+    """
+
+    def __init__(self, tag_service):
+        self.th = tag_service
+        self.db = tag_service.db
+        self._universe = None
+
+    def _all_resources(self):
+        if self._universe is None:
+            self._universe = self.db.get_all_resources_bitmap()
+        return self._universe
+
+    def _resources_for_tag(self, tag_name: str):
+        tag_id = self.db.get_tag_id(tag_name)
+        if tag_id < 0:
+            return Bitmap()
+        closure_ids = self.db.get_tag_closure_ids([tag_id])
+        return self.db.get_resource_bitmap(closure_ids)
+
+    def _eval_set(self, node: ASTNode):
+        if node.value == '&':
+            left = self._eval_set(node.left)
+            if not left:
+                return left
+            return left & self._eval_set(node.right)
+        elif node.value == '|':
+            return self._eval_set(node.left) | self._eval_set(node.right)
+        elif node.value == '~':
+            return self._all_resources() - self._eval_set(node.left)
+        else:
+            return self._resources_for_tag(node.value)
+
+    def eval(self, node: ASTNode, count: bool = False):
+        resource_ids = self._eval_set(node)
+        if count:
+            # Links left behind for resources no longer tracked must not count
+            return len(resource_ids & self._all_resources())
+        return self.db.get_resource_urls(resource_ids)
+
+
 class ASTEvaluator:
     """
     Compiles an AST into a single SPARQL query and executes it.
 
     The TagService passed in must have a `db` attribute (DatabaseManager)
-    which has an `rdf` attribute (RDFHandler) with a `graph` attribute.
+    whose link backend (`links`) can build an rdflib graph.
+
+    Untagged resources have no triples in the graph, so '~' binds ?resource
+    to every tracked resource (a VALUES block read from SQLite) before
+    filtering; negation then means the same as in SetEvaluator.
     """
 
     def __init__(self, tag_service):
         self.th = tag_service
         self.db = tag_service.db
-        # Ensure RDF is connected/loaded
-        self.db.rdf.connect()
-        self.g = self.db.rdf.graph
+        # Build the rdflib graph from the loaded relationships
+        self.g = self.db.links.get_graph()
+        from rdflib import Namespace
+        self.namespaces = {"htfs": Namespace(HTFS_NS), "skos": Namespace(SKOS_NS)}
         self._var_counter = 0
+        self._universe = None
 
     def _next_var(self):
         self._var_counter += 1
@@ -118,6 +177,13 @@ class ASTEvaluator:
             return None
         return f"htfs:tag_{tag_id}"
 
+    def _all_resources(self) -> str:
+        """A VALUES clause binding ?resource to every tracked resource."""
+        if self._universe is None:
+            uris = " ".join(f"htfs:resource_{res_id}" for res_id in self.db.get_resource_ids())
+            self._universe = f"VALUES ?resource {{ {uris} }}\n"
+        return self._universe
+
     def _compile(self, node: ASTNode) -> str:
         if node is None:
             return ""
@@ -129,12 +195,13 @@ class ASTEvaluator:
             return f"{{ {left} }} UNION {{ {right} }}\n"
         elif node.value == '~':
             inner = self._compile(node.left)
-            return f"FILTER NOT EXISTS {{ {inner} }}\n"
+            return f"{self._all_resources()}FILTER NOT EXISTS {{ {inner} }}\n"
         else:
             tag_uri = self._resolve_tag_to_id(node.value)
             if tag_uri is None:
-                # Tag doesn't exist; add a clause that filters out everything
-                return "FILTER(false)\n"
+                # Tag doesn't exist; match a tag URI no resource can carry
+                # (rdflib mishandles FILTER(false) inside NOT EXISTS)
+                return "?resource htfs:hasTag htfs:tag_unknown .\n"
             var = self._next_var()
             return f"?resource htfs:hasTag {var} .\n{var} skos:broader* {tag_uri} .\n"
 
@@ -147,7 +214,7 @@ class ASTEvaluator:
                 {pattern}
             }}
             """
-            results = self.g.query(query, initNs={"htfs": HTFS, "skos": SKOS})
+            results = self.g.query(query, initNs=self.namespaces)
             for row in results:
                 return int(row[0])
             return 0
@@ -157,38 +224,43 @@ class ASTEvaluator:
                 {pattern}
             }}
             """
-            results = self.g.query(query, initNs={"htfs": HTFS, "skos": SKOS})
-            resource_urls = []
-            seen = set()
+            results = self.g.query(query, initNs=self.namespaces)
+            resource_ids = {}
             for row in results:
                 resource_uri = str(row.resource)
                 try:
-                    resource_id = int(resource_uri.split("_")[-1])
+                    resource_ids[int(resource_uri.split("_")[-1])] = None
                 except (ValueError, IndexError):
                     continue
-                url = self.db.get_resource_url(resource_id)
-                if url and url not in seen:
-                    seen.add(url)
-                    resource_urls.append(url)
-            return resource_urls
+            return self.db.get_resource_urls(resource_ids)
 
 
 class QueryEvaluator:
     """
-    Evaluate tag expressions against the RDF graph.
+    Evaluate tag expressions against the relationship store.
 
     Usage:
         qe = QueryEvaluator(tag_service)
         results = qe.evaluate("(proj1|proj2)&research&~draft")
+
+    ``engine`` selects the native set evaluator (default) or the SPARQL one.
     """
 
-    def __init__(self, th):
+    ENGINES = {
+        ENGINE_NATIVE: SetEvaluator,
+        ENGINE_SPARQL: ASTEvaluator,
+    }
+
+    def __init__(self, th, engine=DEFAULT_ENGINE):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown query engine: {engine}")
         self.th = th
+        self.engine = engine
 
     def evaluate(self, expression: str, count: bool = False) -> list:
         tokens = Tokenizer.tokenize(expression)
         parser = Parser(tokens)
         ast = parser.parse()
-        evaluator = ASTEvaluator(self.th)
+        evaluator = self.ENGINES[self.engine](self.th)
         return evaluator.eval(ast, count=count)
 
@@ -1,57 +1,530 @@
 import os
+import re
 import logging
-from rdflib import Graph, Namespace
-from rdflib.namespace import SKOS
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; journal writes go unlocked
+    fcntl = None
+
+from htfs.bitmap_index import BitmapError, BitmapIndex
+from htfs.link_backend import LinkBackend
+from htfs.edge_store import (
+    EdgeIndex,
+    SnapshotError,
+    map_snapshot,
+    read_snapshot,
+    snapshot_header,
+    write_snapshot,
+    write_turtle,
+)
 
 logobj = logging.getLogger(__name__)
 
-HTFS = Namespace("http://htfs.example.org/ontology#")
+HTFS_NS = "http://htfs.example.org/ontology#"
+SKOS_NS = "http://www.w3.org/2004/02/skos/core#"
 
+# Journal of link changes appended next to the Turtle snapshot
+JOURNAL_SUFFIX = ".journal"
+# Binary edge snapshot preferred over Turtle when it is at least as new
+SNAPSHOT_SUFFIX = ".snap"
+# Tag → resource bitmap index derived from the snapshot
+BITMAPS_SUFFIX = ".bitmaps"
+# Fold the journal back into the snapshot once it grows past this many entries
+COMPACT_THRESHOLD = 10000
 
-class RDFHandler:
+_JOURNAL_LINE = re.compile(r"^([+-]) <([^>]*)> <([^>]*)> <([^>]*)> \.$")
+
+# Relation name → predicate URI
+BROADER = "broader"
+HAS_TAG = "hasTag"
+_PREDICATES = {BROADER: SKOS_NS + "broader", HAS_TAG: HTFS_NS + "hasTag"}
+_RELATIONS = {uri: name for name, uri in _PREDICATES.items()}
+
+
+def _uri_id(uri):
+    """Extract the numeric ID from an htfs:tag_N / htfs:resource_N URI."""
+    return int(str(uri).split("_")[-1])
+
+
+def new_graph():
+    """
+    Create an empty rdflib Graph with the htfs/skos prefixes bound.
+
+    rdflib is imported here rather than at module level: sessions served
+    from the snapshot never need it, and it dominates CLI start-up time.
+    """
+    import rdflib
+    graph = rdflib.Graph()
+    graph.bind("htfs", rdflib.Namespace(HTFS_NS))
+    graph.bind("skos", rdflib.Namespace(SKOS_NS))
+    return graph
+
+
+def _graph_triple(relation, src, dst):
+    """A link as a triple of rdflib URIRefs."""
+    from rdflib import URIRef
+    subject = f"{HTFS_NS}tag_{src}" if relation == BROADER else f"{HTFS_NS}resource_{src}"
+    return URIRef(subject), URIRef(_PREDICATES[relation]), URIRef(f"{HTFS_NS}tag_{dst}")
+
+
+def graph_from_links(tag_links, resource_links):
+    """Build an rdflib Graph from (tag, parent) and (resource, tag) pairs."""
+    graph = new_graph()
+    for relation, pairs in ((BROADER, tag_links), (HAS_TAG, resource_links)):
+        for src, dst in pairs:
+            graph.add(_graph_triple(relation, src, dst))
+    return graph
+
+
+class RDFHandler(LinkBackend):
     """
     RDF handler for tag hierarchy and resource-tag relationships.
 
     SQLite stores: tag name↔id, resource url↔id (fast lookups)
     RDF stores: tag hierarchy (skos:broader), resource-tag links (htfs:hasTag)
 
-    Only loads/parses RDF when needed, serializes only on close().
+    Relationships are held in memory as integer EdgeIndex objects. They are
+    loaded from the binary snapshot (``.tagfs.ttl.snap``) when it is at least
+    as new as ``.tagfs.ttl``, otherwise parsed from Turtle once and cached as a
+    snapshot. Changes are appended to a journal (``.tagfs.ttl.journal``) on
+    close() and replayed on load, so a session writes only what it changed;
+    the journal is folded back into the Turtle and snapshot files once it
+    exceeds ``compact_threshold`` entries. An rdflib Graph is built only when
+    SPARQL or a Turtle export needs one.
+
+    Several processes may share a boundary. Appends and compaction hold an
+    exclusive flock on the journal and first replay whatever other processes
+    appended since this handler loaded, so neither loses their changes;
+    loads hold a shared lock so they never pair a new snapshot with an old
+    journal.
+
+    The tag hierarchy is additionally kept as parent→children and
+    child→parents dicts of int sets, built on first hierarchy access and
+    updated by every broader-link change, so traversals are plain dict lookups.
+
+    Resource-tag links are also available as a BitmapIndex (tag ID → bitmap
+    of resource IDs). It is saved with every snapshot (``.tagfs.ttl.bitmaps``)
+    and brought up to date by replaying the journal, so queries can use it
+    without loading the relationships themselves.
+
+    With ``read_only=True`` the snapshot is memory-mapped rather than copied
+    and all mutating methods raise RuntimeError.
     """
 
-    def __init__(self, ttl_path):
+    def __init__(self, ttl_path, compact_threshold=COMPACT_THRESHOLD, read_only=False):
         self.ttl_path = ttl_path
+        self.journal_path = ttl_path + JOURNAL_SUFFIX
+        self.snapshot_path = ttl_path + SNAPSHOT_SUFFIX
+        self.bitmaps_path = ttl_path + BITMAPS_SUFFIX
+        self.compact_threshold = compact_threshold
+        self.read_only = read_only
+        self.broader = None
+        self.has_tag = None
         self.graph = None
+        self._children = None
+        self._parents = None
+        self._bitmaps = None
+        self._mapping = None
         self._dirty = False
+        self._pending = []
+        self._journal_entries = 0
+        self._journal_offset = 0
+        self._base_stamp = None
 
     def connect(self):
-        """Load RDF graph from disk (lazy loading)."""
-        if self.graph is None:
-            self.graph = Graph()
-            self.graph.bind("htfs", HTFS)
-            self.graph.bind("skos", SKOS)
-            if os.path.exists(self.ttl_path):
-                self.graph.parse(self.ttl_path, format="turtle")
-        return self.graph
+        """Load relationships from disk (lazy loading) and replay the journal."""
+        if self.broader is None:
+            with self._locked_journal(exclusive=False) as fp:
+                self._load_base()
+                entries, self._journal_offset = self._read_journal(fp)
+                self._apply(entries)
+                self._journal_entries = len(entries)
+        return self
 
     def close(self):
-        """Serialize RDF to disk only if dirty, then clear memory."""
-        if self.graph is not None and self._dirty:
+        """Persist pending changes only if dirty, then clear memory."""
+        if self.broader is not None and self._dirty:
             self._save()
+        self.broader = None
+        self.has_tag = None
         self.graph = None
+        self._children = None
+        self._parents = None
+        self._bitmaps = None
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
         self._dirty = False
+        self._pending = []
 
     def _mark_dirty(self):
         """Mark the graph as modified."""
         self._dirty = True
 
-    def _save(self):
-        """Serialize graph to Turtle file."""
+    def _snapshot_is_fresh(self):
+        """True if the binary snapshot exists and is not older than the Turtle file."""
+        try:
+            snap_mtime = os.stat(self.snapshot_path).st_mtime_ns
+        except OSError:
+            return False
+        try:
+            ttl_mtime = os.stat(self.ttl_path).st_mtime_ns
+        except OSError:
+            return True
+        return snap_mtime >= ttl_mtime
+
+    def _snapshot_stamp(self):
+        """Identity of the snapshot file on disk; it changes whenever any process compacts."""
+        try:
+            st = os.stat(self.snapshot_path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load_base(self):
+        """Load the base relationships from the snapshot, falling back to Turtle."""
+        self._base_stamp = self._snapshot_stamp()
+        if self._snapshot_is_fresh():
+            try:
+                if self.read_only:
+                    self._mapping = map_snapshot(self.snapshot_path)
+                    self.broader, self.has_tag = self._mapping.broader, self._mapping.has_tag
+                else:
+                    self.broader, self.has_tag = read_snapshot(self.snapshot_path)
+                return
+            except SnapshotError as e:
+                logobj.warning("ignoring snapshot, reloading Turtle: %s", e)
+
+        broader, has_tag = [], []
+        if os.path.exists(self.ttl_path):
+            from rdflib import URIRef
+            graph = new_graph()
+            graph.parse(self.ttl_path, format="turtle")
+            for name, pairs in ((BROADER, broader), (HAS_TAG, has_tag)):
+                for s, _, o in graph.triples((None, URIRef(_PREDICATES[name]), None)):
+                    try:
+                        pairs.append((_uri_id(s), _uri_id(o)))
+                    except (ValueError, IndexError):
+                        continue
+        self.broader = EdgeIndex.from_pairs(broader)
+        self.has_tag = EdgeIndex.from_pairs(has_tag)
+
+        if os.path.exists(self.ttl_path):
+            # Cache the parse so the next session skips Turtle entirely
+            try:
+                write_snapshot(self.snapshot_path, self.broader, self.has_tag)
+            except OSError as e:
+                logobj.warning("could not write snapshot %s: %s", self.snapshot_path, e)
+            else:
+                self._write_bitmaps()
+                self._base_stamp = self._snapshot_stamp()
+
+    def _index(self, relation):
+        return self.broader if relation == BROADER else self.has_tag
+
+    def _triple(self, relation, src, dst):
+        """The (subject, predicate, object) URIs of a link, as strings."""
+        subject = self._tag_uri(src) if relation == BROADER else self._res_uri(src)
+        return (subject, _PREDICATES[relation], self._tag_uri(dst))
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"relationships opened read-only: {self.ttl_path}")
+
+    def _add(self, relation, src, dst):
+        """Add a link and record it in the pending journal entries."""
+        self._check_writable()
+        if not self._index(relation).add(src, dst):
+            return
+        if self.graph is not None:
+            self.graph.add(_graph_triple(relation, src, dst))
+        if relation == BROADER and self._children is not None:
+            self._children.setdefault(dst, set()).add(src)
+            self._parents.setdefault(src, set()).add(dst)
+        if relation == HAS_TAG and self._bitmaps is not None:
+            self._bitmaps.add(src, dst)
+        self._pending.append(("+", relation, src, dst))
+        self._mark_dirty()
+
+    def _remove(self, relation, src, dst):
+        """Remove a link and record it in the pending journal entries."""
+        self._check_writable()
+        if not self._index(relation).remove(src, dst):
+            return
         if self.graph is not None:
-            self.graph.serialize(destination=self.ttl_path, format="turtle")
+            self.graph.remove(_graph_triple(relation, src, dst))
+        if relation == BROADER and self._children is not None:
+            self._children[dst].discard(src)
+            self._parents[src].discard(dst)
+        if relation == HAS_TAG and self._bitmaps is not None:
+            self._bitmaps.remove(src, dst)
+        self._pending.append(("-", relation, src, dst))
+        self._mark_dirty()
+
+    def savepoint(self):
+        """Mark the current state of the pending changes for rollback()."""
+        return len(self._pending), self._dirty
+
+    def rollback(self, savepoint):
+        """Undo, in memory, every change recorded since savepoint() was taken."""
+        mark, dirty = savepoint
+        undo = self._pending[mark:]
+        for op, relation, src, dst in reversed(undo):
+            if op == "+":
+                self._remove(relation, src, dst)
+            else:
+                self._add(relation, src, dst)
+        del self._pending[mark:]
+        self._dirty = dirty
+
+    @contextmanager
+    def _locked_journal(self, exclusive):
+        """
+        Open the journal and hold a flock on it for the duration of the block.
+        Yields the open binary file, or None when there is no journal and the
+        lock is shared. Exclusive locks create the journal if needed.
+        """
+        while True:
+            try:
+                fp = open(self.journal_path, "a+b" if exclusive else "rb")
+            except FileNotFoundError:
+                yield None
+                return
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                current = os.stat(self.journal_path).st_ino == os.fstat(fp.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                break
+            # Compaction removed the file while we waited for the lock
+            fp.close()
+        try:
+            yield fp
+        finally:
+            fp.close()
+
+    def _read_journal(self, fp, start=0):
+        """
+        Read the journal from byte offset start. Returns the well-formed
+        (op, relation, src, dst) entries and the offset just past the last
+        complete line; a trailing partial line is left for a later read.
+        """
+        if fp is None:
+            return [], start
+        fp.seek(start)
+        data = fp.read()
+        end = data.rfind(b"\n") + 1
+        entries = []
+        offset = start
+        for raw in data[:end].splitlines(keepends=True):
+            match = _JOURNAL_LINE.match(raw.decode("utf-8", "replace").rstrip("\n"))
+            relation = _RELATIONS.get(match.group(3)) if match else None
+            if relation is None:
+                logobj.warning("skipping malformed journal entry %s@%d", self.journal_path, offset)
+            else:
+                op, s, _, o = match.groups()
+                try:
+                    entries.append((op, relation, _uri_id(s), _uri_id(o)))
+                except (ValueError, IndexError):
+                    pass
+            offset += len(raw)
+        return entries, start + end
+
+    def _apply(self, entries):
+        """Apply (op, relation, src, dst) entries to the edge indexes."""
+        for op, relation, src, dst in entries:
+            if op == "+":
+                self._index(relation).add(src, dst)
+            else:
+                self._index(relation).remove(src, dst)
+
+    def _catch_up(self, fp):
+        """
+        Bring memory up to date with what other processes wrote since this
+        handler loaded, then re-apply this handler's pending changes on top.
+        Must be called with the journal locked exclusively.
+        """
+        size = os.fstat(fp.fileno()).st_size
+        reload = self._base_stamp != self._snapshot_stamp() or size < self._journal_offset
+        if reload:
+            # Compacted or rebuilt by another process: start from the new base
+            self._load_base()
+            self._journal_offset = self._journal_entries = 0
+        entries, end = self._read_journal(fp, self._journal_offset)
+        if end < size:
+            # The torn tail of an append whose writer died holding the lock
+            fp.truncate(end)
+        self._journal_offset = end
+        self._journal_entries += len(entries)
+        if reload or entries:
+            self._apply(entries)
+            self._apply(self._pending)
+            self.graph = None
+            self._children = None
+            self._parents = None
+            self._bitmaps = None
+
+    def _append_journal(self, fp):
+        """Append pending changes to the locked journal file."""
+        lines = []
+        for op, relation, src, dst in self._pending:
+            s, p, o = self._triple(relation, src, dst)
+            lines.append(f"{op} <{s}> <{p}> <{o}> .\n")
+        data = "".join(lines).encode("utf-8")
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+        self._journal_offset += len(data)
+        self._journal_entries += len(lines)
+        self._pending = []
+
+    def _save(self):
+        """Append pending changes to the journal, compacting it when it grows too large."""
+        if self.broader is None or not self._pending:
+            return
+        with self._locked_journal(exclusive=True) as fp:
+            self._catch_up(fp)
+            before = self.generation()
+            self._append_journal(fp)
+            if self._journal_entries >= self.compact_threshold:
+                self._write_base()
+            if self.on_save is not None:
+                self.on_save(before, self.generation())
+
+    def compact(self):
+        """Fold the journal and pending changes into fresh Turtle and snapshot files."""
+        self._check_writable()
+        self.connect()
+        with self._locked_journal(exclusive=True) as fp:
+            self._catch_up(fp)
+            before = self.generation()
+            self._write_base()
+            if self.on_save is not None:
+                self.on_save(before, self.generation())
+
+    def generation(self):
+        """Fingerprint of the Turtle, snapshot and journal files on disk."""
+        parts = []
+        for path in (self.ttl_path, self.snapshot_path):
+            try:
+                st = os.stat(path)
+                parts.append(f"{st.st_ino}.{st.st_mtime_ns}.{st.st_size}")
+            except OSError:
+                parts.append("-")
+        try:
+            parts.append(str(os.path.getsize(self.journal_path)))
+        except OSError:
+            parts.append("0")
+        return ":".join(parts)
+
+    @contextmanager
+    def synchronized(self):
+        """
+        Hold other writers off and bring memory up to date with the files, so
+        the links seen inside the block are the ones generation() describes.
+        """
+        self._check_writable()
+        self.connect()
+        with self._locked_journal(exclusive=True) as fp:
+            self._catch_up(fp)
+            yield self
+
+    def _write_base(self):
+        """
+        Rewrite the Turtle, snapshot and bitmap files from memory and remove
+        the journal. Must be called with the journal locked exclusively.
+        """
+        # Turtle first, so the snapshot ends up at least as new as it
+        write_turtle(self.ttl_path, self.broader, self.has_tag)
+        self.broader, self.has_tag = write_snapshot(self.snapshot_path, self.broader, self.has_tag)
+        self._write_bitmaps()
+        self._base_stamp = self._snapshot_stamp()
+        # Replaying a journal over a snapshot that already contains it is a
+        # no-op, so a crash between these steps loses nothing.
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+        self._journal_offset = 0
+        self._pending = []
+
+    def replace_all(self, tag_links, resource_links):
+        """
+        Replace every link and write the result out as a fresh Turtle file
+        and snapshot. Changes pending before the call are discarded.
+        """
+        self._check_writable()
+        self.broader = EdgeIndex.from_pairs(tag_links)
+        self.has_tag = EdgeIndex.from_pairs(resource_links)
+        self.graph = None
+        self._children = None
+        self._parents = None
+        self._bitmaps = None
+        with self._locked_journal(exclusive=True):
+            self._write_base()
+        self._dirty = False
+
+    # -------------------------------------------------------------------------
+    # Bitmap Index (htfs:hasTag as tag → resource bitmaps)
+    # -------------------------------------------------------------------------
+
+    def _write_bitmaps(self):
+        """Save the bitmap index matching the snapshot just written."""
+        bitmaps = self._bitmaps
+        if bitmaps is None:
+            bitmaps = BitmapIndex.from_links(self.has_tag.pairs())
+        try:
+            bitmaps.save(self.bitmaps_path, snapshot_header(self.snapshot_path))
+        except (OSError, SnapshotError) as e:
+            logobj.warning("could not write bitmap index %s: %s", self.bitmaps_path, e)
+
+    def _load_bitmaps(self):
+        """Load the saved bitmap index and apply the journal and pending changes to it."""
+        with self._locked_journal(exclusive=False) as fp:
+            if not os.path.exists(self.snapshot_path) and not os.path.exists(self.ttl_path):
+                bitmaps = BitmapIndex()
+            elif self._snapshot_is_fresh():
+                bitmaps = BitmapIndex.load(self.bitmaps_path, snapshot_header(self.snapshot_path))
+            else:
+                raise BitmapError("Turtle is newer than the snapshot")
+            entries, _ = self._read_journal(fp)
+        for op, relation, src, dst in entries + self._pending:
+            if relation != HAS_TAG:
+                continue
+            if op == "+":
+                bitmaps.add(src, dst)
+            else:
+                bitmaps.remove(src, dst)
+        return bitmaps
+
+    def get_tag_bitmaps(self) -> BitmapIndex:
+        """
+        Get the tag → resource bitmap index. Loaded from disk when possible,
+        otherwise derived from the resource-tag links.
+        """
+        if self._bitmaps is None:
+            try:
+                self._bitmaps = self._load_bitmaps()
+            except (BitmapError, SnapshotError) as e:
+                logobj.info("rebuilding bitmap index: %s", e)
+                self.connect()
+                self._bitmaps = BitmapIndex.from_links(self.has_tag.pairs())
+        return self._bitmaps
+
+    def get_graph(self):
+        """Build (once) and return an rdflib Graph of all relationships, for SPARQL/export."""
+        self.connect()
+        if self.graph is None:
+            self.graph = graph_from_links(self.broader.pairs(), self.has_tag.pairs())
+        return self.graph
 
     def flush(self):
         """Explicitly save RDF to disk."""
-        if self.graph is not None and self._dirty:
+        if self.broader is not None and self._dirty:
             self._save()
             self._dirty = False
 
@@ -68,81 +541,71 @@ class RDFHandler:
 
     def _tag_uri(self, tag_id):
         """Convert tag ID to RDF URI."""
-        return HTFS[f"tag_{tag_id}"]
+        return f"{HTFS_NS}tag_{tag_id}"
 
     def _res_uri(self, resource_id):
         """Convert resource ID to RDF URI."""
-        return HTFS[f"resource_{resource_id}"]
+        return f"{HTFS_NS}resource_{resource_id}"
 
     def add_tag_link(self, tag_id, parent_tag_id):
         """Add a broader (parent) relationship between tags."""
         self.connect()
-        child_uri = self._tag_uri(tag_id)
-        parent_uri = self._tag_uri(parent_tag_id)
-        self.graph.add((child_uri, SKOS.broader, parent_uri))
-        self._mark_dirty()
+        self._add(BROADER, tag_id, parent_tag_id)
 
     def remove_tag_link(self, tag_id, parent_tag_id):
         """Remove a broader relationship between tags."""
         self.connect()
-        child_uri = self._tag_uri(tag_id)
-        parent_uri = self._tag_uri(parent_tag_id)
-        self.graph.remove((child_uri, SKOS.broader, parent_uri))
-        self._mark_dirty()
+        self._remove(BROADER, tag_id, parent_tag_id)
+
+    def _hierarchy(self):
+        """Return the (children, parents) adjacency dicts, building them on first use."""
+        self.connect()
+        if self._children is None:
+            children, parents = {}, {}
+            for child_id, parent_id in self.broader.pairs():
+                children.setdefault(parent_id, set()).add(child_id)
+                parents.setdefault(child_id, set()).add(parent_id)
+            self._children, self._parents = children, parents
+        return self._children, self._parents
 
     def get_parent_tag_ids(self, tag_id) -> list:
         """Get immediate parent tag IDs for a tag."""
-        self.connect()
-        tag_uri = self._tag_uri(tag_id)
-        parent_ids = []
-        for parent_uri in self.graph.objects(tag_uri, SKOS.broader):
-            # Extract tag ID from URI (htfs:tag_N → N)
-            try:
-                parent_id = int(str(parent_uri).split("_")[-1])
-                parent_ids.append(parent_id)
-            except (ValueError, IndexError):
-                continue
-        return parent_ids
+        _, parents = self._hierarchy()
+        return list(parents.get(tag_id, ()))
 
     def get_child_tag_ids(self, tag_id) -> list:
         """Get immediate child tag IDs for a tag."""
-        self.connect()
-        tag_uri = self._tag_uri(tag_id)
-        child_ids = []
-        for child_uri in self.graph.subjects(SKOS.broader, tag_uri):
-            try:
-                child_id = int(str(child_uri).split("_")[-1])
-                child_ids.append(child_id)
-            except (ValueError, IndexError):
-                continue
-        return child_ids
+        children, _ = self._hierarchy()
+        return list(children.get(tag_id, ()))
 
     def get_tag_closure_ids(self, tag_ids) -> set:
         """Get transitive closure of tag IDs (all descendants)."""
-        self.connect()
+        children, _ = self._hierarchy()
         closure = set(tag_ids)
-        queue = list(tag_ids)
+        queue = deque(closure)
         while queue:
-            tag_id = queue.pop(0)
-            children = self.get_child_tag_ids(tag_id)
-            for child_id in children:
+            for child_id in children.get(queue.popleft(), ()):
                 if child_id not in closure:
                     closure.add(child_id)
                     queue.append(child_id)
         return closure
 
+    def get_tag_ancestor_ids(self, tag_ids) -> set:
+        """Get transitive closure of tag IDs upwards (all ancestors)."""
+        _, parents = self._hierarchy()
+        closure = set(tag_ids)
+        queue = deque(closure)
+        while queue:
+            for parent_id in parents.get(queue.popleft(), ()):
+                if parent_id not in closure:
+                    closure.add(parent_id)
+                    queue.append(parent_id)
+        return closure
+
     def get_all_tag_links(self) -> list:
         """Get all tag hierarchy links as [(tagid, parentid), ...]."""
         self.connect()
-        links = []
-        for child_uri, _, parent_uri in self.graph.triples((None, SKOS.broader, None)):
-            try:
-                child_id = int(str(child_uri).split("_")[-1])
-                parent_id = int(str(parent_uri).split("_")[-1])
-                links.append((child_id, parent_id))
-            except (ValueError, IndexError):
-                continue
-        return links
+        return list(self.broader.pairs())
 
     # -------------------------------------------------------------------------
     # Resource-Tag Link Operations (htfs:hasTag)
@@ -151,88 +614,60 @@ class RDFHandler:
     def add_resource_tag_link(self, resource_id, tag_id):
         """Link a resource to a tag."""
         self.connect()
-        res_uri = self._res_uri(resource_id)
-        tag_uri = self._tag_uri(tag_id)
-        self.graph.add((res_uri, HTFS.hasTag, tag_uri))
-        self._mark_dirty()
+        self._add(HAS_TAG, resource_id, tag_id)
+
+    def add_resource_tag_links(self, links):
+        """Link many (resource_id, tag_id) pairs in one pass."""
+        self.connect()
+        for resource_id, tag_id in links:
+            self._add(HAS_TAG, resource_id, tag_id)
 
     def remove_resource_tag_link(self, resource_id, tag_id):
         """Remove a resource-tag link."""
         self.connect()
-        res_uri = self._res_uri(resource_id)
-        tag_uri = self._tag_uri(tag_id)
-        self.graph.remove((res_uri, HTFS.hasTag, tag_uri))
-        self._mark_dirty()
+        self._remove(HAS_TAG, resource_id, tag_id)
 
     def get_resource_tag_ids(self, resource_id) -> list:
         """Get all tag IDs linked to a resource."""
         self.connect()
-        res_uri = self._res_uri(resource_id)
-        tag_ids = []
-        for tag_uri in self.graph.objects(res_uri, HTFS.hasTag):
-            try:
-                tag_id = int(str(tag_uri).split("_")[-1])
-                tag_ids.append(tag_id)
-            except (ValueError, IndexError):
-                continue
-        return tag_ids
+        return self.has_tag.targets(resource_id)
 
-    def get_resources_by_tag_ids(self, tag_ids) -> list:
-        """Get all resource IDs that have any of the given tags (including tag closure)."""
+    def get_resources_by_tag_ids(self, tag_ids, closed=False) -> list:
+        """
+        Get all resource IDs (ascending) that have any of the given tags or
+        their descendants. Pass closed=True when tag_ids is already a full
+        closure so the hierarchy is not walked again.
+        """
         if not tag_ids:
             return []
-        self.connect()
-        resource_ids = set()
-
-        # Use SPARQL with transitive closure to get resources linked to
-        # any of the given tags OR any of their descendant tags
-        for tag_id in tag_ids:
-            tag_uri = self._tag_uri(tag_id)
-            query = f"""
-            SELECT ?res WHERE {{
-                ?res htfs:hasTag ?tag .
-                ?tag skos:broader* {tag_uri.n3()} .
-            }}
-            """
-            results = self.graph.query(
-                query,
-                initNs={"htfs": HTFS, "skos": SKOS}
-            )
-            for row in results:
-                try:
-                    resid = int(str(row.res).split("_")[-1])
-                    resource_ids.add(resid)
-                except (ValueError, IndexError):
-                    continue
-        return list(resource_ids)
+        if not closed:
+            tag_ids = self.get_tag_closure_ids(tag_ids)
+        return list(self.get_tag_bitmaps().union(tag_ids))
+
+    def get_resource_bitmap(self, tag_ids):
+        """Bitmap of resource IDs linked to any of the given tags (no closure applied)."""
+        return self.get_tag_bitmaps().union(tag_ids)
 
     def get_all_resource_tag_links(self) -> list:
         """Get all resource-tag links as [(resid, tagid), ...]."""
         self.connect()
-        links = []
-        for res_uri, _, tag_uri in self.graph.triples((None, HTFS.hasTag, None)):
-            try:
-                resid = int(str(res_uri).split("_")[-1])
-                tagid = int(str(tag_uri).split("_")[-1])
-                links.append((resid, tagid))
-            except (ValueError, IndexError):
-                continue
-        return links
+        return list(self.has_tag.pairs())
 
     def remove_all_tags_for_resource(self, resource_id):
         """Remove all tag links for a resource."""
         self.connect()
-        res_uri = self._res_uri(resource_id)
-        self.graph.remove((res_uri, HTFS.hasTag, None))
-        self._mark_dirty()
+        for tag_id in self.has_tag.targets(resource_id):
+            self._remove(HAS_TAG, resource_id, tag_id)
 
     def remove_all_links_for_tag(self, tag_id):
         """Remove all RDF triples that mention a tag."""
         self.connect()
-        tag_uri = self._tag_uri(tag_id)
-        self.graph.remove((tag_uri, None, None))
-        self.graph.remove((None, None, tag_uri))
-        self._mark_dirty()
+        for parent_id in self.get_parent_tag_ids(tag_id):
+            self._remove(BROADER, tag_id, parent_id)
+        for child_id in self.get_child_tag_ids(tag_id):
+            self._remove(BROADER, child_id, tag_id)
+        for resource_id in self.has_tag.sources(tag_id):
+            self._remove(HAS_TAG, resource_id, tag_id)
 
     # -------------------------------------------------------------------------
     # Migration/Sync Helpers
@@ -240,8 +675,7 @@ class RDFHandler:
 
     def export_to_turtle(self):
         """Export the graph as Turtle string."""
-        self.connect()
-        return self.graph.serialize(format="turtle")
+        return self.get_graph().serialize(format="turtle")
 
     @staticmethod
     def create_from_sqlite(sqlite_path, ttl_path):
@@ -254,26 +688,19 @@ class RDFHandler:
         conn.row_factory = sqlite3.Row
 
         handler = RDFHandler(ttl_path)
-        graph = Graph()
-        graph.bind("htfs", HTFS)
-        graph.bind("skos", SKOS)
-
-        # Export tag hierarchy from TAGLINKS
-        cursor = conn.execute("SELECT TAGID, TAGPARENTID FROM TAGLINKS;")
-        for row in cursor:
-            child_uri = HTFS[f"tag_{row['TAGID']}"]
-            parent_uri = HTFS[f"tag_{row['TAGPARENTID']}"]
-            graph.add((child_uri, SKOS.broader, parent_uri))
-
-        # Export resource-tag links from RESOURCELINKS
-        cursor = conn.execute("SELECT RESID, TAGID FROM RESOURCELINKS;")
-        for row in cursor:
-            res_uri = HTFS[f"resource_{row['RESID']}"]
-            tag_uri = HTFS[f"tag_{row['TAGID']}"]
-            graph.add((res_uri, HTFS.hasTag, tag_uri))
+        graph = graph_from_links(
+            # Tag hierarchy from TAGLINKS
+            ((row['TAGID'], row['TAGPARENTID']) for row in conn.execute("SELECT TAGID, TAGPARENTID FROM TAGLINKS;")),
+            # Resource-tag links from RESOURCELINKS
+            ((row['RESID'], row['TAGID']) for row in conn.execute("SELECT RESID, TAGID FROM RESOURCELINKS;")),
+        )
 
         graph.serialize(destination=ttl_path, format="turtle")
         conn.close()
+        # The rebuilt Turtle supersedes any journal or snapshot of the old one
+        for stale_path in (handler.journal_path, handler.snapshot_path, handler.bitmaps_path):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
         return handler
 
 
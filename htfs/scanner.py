@@ -0,0 +1,252 @@
+"""
+scanner - Parallel directory walks for bulk resource import and sanitize.
+
+scan_tree() lists the files below a directory with os.scandir, one directory
+per task on a thread pool, so a cold tree is walked with several stat/readdir
+calls in flight at once. Paths are filtered with glob patterns:
+
+  - exclude patterns (and those in `.tagfsignore` files) prune files and
+    whole directories; a trailing '/' restricts a pattern to directories
+  - include patterns, when given, keep only the files that match
+  - patterns containing '/' match the path relative to the scanned root,
+    or for patterns read from an ignore file, relative to the directory
+    holding that file; other patterns match the entry name
+
+Symlinks are not followed, and the tagfs database files are always skipped.
+
+find_missing() checks which tracked URLs no longer exist, with one
+os.scandir per parent directory on the same kind of thread pool.
+find_moved() walks the tree once, streaming, to find where missing
+resources went by their recorded device and inode.
+"""
+
+import os
+import logging
+from fnmatch import fnmatchcase
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+IGNORE_FILE = ".tagfsignore"
+_INTERNAL_PREFIX = ".tagfs"
+# Up to this many names in a directory are checked with lstat instead of a listing
+_STAT_LIMIT = 4
+
+logobj = logging.getLogger(__name__)
+
+
+def read_ignore_file(path) -> list:
+    """Read glob patterns from an ignore file, skipping blanks and '#' comments."""
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            lines = fp.read().splitlines()
+    except FileNotFoundError:
+        return []
+    except OSError as e:
+        logobj.warning("could not read %s: %s", path, e)
+        return []
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _anchored(patterns, prefix=""):
+    """Pair patterns with the path of the scanned root below the directory they are anchored at."""
+    return [(pattern, prefix) for pattern in patterns]
+
+
+def _matches(patterns, rel_path, name, is_dir):
+    for pattern, prefix in patterns:
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip("/")
+        target = prefix + rel_path if "/" in pattern else name
+        if fnmatchcase(target, pattern.lstrip("/")):
+            return True
+    return False
+
+
+def _scan_dir(path, rel_dir, include, exclude):
+    """List one directory. Returns (file paths, [(subdir path, subdir rel path)])."""
+    files, subdirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(_INTERNAL_PREFIX):
+                    continue
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                try:
+                    if entry.is_symlink():
+                        continue
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if _matches(exclude, rel_path, name, is_dir):
+                    continue
+                if is_dir:
+                    subdirs.append((entry.path, rel_path))
+                elif not include or _matches(include, rel_path, name, False):
+                    files.append(entry.path)
+    except OSError as e:
+        logobj.warning("could not scan %s: %s", path, e)
+    return files, subdirs
+
+
+def _worker_count(workers):
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 1) * 4)
+    return max(1, workers)
+
+
+def scan_tree(root, include=(), exclude=(), ignore_files=(), workers=None) -> list:
+    """
+    Return the paths of all files below root that pass the filters.
+
+    ignore_files lists extra ignore files to honour, in root or above it;
+    root's own `.tagfsignore` is always read. Results are sorted.
+    """
+    root = os.path.abspath(root)
+    include = _anchored(include)
+    exclude = _anchored(exclude)
+    for ignore_path in (*ignore_files, os.path.join(root, IGNORE_FILE)):
+        base = os.path.relpath(root, os.path.dirname(os.path.abspath(ignore_path)))
+        prefix = "" if base == "." else base.replace(os.sep, "/") + "/"
+        exclude.extend(_anchored(read_ignore_file(ignore_path), prefix))
+
+    files = []
+    with ThreadPoolExecutor(max_workers=_worker_count(workers)) as pool:
+        pending = {pool.submit(_scan_dir, root, "", include, exclude)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_files, subdirs = future.result()
+                files.extend(dir_files)
+                for path, rel_path in subdirs:
+                    pending.add(pool.submit(_scan_dir, path, rel_path, include, exclude))
+    files.sort()
+    return files
+
+
+def _is_missing(path):
+    try:
+        os.lstat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return True
+    except OSError as e:
+        logobj.warning("could not stat %s: %s", path, e)
+    return False
+
+
+def _missing_in_dir(path, names):
+    """The names not present in one directory (all of them if it is gone)."""
+    if len(names) <= _STAT_LIMIT:
+        # Cheaper than listing what may be a large directory
+        return [name for name in names if _is_missing(os.path.join(path, name))]
+    try:
+        with os.scandir(path) as entries:
+            present = {entry.name for entry in entries}
+    except (FileNotFoundError, NotADirectoryError):
+        return list(names)
+    except OSError as e:
+        # Unreadable is not missing: leave these resources alone
+        logobj.warning("could not scan %s: %s", path, e)
+        return []
+    return [name for name in names if name not in present]
+
+
+def find_missing(root, urls, workers=None) -> list:
+    """
+    Return the URLs (relative to root, '/'-separated) that do not exist.
+    URLs are grouped by parent directory, so each directory is listed once
+    however many tracked files it holds. Results are sorted.
+    """
+    by_dir = defaultdict(list)
+    for url in urls:
+        parent, _, name = url.rpartition("/")
+        by_dir[parent].append(name)
+
+    missing = []
+    with ThreadPoolExecutor(max_workers=_worker_count(workers)) as pool:
+        futures = {pool.submit(_missing_in_dir, os.path.join(root, parent), names): parent
+                   for parent, names in by_dir.items()}
+        for future, parent in futures.items():
+            prefix = parent + "/" if parent else ""
+            missing.extend(prefix + name for name in future.result())
+    missing.sort()
+    return missing
+
+
+def stat_fingerprint(st):
+    """
+    (st_dev, st_ino, st_size, st_mtime_ns) of a file. The device and inode
+    identify it across renames; size and mtime tell apart the files that
+    held a reused inode number.
+    """
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def iter_entries(root):
+    """
+    Yield (relative path, os.DirEntry) for every entry below root, depth
+    first, without following symlinks or listing the tagfs files. Only the
+    directories still to be visited are kept in memory.
+    """
+    stack = [(root, "")]
+    while stack:
+        path, rel_dir = stack.pop()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name.startswith(_INTERNAL_PREFIX):
+                        continue
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    yield rel_path, entry
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, rel_path))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logobj.warning("could not scan %s: %s", path, e)
+
+
+def find_moved(root, fingerprints) -> dict:
+    """
+    Walk root once and return {url: new url} for the URLs whose recorded
+    device and inode (see stat_fingerprint) belong to an entry at another
+    path, so files edited since they were recorded are found too.
+    fingerprints maps url -> fingerprint. When several URLs claim one entry,
+    or one URL several entries, a matching size and mtime wins, then the
+    most recently modified record. Only entries whose inode number is wanted
+    are stat'ed, and the walk stops once every URL has an exact match.
+    """
+    by_inode = defaultdict(list)
+    for url, fingerprint in fingerprints.items():
+        by_inode[fingerprint[1]].append((url, tuple(fingerprint)))
+
+    # url -> (rank, new url), keeping the best entry seen for each URL
+    best = {}
+    exact = 0
+    for rel_path, entry in iter_entries(root):
+        candidates = by_inode.get(entry.inode())
+        if not candidates:
+            continue
+        try:
+            fingerprint = stat_fingerprint(entry.stat(follow_symlinks=False))
+        except OSError:
+            continue
+        for url, wanted in candidates:
+            if url == rel_path or wanted[:2] != fingerprint[:2]:
+                continue
+            rank = (wanted == fingerprint, wanted[3])
+            if url not in best or rank[0] > best[url][0][0]:
+                exact += rank[0]
+                best[url] = (rank, rel_path)
+        if exact == len(fingerprints):
+            break
+
+    # Each entry goes to one URL only
+    claims = {}
+    for url, (rank, rel_path) in best.items():
+        if rel_path not in claims or rank > best[claims[rel_path]][0]:
+            claims[rel_path] = url
+    return {url: rel_path for rel_path, url in claims.items()}
@@ -0,0 +1,283 @@
+"""
+server - Keep an HTFS session loaded and serve CLI commands over a Unix socket.
+
+`tagfs serve` opens the boundary once and listens on `.tagfs.sock` inside
+it. The CLI first tries to forward its arguments there; when no server is
+running it executes in-process as before. One request per connection:
+
+    client → server:  JSON {"argv": [...], "cwd": "...", "stdin": "..."|null}
+                      followed by shutting down the write side
+    server → client:  one ACK byte as the command starts, then
+                      JSON {"code": int, "stdout": "...", "stderr": "..."}
+
+Requests are executed one at a time in the server's process with its cwd
+set to the client's, so relative paths behave exactly as in-process.
+A client that gets no ACK within CONNECT_TIMEOUT (a wedged or busy server)
+gives up and runs the command in-process; the server then fails to send
+the ACK to it and drops the request, so the command never runs twice.
+Once the ACK has arrived the client waits up to REPLY_TIMEOUT for the
+result, and reports an error rather than risk running it again.
+Changes are flushed to the journal after every command, and the session is
+reopened whenever another process has modified the database files.
+
+Every CLI invocation imports this module to try forwarding, so the socket
+and JSON modules are only imported once a socket file is actually found.
+"""
+
+import io
+import os
+import sys
+import logging
+
+from htfs.boundary import find_tagfs_boundary, storage_generation
+
+SOCKET_NAME = ".tagfs.sock"
+# Commands that must never be forwarded
+LOCAL_COMMANDS = frozenset(("init", "serve"))
+# Set to disable forwarding, e.g. when a server is being debugged
+NO_SERVER_ENV = "TAGFS_NO_SERVER"
+
+_LOG_FORMAT = logging.BASIC_FORMAT
+
+# Seconds to connect, send the request and have the server take it
+CONNECT_TIMEOUT = 1.0
+# Seconds to wait for the result of a command the server has started
+REPLY_TIMEOUT = 300.0
+ACK = b"\x06"
+
+logobj = logging.getLogger(__name__)
+
+
+def socket_path(tagfs_boundary):
+    return os.path.join(str(tagfs_boundary), SOCKET_NAME)
+
+
+def _recv_all(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+# -----------------------------------------------------------------------------
+# Client
+# -----------------------------------------------------------------------------
+
+def _wants_stdin(argv):
+    return "--stdin" in argv or "-" in argv
+
+
+def forward(argv, cwd=None, stdin=None):
+    """
+    Run a CLI command on the server for the boundary containing cwd.
+    Returns (code, stdout, stderr), or None if no server is reachable and
+    the command should run in-process.
+    """
+    if not argv or argv[0] in LOCAL_COMMANDS or os.environ.get(NO_SERVER_ENV):
+        return None
+    cwd = cwd or os.getcwd()
+    tagfs_boundary = find_tagfs_boundary(cwd)
+    if tagfs_boundary is None:
+        return None
+    path = socket_path(tagfs_boundary)
+    if not os.path.exists(path):
+        return None
+
+    import json
+    import socket
+
+    if stdin is None and _wants_stdin(argv):
+        stdin = sys.stdin.read()
+    request = json.dumps({"argv": list(argv), "cwd": cwd, "stdin": stdin}).encode("utf-8")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.settimeout(CONNECT_TIMEOUT)
+            conn.connect(path)
+            conn.sendall(request)
+            conn.shutdown(socket.SHUT_WR)
+            if conn.recv(len(ACK)) != ACK:
+                raise ValueError("no acknowledgement")
+        except (OSError, ValueError):
+            # Stale socket, or a server that went away or is wedged; it has
+            # not started the command. stdin was consumed only if the command
+            # needs it, so run it in-process with what was read
+            if stdin is not None:
+                sys.stdin = io.StringIO(stdin)
+            return None
+        try:
+            conn.settimeout(REPLY_TIMEOUT)
+            response = json.loads(_recv_all(conn).decode("utf-8"))
+        except (OSError, ValueError) as e:
+            return 1, "", f"tagfs serve started the command but gave no result: {e}\n"
+    return response["code"], response["stdout"], response["stderr"]
+
+
+# -----------------------------------------------------------------------------
+# Server
+# -----------------------------------------------------------------------------
+
+class _ServedSession:
+    """The server's HTFS as handed to CLI commands: close() only flushes."""
+
+    def __init__(self, htfs):
+        self._htfs = htfs
+
+    def __getattr__(self, name):
+        return getattr(self._htfs, name)
+
+    def close(self):
+        self._htfs.th.flush()
+
+
+class Server:
+    """Serves CLI commands for one tagfs boundary from a long-lived HTFS session."""
+
+    def __init__(self, tagfs_boundary):
+        self.tagfs_boundary = str(tagfs_boundary)
+        self.path = socket_path(self.tagfs_boundary)
+        self.htfs = None
+        self._generation = None
+        self._sock = None
+        self._running = False
+
+    def _session(self):
+        """Return the HTFS session, reopening it if another process changed the files."""
+        if self.htfs is not None and storage_generation(self.tagfs_boundary) != self._generation:
+            logobj.info("database changed on disk, reloading")
+            self.htfs.close()
+            self.htfs = None
+        if self.htfs is None:
+            from htfs.core import HTFS
+            self.htfs = HTFS(self.tagfs_boundary)
+        return self.htfs
+
+    def handle(self, request):
+        """Execute one request dict. Returns the response dict."""
+        import traceback
+        from contextlib import redirect_stdout, redirect_stderr
+        from htfs import cli
+
+        out, err = io.StringIO(), io.StringIO()
+        root = logging.getLogger()
+        saved_handlers, saved_stdin, saved_cwd = root.handlers[:], sys.stdin, os.getcwd()
+        handler = logging.StreamHandler(err)
+        handler.setFormatter(logging.Formatter(_LOG_FORMAT))
+        root.handlers[:] = [handler]
+        code = 1
+        try:
+            cwd = request.get("cwd") or self.tagfs_boundary
+            if find_tagfs_boundary(cwd) != self.tagfs_boundary:
+                raise ValueError(f"{cwd} is not served by this server")
+            os.chdir(cwd)
+            sys.stdin = io.StringIO(request.get("stdin") or "")
+            cli.use_session(_ServedSession(self._session()))
+            with redirect_stdout(out), redirect_stderr(err):
+                try:
+                    args = cli.create_parser().parse_args(request["argv"])
+                    command = cli.COMMANDS.get(args.command, cli.improper_usage)
+                    code = command(args)
+                except SystemExit as e:
+                    code = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            err.write(traceback.format_exc())
+        finally:
+            cli.use_session(None)
+            self._generation = storage_generation(self.tagfs_boundary)
+            os.chdir(saved_cwd)
+            sys.stdin = saved_stdin
+            root.handlers[:] = saved_handlers
+        return {"code": code, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+    def _bind(self):
+        import socket
+
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)  # left behind by a server that died
+            else:
+                raise RuntimeError(f"a server is already listening on {self.path}")
+            finally:
+                probe.close()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Create the socket owner-only: a chmod after bind() would leave a
+        # window in which another local user could connect
+        saved_umask = os.umask(0o077)
+        try:
+            self._sock.bind(self.path)
+        finally:
+            os.umask(saved_umask)
+        os.chmod(self.path, 0o600)
+        self._sock.listen(64)
+
+    def serve_forever(self):
+        """Accept and execute requests until stop() is called."""
+        import json
+
+        self._bind()
+        self._session()
+        self._generation = storage_generation(self.tagfs_boundary)
+        self._running = True
+        logobj.info("serving %s on %s", self.tagfs_boundary, self.path)
+        try:
+            while self._running:
+                try:
+                    conn, _ = self._sock.accept()
+                except OSError:
+                    if not self._running:
+                        break
+                    raise
+                with conn:
+                    try:
+                        # A client that never finishes its request must not wedge the server
+                        conn.settimeout(CONNECT_TIMEOUT)
+                        request = json.loads(_recv_all(conn).decode("utf-8"))
+                        # Fails if the client gave up waiting and ran the command itself
+                        conn.sendall(ACK)
+                        conn.settimeout(None)
+                        response = self.handle(request)
+                        conn.sendall(json.dumps(response).encode("utf-8"))
+                    except (OSError, ValueError) as e:
+                        logobj.warning("dropping request: %s", e)
+        finally:
+            self.close()
+
+    def stop(self):
+        """Stop accepting requests; safe to call from another thread or a signal handler."""
+        import socket
+
+        self._running = False
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self.htfs is not None:
+            self.htfs.close()
+            self.htfs = None
+
+
+def serve(tagfs_boundary):
+    """Run a server in the foreground until SIGINT/SIGTERM. Returns an exit code."""
+    import signal
+
+    server = Server(tagfs_boundary)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: server.stop())
+    try:
+        server.serve_forever()
+    except RuntimeError as e:
+        logobj.error("%s", e)
+        return 1
+    return 0
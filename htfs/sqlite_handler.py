@@ -1,9 +1,22 @@
 import os
 import sqlite3
 import logging
+from contextlib import contextmanager
 
 logobj = logging.getLogger(__name__)
 
+# Stay below SQLite's default limit on bound parameters
+CHUNK_SIZE = 900
+
+
+def _select_in(conn, query, ids):
+    """Run query once per chunk of ids, filling its `{}` with placeholders. Yields rows."""
+    ids = list(ids)
+    for i in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[i:i + CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        yield from conn.execute(query.format(placeholders), chunk)
+
 
 class SQLiteManager:
     """SQLite manager for fast ID lookups - url↔id, name↔id mappings."""
@@ -11,6 +24,7 @@ class SQLiteManager:
     def __init__(self, db_path):
         self.db_path = db_path
         self.conn = None
+        self._batch_depth = 0
 
     def connect(self):
         if self.conn is None:
@@ -23,6 +37,31 @@ class SQLiteManager:
             self.conn.close()
             self.conn = None
 
+    def commit(self):
+        """Commit, unless a transaction() block is deferring commits to its end."""
+        if not self._batch_depth:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Defer repository commits to the end of the block: one commit on
+        success, a rollback if the block raises. Nested blocks join the
+        outermost one.
+        """
+        self.connect()
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.conn.rollback()
+            raise
+        self._batch_depth -= 1
+        if not self._batch_depth:
+            self.conn.commit()
+
     def initialize_schema(self):
         conn = self.connect()
         cursor = conn.cursor()
@@ -56,6 +95,9 @@ class SQLiteManager:
         cursor.execute('INSERT OR IGNORE INTO ID_SEQUENCES (NAME, MAX_ID) VALUES ("RESOURCE", 0);')
 
         conn.commit()
+        SettingsRepository(self).create_table()
+        TagClosureRepository(self).create_table()
+        ResourceStatRepository(self).create_table()
 
     def __enter__(self):
         self.connect()
@@ -87,6 +129,11 @@ class TagRepository:
         row = res.fetchone()
         return row[0] if row else ""
 
+    def get_tag_names(self, tag_ids) -> dict:
+        """Map each existing tag ID to its name in chunked queries."""
+        query = "SELECT ID, TAGNAME FROM TAGS WHERE ID IN ({});"
+        return {row[0]: row[1] for row in _select_in(self.conn, query, tag_ids)}
+
     def get_tag_list(self) -> list:
         query = "SELECT TAGNAME FROM TAGS WHERE ID > 0 ORDER BY TAGNAME;"
         res = self.conn.execute(query)
@@ -117,7 +164,7 @@ class TagRepository:
             "UPDATE ID_SEQUENCES SET MAX_ID=? WHERE NAME='TAG';",
             (new_id,)
         )
-        self.conn.commit()
+        self.db_manager.commit()
         return new_id
 
     def add_tag_with_id(self, tag_name, tag_id) -> bool:
@@ -133,7 +180,7 @@ class TagRepository:
             "UPDATE ID_SEQUENCES SET MAX_ID=? WHERE NAME='TAG' AND MAX_ID < ?;",
             (tag_id, tag_id)
         )
-        self.conn.commit()
+        self.db_manager.commit()
         return True
 
     def rename_tag(self, tag_name, new_tag_name) -> bool:
@@ -146,7 +193,7 @@ class TagRepository:
             "UPDATE TAGS SET TAGNAME=? WHERE ID=?;",
             (new_tag_name, tag_id)
         )
-        self.conn.commit()
+        self.db_manager.commit()
         return True
 
     def delete_tag(self, tag_id) -> bool:
@@ -154,7 +201,7 @@ class TagRepository:
         if tag_id < 0:
             return False
         cursor = self.conn.execute("DELETE FROM TAGS WHERE ID=?;", (tag_id,))
-        self.conn.commit()
+        self.db_manager.commit()
         return cursor.rowcount > 0
 
     def get_max_tag_id(self) -> int:
@@ -182,12 +229,37 @@ class ResourceRepository:
         row = res.fetchone()
         return row[0] if row else -1
 
+    def get_resource_ids_by_url(self, resource_urls) -> dict:
+        """Map each tracked URL among resource_urls to its ID in chunked queries."""
+        query = "SELECT URL, ID FROM RESOURCES WHERE URL IN ({});"
+        return {row[0]: row[1] for row in _select_in(self.conn, query, resource_urls)}
+
     def get_resource_url(self, resource_id) -> str:
         query = "SELECT URL FROM RESOURCES WHERE ID=?;"
         res = self.conn.execute(query, (resource_id,))
         row = res.fetchone()
         return row[0] if row else ""
 
+    def get_resource_urls(self, resource_ids) -> dict:
+        """Map each existing resource ID to its URL in chunked queries."""
+        query = "SELECT ID, URL FROM RESOURCES WHERE ID IN ({});"
+        return {row[0]: row[1] for row in _select_in(self.conn, query, resource_ids)}
+
+    def get_resource_urls_under(self, directory) -> list:
+        """
+        All URLs below a normalized directory ('.' or '' for everything).
+        Uses a range scan on URL_INDEX: 'dir/' <= URL < 'dir0' ('0' follows '/').
+        """
+        if directory in ("", "."):
+            res = self.conn.execute("SELECT URL FROM RESOURCES;")
+        else:
+            directory = directory.rstrip("/")
+            res = self.conn.execute(
+                "SELECT URL FROM RESOURCES WHERE URL >= ? AND URL < ?;",
+                (directory + "/", directory + "0")
+            )
+        return [row[0] for row in res]
+
     def get_resource_ids(self) -> list:
         query = "SELECT ID FROM RESOURCES WHERE ID > 0;"
         res = self.conn.execute(query)
@@ -211,9 +283,34 @@ class ResourceRepository:
             "UPDATE ID_SEQUENCES SET MAX_ID=? WHERE NAME='RESOURCE';",
             (new_id,)
         )
-        self.conn.commit()
+        self.db_manager.commit()
         return new_id
 
+    def add_resources(self, resource_urls) -> dict:
+        """
+        Insert untracked URLs with one block of IDs from ID_SEQUENCES.
+        The URLs must be distinct. Returns {url: new_id}.
+        """
+        if not resource_urls:
+            return {}
+        cursor = self.conn.execute(
+            "SELECT MAX_ID FROM ID_SEQUENCES WHERE NAME='RESOURCE';"
+        )
+        row = cursor.fetchone()
+        first_id = (row[0] if row else 0) + 1
+        new_ids = {url: first_id + i for i, url in enumerate(resource_urls)}
+
+        self.conn.executemany(
+            "INSERT INTO RESOURCES (ID, URL) VALUES (?, ?);",
+            ((res_id, url) for url, res_id in new_ids.items())
+        )
+        self.conn.execute(
+            "UPDATE ID_SEQUENCES SET MAX_ID=? WHERE NAME='RESOURCE';",
+            (first_id + len(new_ids) - 1,)
+        )
+        self.db_manager.commit()
+        return new_ids
+
     def add_resource_with_id(self, resource_url, resource_id) -> bool:
         """Add a resource with a pre-allocated ID (for RDF sync)."""
         if self.get_resource_id(resource_url) > 0:
@@ -227,7 +324,7 @@ class ResourceRepository:
             "UPDATE ID_SEQUENCES SET MAX_ID=? WHERE NAME='RESOURCE' AND MAX_ID < ?;",
             (resource_id, resource_id)
         )
-        self.conn.commit()
+        self.db_manager.commit()
         return True
 
     def delete_resource(self, resource_url) -> bool:
@@ -235,7 +332,7 @@ class ResourceRepository:
         if res_id < 0:
             return False
         self.conn.execute("DELETE FROM RESOURCES WHERE ID=?;", (res_id,))
-        self.conn.commit()
+        self.db_manager.commit()
         return res_id
 
     def update_resource_url(self, old_url, new_url) -> bool:
@@ -248,9 +345,32 @@ class ResourceRepository:
             "UPDATE RESOURCES SET URL=? WHERE ID=?;",
             (new_url, res_id)
         )
-        self.conn.commit()
+        self.db_manager.commit()
         return True
 
+    def update_resource_url_prefix(self, old_directory, new_directory) -> int:
+        """
+        Rewrite every URL below old_directory to sit below new_directory in a
+        single UPDATE over the URL_INDEX range of get_resource_urls_under().
+        Returns the number of URLs rewritten, or -1 if one would collide with
+        an already tracked URL (nothing is changed then).
+        """
+        old_directory = old_directory.rstrip("/")
+        new_directory = new_directory.rstrip("/")
+        if old_directory in ("", ".") or new_directory in ("", "."):
+            return -1
+        try:
+            cursor = self.conn.execute(
+                "UPDATE RESOURCES SET URL = ? || substr(URL, ?) WHERE URL >= ? AND URL < ?;",
+                (new_directory, len(old_directory) + 1, old_directory + "/", old_directory + "0")
+            )
+        except sqlite3.IntegrityError:
+            logobj.error("cannot move %s to %s: a resource below it is already tracked there",
+                         old_directory, new_directory)
+            return -1
+        self.db_manager.commit()
+        return cursor.rowcount
+
     def get_max_resource_id(self) -> int:
         """Get the current max resource ID from sequences."""
         cursor = self.conn.execute(
@@ -259,5 +379,178 @@ class ResourceRepository:
         row = cursor.fetchone()
         return row[0] if row else 0
 
-    # Note: Resource-Tag links are now managed by RDFHandler
-    # These are kept for compatibility but should not be used
+    # Note: Resource-Tag links are managed by the link backend
+    # (DatabaseManager.links), not by this repository
+
+
+class SettingsRepository:
+    """Per-boundary options stored as NAME → VALUE rows."""
+
+    def __init__(self, db_manager: SQLiteManager):
+        self.db_manager = db_manager
+
+    @property
+    def conn(self):
+        return self.db_manager.conn
+
+    def create_table(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS SETTINGS (
+                NAME TEXT PRIMARY KEY NOT NULL,
+                VALUE TEXT NOT NULL
+            );
+        ''')
+        self.db_manager.commit()
+
+    def get(self, name, default=None):
+        try:
+            row = self.conn.execute("SELECT VALUE FROM SETTINGS WHERE NAME=?;", (name,)).fetchone()
+        except sqlite3.OperationalError:
+            # Databases created before settings existed have no table
+            return default
+        return row[0] if row else default
+
+    def set(self, name, value):
+        self.create_table()
+        self.conn.execute("INSERT OR REPLACE INTO SETTINGS (NAME, VALUE) VALUES (?, ?);", (name, value))
+        self.db_manager.commit()
+
+
+class ResourceStatRepository:
+    """
+    The (st_dev, st_ino, st_size, st_mtime_ns) of each resource when it was
+    last seen, used to find resources moved while no daemon was watching.
+    """
+
+    def __init__(self, db_manager: SQLiteManager):
+        self.db_manager = db_manager
+
+    @property
+    def conn(self):
+        return self.db_manager.conn
+
+    def create_table(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS RESOURCESTATS (
+                ID INTEGER PRIMARY KEY NOT NULL,
+                DEV INTEGER NOT NULL,
+                INO INTEGER NOT NULL,
+                SIZE INTEGER NOT NULL,
+                MTIME INTEGER NOT NULL
+            );
+        ''')
+        self.db_manager.commit()
+
+    def set_stats(self, stats):
+        """Store {resource_id: (dev, ino, size, mtime_ns)}."""
+        self.create_table()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO RESOURCESTATS (ID, DEV, INO, SIZE, MTIME) VALUES (?, ?, ?, ?, ?);",
+            ((res_id, *stat) for res_id, stat in stats.items())
+        )
+        self.db_manager.commit()
+
+    def get_stats(self, resource_ids) -> dict:
+        """Map each resource ID with a stored stat to (dev, ino, size, mtime_ns)."""
+        query = "SELECT ID, DEV, INO, SIZE, MTIME FROM RESOURCESTATS WHERE ID IN ({});"
+        try:
+            return {row[0]: tuple(row[1:]) for row in _select_in(self.conn, query, resource_ids)}
+        except sqlite3.OperationalError:
+            # Databases created before stats were recorded have no table
+            return {}
+
+    def delete_stats(self, resource_id):
+        try:
+            self.conn.execute("DELETE FROM RESOURCESTATS WHERE ID=?;", (resource_id,))
+        except sqlite3.OperationalError:
+            return
+        self.db_manager.commit()
+
+
+class TagClosureRepository:
+    """
+    Materialized transitive closure of the tag hierarchy.
+
+    TAGCLOSURE holds one (ANCESTOR, DESCENDANT) row for every pair of tags
+    connected by one or more skos:broader steps, so descendant lookups are a
+    single indexed read. Reflexive pairs are not stored.
+    """
+
+    def __init__(self, db_manager: SQLiteManager):
+        self.db_manager = db_manager
+
+    @property
+    def conn(self):
+        return self.db_manager.conn
+
+    def exists(self) -> bool:
+        query = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='TAGCLOSURE';"
+        return self.conn.execute(query).fetchone() is not None
+
+    def create_table(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS TAGCLOSURE (
+                ANCESTOR INTEGER NOT NULL,
+                DESCENDANT INTEGER NOT NULL,
+                PRIMARY KEY (ANCESTOR, DESCENDANT)
+            ) WITHOUT ROWID;
+        ''')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS TAGCLOSURE_DESCENDANT_INDEX ON TAGCLOSURE(DESCENDANT, ANCESTOR);'
+        )
+        self.db_manager.commit()
+
+    def _select_in(self, query, ids) -> set:
+        return {row[0] for row in _select_in(self.conn, query, ids)}
+
+    def get_descendant_ids(self, tag_ids) -> set:
+        """All proper descendants of the given tags."""
+        return self._select_in(
+            "SELECT DESCENDANT FROM TAGCLOSURE WHERE ANCESTOR IN ({});", tag_ids
+        )
+
+    def get_ancestor_ids(self, tag_ids) -> set:
+        """All proper ancestors of the given tags."""
+        return self._select_in(
+            "SELECT ANCESTOR FROM TAGCLOSURE WHERE DESCENDANT IN ({});", tag_ids
+        )
+
+    def get_all_pairs(self) -> set:
+        res = self.conn.execute("SELECT ANCESTOR, DESCENDANT FROM TAGCLOSURE;")
+        return {(row[0], row[1]) for row in res}
+
+    def add_link(self, tag_id, parent_tag_id):
+        """Connect every ancestor of the parent (and itself) to every descendant of the tag (and itself)."""
+        ancestors = self.get_ancestor_ids([parent_tag_id]) | {parent_tag_id}
+        descendants = self.get_descendant_ids([tag_id]) | {tag_id}
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO TAGCLOSURE (ANCESTOR, DESCENDANT) VALUES (?, ?);",
+            ((a, d) for a in ancestors for d in descendants if a != d)
+        )
+        self.db_manager.commit()
+
+    def set_ancestors(self, ancestors_by_tag):
+        """Replace the ancestor rows of each tag in {tag_id: ancestor_ids}."""
+        for tag_id, ancestor_ids in ancestors_by_tag.items():
+            self.conn.execute("DELETE FROM TAGCLOSURE WHERE DESCENDANT=?;", (tag_id,))
+            self.conn.executemany(
+                "INSERT INTO TAGCLOSURE (ANCESTOR, DESCENDANT) VALUES (?, ?);",
+                ((a, tag_id) for a in ancestor_ids if a != tag_id)
+            )
+        self.db_manager.commit()
+
+    def delete_tag(self, tag_id):
+        """Drop every row that mentions a tag."""
+        self.conn.execute(
+            "DELETE FROM TAGCLOSURE WHERE ANCESTOR=? OR DESCENDANT=?;", (tag_id, tag_id)
+        )
+        self.db_manager.commit()
+
+    def replace_all(self, pairs):
+        """Replace the whole table with the given (ancestor, descendant) pairs."""
+        self.conn.execute("DELETE FROM TAGCLOSURE;")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO TAGCLOSURE (ANCESTOR, DESCENDANT) VALUES (?, ?);",
+            ((a, d) for a, d in pairs if a != d)
+        )
+        self.db_manager.commit()
@@ -0,0 +1,208 @@
+"""
+sqlite_links - The "sqlite" link backend (see link_backend).
+
+Kept apart from sqlite_handler so that commands which only look up IDs do
+not import the link backend interface or the bitmap index.
+"""
+
+from htfs.bitmap_index import Bitmap
+from htfs.link_backend import LinkBackend
+from htfs.sqlite_handler import SQLiteManager, _select_in
+
+
+class SQLiteLinkHandler(LinkBackend):
+    """
+    Link backend keeping relationships in the boundary's SQLite database.
+
+    TAGLINKS (TAGID, TAGPARENTID) holds the hierarchy and RESOURCELINKS
+    (RESID, TAGID) the resource tags. Each table is keyed by its pair and
+    indexed in the reverse direction, so lookups either way are index range
+    scans; closures are recursive CTEs. Writes use the shared connection and
+    commit with the ID tables (or with the enclosing transaction), so there
+    is no in-memory state to save or roll back.
+
+    A read-only handler never creates the tables; if they are missing it
+    reads as having no links.
+    """
+
+    def __init__(self, db_manager: SQLiteManager, read_only=False):
+        self.db_manager = db_manager
+        self.read_only = read_only
+        self._tables_ready = False
+        self._tables_missing = False
+
+    @property
+    def conn(self):
+        return self.db_manager.conn
+
+    def connect(self):
+        self.db_manager.connect()
+        if not self._tables_ready:
+            if self.read_only:
+                self._tables_missing = not self._tables_exist()
+            else:
+                self.create_tables()
+            self._tables_ready = True
+        return self
+
+    def _tables_exist(self) -> bool:
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ('TAGLINKS', 'RESOURCELINKS');"
+        ).fetchone()
+        return row[0] == 2
+
+    def create_tables(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS TAGLINKS (
+                TAGID INTEGER NOT NULL,
+                TAGPARENTID INTEGER NOT NULL,
+                PRIMARY KEY (TAGID, TAGPARENTID)
+            ) WITHOUT ROWID;
+        ''')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS TAGLINKS_PARENT_INDEX ON TAGLINKS(TAGPARENTID, TAGID);'
+        )
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS RESOURCELINKS (
+                RESID INTEGER NOT NULL,
+                TAGID INTEGER NOT NULL,
+                PRIMARY KEY (RESID, TAGID)
+            ) WITHOUT ROWID;
+        ''')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS RESOURCELINKS_TAG_INDEX ON RESOURCELINKS(TAGID, RESID);'
+        )
+        self.db_manager.commit()
+
+    def close(self):
+        """Nothing to persist; the connection belongs to the SQLiteManager."""
+        self._tables_ready = False
+        self._tables_missing = False
+
+    def flush(self):
+        pass
+
+    def savepoint(self):
+        return None
+
+    def rollback(self, savepoint):
+        """Nothing to undo: the SQLite rollback covers the link tables too."""
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"relationships opened read-only: {self.db_manager.db_path}")
+
+    def _write(self, query, params=()):
+        self._check_writable()
+        self.connect()
+        self.conn.execute(query, params)
+        self.db_manager.commit()
+
+    def _rows(self, query, params=()):
+        self.connect()
+        if self._tables_missing:
+            return []
+        return self.conn.execute(query, params)
+
+    def _ids(self, query, params=()) -> list:
+        return [row[0] for row in self._rows(query, params)]
+
+    def _ids_in(self, query, ids) -> set:
+        self.connect()
+        if self._tables_missing:
+            return set()
+        return {row[0] for row in _select_in(self.conn, query, ids)}
+
+    def replace_all(self, tag_links, resource_links):
+        self._check_writable()
+        self.connect()
+        self.conn.execute("DELETE FROM TAGLINKS;")
+        self.conn.execute("DELETE FROM RESOURCELINKS;")
+        self.conn.executemany("INSERT OR IGNORE INTO TAGLINKS (TAGID, TAGPARENTID) VALUES (?, ?);", tag_links)
+        self.conn.executemany("INSERT OR IGNORE INTO RESOURCELINKS (RESID, TAGID) VALUES (?, ?);", resource_links)
+        self.db_manager.commit()
+
+    # -------------------------------------------------------------------------
+    # Tag Hierarchy (TAGLINKS)
+    # -------------------------------------------------------------------------
+
+    def add_tag_link(self, tag_id, parent_tag_id):
+        self._write("INSERT OR IGNORE INTO TAGLINKS (TAGID, TAGPARENTID) VALUES (?, ?);", (tag_id, parent_tag_id))
+
+    def remove_tag_link(self, tag_id, parent_tag_id):
+        self._write("DELETE FROM TAGLINKS WHERE TAGID=? AND TAGPARENTID=?;", (tag_id, parent_tag_id))
+
+    def get_parent_tag_ids(self, tag_id) -> list:
+        return self._ids("SELECT TAGPARENTID FROM TAGLINKS WHERE TAGID=?;", (tag_id,))
+
+    def get_child_tag_ids(self, tag_id) -> list:
+        return self._ids("SELECT TAGID FROM TAGLINKS WHERE TAGPARENTID=?;", (tag_id,))
+
+    def get_tag_closure_ids(self, tag_ids) -> set:
+        """The given tags and all their descendants. UNION stops at cycles."""
+        tag_ids = set(tag_ids)
+        return tag_ids | self._ids_in('''
+            WITH RECURSIVE DESCENDANTS(ID) AS (
+                SELECT TAGID FROM TAGLINKS WHERE TAGPARENTID IN ({})
+                UNION
+                SELECT TAGLINKS.TAGID FROM TAGLINKS JOIN DESCENDANTS ON TAGLINKS.TAGPARENTID = DESCENDANTS.ID
+            )
+            SELECT ID FROM DESCENDANTS;
+        ''', tag_ids)
+
+    def get_tag_ancestor_ids(self, tag_ids) -> set:
+        """The given tags and all their ancestors."""
+        tag_ids = set(tag_ids)
+        return tag_ids | self._ids_in('''
+            WITH RECURSIVE ANCESTORS(ID) AS (
+                SELECT TAGPARENTID FROM TAGLINKS WHERE TAGID IN ({})
+                UNION
+                SELECT TAGLINKS.TAGPARENTID FROM TAGLINKS JOIN ANCESTORS ON TAGLINKS.TAGID = ANCESTORS.ID
+            )
+            SELECT ID FROM ANCESTORS;
+        ''', tag_ids)
+
+    def get_all_tag_links(self) -> list:
+        return [(row[0], row[1]) for row in self._rows("SELECT TAGID, TAGPARENTID FROM TAGLINKS;")]
+
+    def remove_all_links_for_tag(self, tag_id):
+        self._check_writable()
+        self.connect()
+        self.conn.execute("DELETE FROM TAGLINKS WHERE TAGID=? OR TAGPARENTID=?;", (tag_id, tag_id))
+        self.conn.execute("DELETE FROM RESOURCELINKS WHERE TAGID=?;", (tag_id,))
+        self.db_manager.commit()
+
+    # -------------------------------------------------------------------------
+    # Resource Tags (RESOURCELINKS)
+    # -------------------------------------------------------------------------
+
+    def add_resource_tag_link(self, resource_id, tag_id):
+        self._write("INSERT OR IGNORE INTO RESOURCELINKS (RESID, TAGID) VALUES (?, ?);", (resource_id, tag_id))
+
+    def add_resource_tag_links(self, links):
+        self._check_writable()
+        self.connect()
+        self.conn.executemany("INSERT OR IGNORE INTO RESOURCELINKS (RESID, TAGID) VALUES (?, ?);", links)
+        self.db_manager.commit()
+
+    def remove_resource_tag_link(self, resource_id, tag_id):
+        self._write("DELETE FROM RESOURCELINKS WHERE RESID=? AND TAGID=?;", (resource_id, tag_id))
+
+    def remove_all_tags_for_resource(self, resource_id):
+        self._write("DELETE FROM RESOURCELINKS WHERE RESID=?;", (resource_id,))
+
+    def get_resource_tag_ids(self, resource_id) -> list:
+        return self._ids("SELECT TAGID FROM RESOURCELINKS WHERE RESID=?;", (resource_id,))
+
+    def get_resources_by_tag_ids(self, tag_ids, closed=False) -> list:
+        if not tag_ids:
+            return []
+        if not closed:
+            tag_ids = self.get_tag_closure_ids(tag_ids)
+        return sorted(self._ids_in("SELECT RESID FROM RESOURCELINKS WHERE TAGID IN ({});", tag_ids))
+
+    def get_resource_bitmap(self, tag_ids):
+        return Bitmap.from_ids(self._ids_in("SELECT RESID FROM RESOURCELINKS WHERE TAGID IN ({});", tag_ids))
+
+    def get_all_resource_tag_links(self) -> list:
+        return [(row[0], row[1]) for row in self._rows("SELECT RESID, TAGID FROM RESOURCELINKS;")]
@@ -22,7 +22,7 @@ class TagService:
     The RDF graph is loaded lazily and serialized only on close().
     """
 
-    def __init__(self, db_path_or_boundary):
+    def __init__(self, db_path_or_boundary, read_only=False):
         """
         Initialize TagService.
 
@@ -30,6 +30,7 @@ class TagService:
             db_path_or_boundary: Either a path to .tagfs.db or a directory boundary.
                                  If it ends with .db, it's treated as the db path.
                                  Otherwise, it's treated as the tagfs boundary.
+            read_only: Open relationships read-only (memory-mapped snapshot).
         """
         path = Path(db_path_or_boundary)
         if path.suffix == ".db":
@@ -38,7 +39,7 @@ class TagService:
         else:
             self.tagfs_boundary = path
 
-        self.db = DatabaseManager(str(self.tagfs_boundary))
+        self.db = DatabaseManager(str(self.tagfs_boundary), read_only=read_only)
         self.db.connect()
 
     def __del__(self):
@@ -47,9 +48,17 @@ class TagService:
         except Exception:
             pass
 
-    def initialize(self):
-        """Initialize the database schema."""
-        self.db.initialize()
+    def initialize(self, link_backend=None):
+        """Initialize the database schema, optionally choosing the link backend."""
+        return self.db.initialize(link_backend)
+
+    def get_link_backend(self):
+        """Name of the backend storing tag and resource links."""
+        return self.db.get_link_backend()
+
+    def set_link_backend(self, backend):
+        """Move all links to another backend ('rdf' or 'sqlite')."""
+        return self.db.set_link_backend(backend)
 
     def close(self):
         """Close the database, serializing RDF if dirty."""
@@ -59,6 +68,10 @@ class TagService:
         """Force-save RDF to disk."""
         self.db.flush()
 
+    def transaction(self):
+        """Context manager committing all changes in the block at once (see DatabaseManager)."""
+        return self.db.transaction()
+
     # -------------------------------------------------------------------------
     # Tag Operations
     # -------------------------------------------------------------------------
@@ -120,24 +133,29 @@ class TagService:
         if not tag_ids:
             return []
 
-        closure_ids = self.db.get_tag_closure_ids(tag_ids)
-        return [self.db.get_tag_name(tid) for tid in closure_ids if self.db.get_tag_name(tid)]
+        return self.db.get_tag_names(self.db.get_tag_closure_ids(tag_ids))
+
+    def rebuild_tag_closure(self):
+        """Rebuild the materialized tag closure from the hierarchy."""
+        return self.db.rebuild_tag_closure()
+
+    def check_tag_closure(self):
+        """Return (missing, extra) closure pairs compared with the hierarchy."""
+        return self.db.check_tag_closure()
 
     def get_parent_tags(self, tag_name):
         """Get immediate parent tag names."""
         tag_id = self.db.get_tag_id(tag_name)
         if tag_id < 0:
             return []
-        parent_ids = self.db.get_parent_tag_ids(tag_id)
-        return [self.db.get_tag_name(tid) for tid in parent_ids if self.db.get_tag_name(tid)]
+        return self.db.get_tag_names(self.db.get_parent_tag_ids(tag_id))
 
     def get_child_tags(self, tag_name):
         """Get immediate child tag names."""
         tag_id = self.db.get_tag_id(tag_name)
         if tag_id < 0:
             return []
-        child_ids = self.db.get_child_tag_ids(tag_id)
-        return [self.db.get_tag_name(tid) for tid in child_ids if self.db.get_tag_name(tid)]
+        return self.db.get_tag_names(self.db.get_child_tag_ids(tag_id))
 
     # -------------------------------------------------------------------------
     # Resource Operations
@@ -147,14 +165,30 @@ class TagService:
         """Add a resource. Returns resource ID if new, -1 if exists."""
         return self.db.add_resource(resource_url)
 
+    def add_resources(self, resource_urls):
+        """Add many resources. Returns {url: resource_id}, new or existing."""
+        return self.db.add_resources(resource_urls)
+
     def get_resource_id(self, resource_url):
         """Get resource ID by URL."""
         return self.db.get_resource_id(resource_url)
 
+    def get_resource_ids_by_url(self, resource_urls):
+        """Get {url: resource ID} for the tracked URLs among resource_urls."""
+        return self.db.get_resource_ids_by_url(resource_urls)
+
     def get_resource_url(self, res_id):
         """Get resource URL by ID."""
         return self.db.get_resource_url(res_id)
 
+    def get_resource_urls(self, res_ids):
+        """Get resource URLs for many IDs at once, in input order."""
+        return self.db.get_resource_urls(res_ids)
+
+    def get_resource_urls_under(self, directory):
+        """Get the URLs of all resources below a normalized directory."""
+        return self.db.get_resource_urls_under(directory)
+
     def get_resource_ids(self):
         """Get all resource IDs."""
         return self.db.get_resource_ids()
@@ -167,6 +201,30 @@ class TagService:
         """Update a resource's URL."""
         return self.db.update_resource_url(resource_url, new_resource_url)
 
+    def update_resource_url_prefix(self, directory, new_directory):
+        """Update the URLs of all resources below a directory."""
+        return self.db.update_resource_url_prefix(directory, new_directory)
+
+    def set_resource_stats(self, stats):
+        """Record {resource ID: (dev, ino, size, mtime_ns)}."""
+        self.db.set_resource_stats(stats)
+
+    def get_resource_stats(self, res_ids):
+        """Get the recorded (dev, ino, size, mtime_ns) by resource ID."""
+        return self.db.get_resource_stats(res_ids)
+
+    def move_resource(self, resource_url, new_resource_url):
+        """
+        Move a resource, and for a directory every resource below it, in one
+        transaction. Returns False if nothing was moved.
+        """
+        with self.db.transaction():
+            moved_below = self.db.update_resource_url_prefix(resource_url, new_resource_url)
+            if moved_below < 0:
+                return False
+            moved = self.db.update_resource_url(resource_url, new_resource_url)
+        return moved or moved_below > 0
+
     # -------------------------------------------------------------------------
     # Resource-Tag Operations
     # -------------------------------------------------------------------------
@@ -178,6 +236,13 @@ class TagService:
         """
         return self.db.add_resource_tags(resource_url, tags)
 
+    def tag_resources(self, resource_tags):
+        """
+        Add tags to many resources from (resource_url, tags) pairs.
+        Returns {resource_url: unsuccessful tag names} for resources with failures.
+        """
+        return self.db.tag_resources(resource_tags)
+
     def del_resource_tags(self, resource_url, tags):
         """Remove tags from a resource. Returns list of unsuccessful tag names."""
         return self.db.del_resource_tags(resource_url, tags)
@@ -186,6 +251,10 @@ class TagService:
         """Get all tag names for a resource."""
         return self.db.get_resource_tags(resource_url)
 
+    def get_resources_tags(self, resource_urls):
+        """Get tag names for many resources. Returns {url: [tags]} for tracked URLs."""
+        return self.db.get_resources_tags(resource_urls)
+
     def get_resources_by_tag(self, tags):
         """
         Get resources that have ALL the given tags (AND semantics).
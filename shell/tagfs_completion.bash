@@ -4,7 +4,7 @@ _tagfs_completions()
 {
   if [ "${#COMP_WORDS[@]}" == "2" ]; then
     # shellcheck disable=SC2207
-    COMPREPLY=($(compgen -W "init getboundary lstags addtags renametag rmtag linktags addresource tagresource untagresource lsresources rmresource mvresource getresourcetags rmresourcetags help" "${COMP_WORDS[1]}"))
+    COMPREPLY=($(compgen -W "init getboundary lstags addtags renametag rmtag linktags addresource tagresource untagresource lsresources rmresource mvresource sanitize relocate getresourcetags rmresourcetags ls linkbackend prompt serve help" "${COMP_WORDS[1]}"))
   fi
 
   if [ "${#COMP_WORDS[@]}" == "3" ]; then
@@ -39,6 +39,11 @@ _tagfs_completions()
       COMPREPLY=($(compgen -f -- "${COMP_WORDS[2]}"))
     fi
 
+    if [ "${COMP_WORDS[1]}" == "ls" ]; then
+      # shellcheck disable=SC2207
+      COMPREPLY=($(compgen -d -- "${COMP_WORDS[2]}"))
+    fi
+
     if [ "${COMP_WORDS[1]}" == "rmresourcetags" ]; then
       # shellcheck disable=SC2207
       COMPREPLY=($(compgen -f -- "${COMP_WORDS[2]}"))
@@ -4,12 +4,41 @@ Tagfs Inotify Daemon - Automatically tracks file moves within the tagfs boundary
 
 Monitors filesystem events and updates resource URLs when files are moved/renamed.
 Requires inotify (Linux only): pip install inotify
+
+Moves are group-committed: matched moves are buffered for up to
+commit_window seconds (or commit_events moves, whichever comes first) and
+applied in a single transaction, so an `mv` storm costs one SQLite commit per
+window instead of one per file. Relationship state is flushed every
+flush_interval seconds and on SIGTERM, which bounds what a crash can lose.
+
+IN_MOVED_FROM events wait in a cookie-keyed dict for their IN_MOVED_TO. One
+that is still unmatched after cookie_timeout seconds was moved out of the
+boundary, and its resources are untracked.
+
+By default every directory in the boundary is watched (InotifyTree). With
+watch="tracked" only the directories holding tracked resources and their
+ancestors are watched, so the watch count follows the tracked data instead of
+the whole tree. The set is kept up to date as moves are applied and when
+another process changes the database. A move into an unwatched directory is
+then indistinguishable from one out of the boundary, so in this mode expired
+moves are reported but their resources stay tracked.
+
+Whether an event concerns a tracked resource is answered from a TrackedIndex
+held in memory, so the stream of renames of temporary and build files that
+are never tracked costs no syscalls or queries. The index is updated with
+every committed move and reloaded when another process changes the database;
+the HTFS session is then reopened as well, so untracking works from the
+current tags rather than those loaded at start-up.
 """
 
 import os
 import sys
+import time
+import signal
 import logging
+import argparse
 from pathlib import Path
+from collections import OrderedDict
 
 try:
     if sys.platform.startswith("linux"):
@@ -20,10 +49,108 @@ except ImportError:
     inotify = None
 
 from htfs import HTFS, find_tagfs_boundary
+from htfs.boundary import storage_generation
 
-logging.basicConfig(level='INFO')
 logobj = logging.getLogger(__name__)
 
+DEFAULT_COMMIT_WINDOW = 0.2     # seconds a move may wait before it is committed
+DEFAULT_COMMIT_EVENTS = 256     # pending moves that force an early commit
+DEFAULT_FLUSH_INTERVAL = 5.0    # seconds between relationship flushes
+DEFAULT_COOKIE_TIMEOUT = 1.0    # seconds an IN_MOVED_FROM waits for its IN_MOVED_TO
+
+WATCH_TREE = "tree"          # every directory below the boundary
+WATCH_TRACKED = "tracked"    # only directories that lead to tracked resources
+WATCH_MODES = (WATCH_TREE, WATCH_TRACKED)
+WATCH_MASK = 0x40 | 0x80     # IN_MOVED_FROM | IN_MOVED_TO
+
+
+class WatchPlan:
+    """
+    The directories that must be watched to see every tracked resource move:
+    the ancestors of the tracked URLs ('.' being the boundary), each counted
+    by how many URLs need it.
+    """
+
+    def __init__(self, urls=()):
+        self.counts = {}
+        for url in urls:
+            self.add(url)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def __contains__(self, directory):
+        return directory in self.counts
+
+    @staticmethod
+    def ancestors(url):
+        yield "."
+        end = url.find("/")
+        while end > 0:
+            yield url[:end]
+            end = url.find("/", end + 1)
+
+    def add(self, url):
+        """Count a tracked URL. Returns the directories it newly needs watched."""
+        added = []
+        for directory in self.ancestors(url):
+            count = self.counts.get(directory, 0)
+            if not count:
+                added.append(directory)
+            self.counts[directory] = count + 1
+        return added
+
+    def remove(self, url):
+        """Forget a tracked URL. Returns the directories no longer needed."""
+        removed = []
+        for directory in self.ancestors(url):
+            count = self.counts.get(directory, 0)
+            if count <= 1:
+                if self.counts.pop(directory, None) is not None:
+                    removed.append(directory)
+            else:
+                self.counts[directory] = count - 1
+        return removed
+
+
+class TrackedIndex:
+    """
+    The tracked URLs of a boundary in memory: a set for exact lookups and a
+    WatchPlan counting, per directory, the tracked URLs below it.
+    """
+
+    def __init__(self, urls=()):
+        self.urls = set()
+        self.directories = WatchPlan()
+        for url in urls:
+            self.add(url)
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def has_tracked_below(self, directory):
+        return directory in self.directories
+
+    def add(self, url):
+        """Track a URL. Returns the directories that newly lead to a tracked URL."""
+        if url in self.urls:
+            return []
+        self.urls.add(url)
+        return self.directories.add(url)
+
+    def remove(self, url):
+        """Untrack a URL. Returns the directories that no longer lead to one."""
+        if url not in self.urls:
+            return []
+        self.urls.remove(url)
+        return self.directories.remove(url)
+
 
 class TagfsInotifyDaemon:
     """Daemon that monitors filesystem moves and updates resource URLs in the database."""
@@ -31,82 +158,356 @@ class TagfsInotifyDaemon:
     MOVED_FROM = 'MF'
     MOVED_DIR = 'MD'
 
-    def __init__(self, tag_boundary_path):
+    def __init__(self, tag_boundary_path, commit_window=DEFAULT_COMMIT_WINDOW,
+                 commit_events=DEFAULT_COMMIT_EVENTS, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 cookie_timeout=DEFAULT_COOKIE_TIMEOUT, watch=WATCH_TREE):
         self.tag_boundary_path = Path(tag_boundary_path).expanduser().resolve()
-        self.eventlist = []
+        self._boundary_prefix = str(self.tag_boundary_path) + os.sep
         self.th_utils = HTFS(self.tag_boundary_path)
+        self.commit_window = commit_window
+        self.commit_events = max(1, commit_events)
+        self.flush_interval = flush_interval
+        self.cookie_timeout = cookie_timeout
+        self.watch = watch
+        self.clock = time.monotonic
+        # The TrackedIndex, the storage generation it and the session match
+        # and when that was last checked; with watch="tracked" also the
+        # inotify adapter, which watches the index's directories
+        self.index = None
+        self._generation = storage_generation(self.tag_boundary_path)
+        self._index_checked = None
+        self.watcher = None
+        # cookie -> (deadline, MOVED_FROM or MOVED_DIR, url), oldest first
+        self.cookies = OrderedDict()
+        self.counters = {"matched": 0, "expired": 0, "unmatched": 0}
+        # (url, new url, is_directory) waiting for the next commit, with
+        # boundary-relative URLs; new url is None for a path that left the boundary
+        self.pending_moves = []
+        # Tracked state of URLs touched by pending moves, ahead of the database
+        self._pending_tracked = {}
+        self._pending_directory = False
+        self._pending_since = None
+        self._last_flush = self.clock()
+        self._stopping = False
 
     def close(self):
-        """Clean up resources, flushing RDF to disk."""
+        """Apply pending moves and clean up resources, flushing RDF to disk."""
+        self.commit_pending()
         self.th_utils.close()
 
+    def stats(self):
+        """
+        Event counters: MOVED_FROMs waiting for a cookie match, what became of
+        the others, the tracked URLs in memory and, with watch="tracked", the
+        number of watched directories.
+        """
+        stats = dict(self.counters, pending=len(self.cookies))
+        if self.index is not None:
+            stats["tracked"] = len(self.index)
+            if self.watch == WATCH_TRACKED:
+                stats["watches"] = len(self.index.directories)
+        return stats
+
+    def stop(self, signum=None, frame=None):
+        """Ask run() to return after the current event; installed for SIGTERM."""
+        self._stopping = True
+
     def run(self):
         if inotify is None:
             raise RuntimeError("tagfs inotify daemon is only available on Linux")
         logobj.info("Initializing inotify on path: %s", self.tag_boundary_path)
         try:
-            i = inotify.adapters.InotifyTree(str(self.tag_boundary_path))
+            # Wake up at least once per commit window so timers fire while idle
+            if self.watch == WATCH_TRACKED:
+                i = inotify.adapters.Inotify(block_duration_s=self.commit_window)
+                self.watcher = i
+            else:
+                i = inotify.adapters.InotifyTree(str(self.tag_boundary_path),
+                                                 block_duration_s=self.commit_window)
+            self.sync_index(force=True)
         except (PermissionError, OSError) as e:
             logobj.error("Failed to initialize inotify: %s", e)
             sys.exit(1)
 
         logobj.info("inode tracking active on: %s", self.tag_boundary_path)
+        previous_handler = signal.signal(signal.SIGTERM, self.stop)
 
         try:
-            for event in i.event_gen(yield_nones=False):
-                self.handle_event(event)
+            for event in i.event_gen(yield_nones=True):
+                if event is not None:
+                    self.handle_event(event)
+                self.tick()
+                if self._stopping:
+                    logobj.info("Received SIGTERM, shutting down.")
+                    break
         except KeyboardInterrupt:
             logobj.info("Shutting down daemon gracefully.")
         finally:
-            inotify.adapters.InotifyTree.close(i)
+            signal.signal(signal.SIGTERM, previous_handler)
+            i.close()
+            self.watcher = None
             self.close()
+            logobj.info("events: %s", self.stats())
+
+    def tick(self, now=None):
+        """Expire unmatched cookies, commit pending moves whose window has elapsed and flush on schedule."""
+        now = self.clock() if now is None else now
+        self.expire_cookies(now)
+        if self.pending_moves and now - self._pending_since >= self.commit_window:
+            self.commit_pending()
+        if now - self._last_flush >= self.flush_interval:
+            synced = self.sync_index()
+            self.th_utils.th.flush()
+            self._last_flush = now
+            self._own_write_done(synced)
+
+    def tracked_index(self):
+        """The TrackedIndex, checked against the database at most once per commit window."""
+        now = self.clock()
+        if self.index is None or now - self._index_checked >= self.commit_window:
+            self.sync_index()
+        return self.index
+
+    def sync_index(self, force=False):
+        """
+        Reload the index from the database if another process changed it (or
+        force is set), changing only the watches that differ. A change by
+        another process also reopens the HTFS session, whose relationships
+        would otherwise be stale. Returns the storage generation the index
+        now matches.
+        """
+        generation = storage_generation(self.tag_boundary_path)
+        self._index_checked = self.clock()
+        if generation != self._generation:
+            generation = self._reopen_session()
+        elif self.index is not None and not force:
+            return generation
+        old = set(self.index.directories) if self.index is not None else set()
+        self.index = TrackedIndex(self.th_utils.th.get_resource_urls_under("."))
+        self._generation = generation
+        if self.watch == WATCH_TRACKED:
+            new = set(self.index.directories)
+            self._apply_watch_changes(new - old, old - new)
+            logobj.info("watching %d directories for %d tracked resources", len(new), len(self.index))
+        return generation
+
+    def _reopen_session(self):
+        """Replace the HTFS session with a fresh one. Returns the storage generation after."""
+        logobj.info("database changed on disk, reloading")
+        self.th_utils.close()
+        self.th_utils = HTFS(self.tag_boundary_path)
+        return storage_generation(self.tag_boundary_path)
+
+    def _own_write_done(self, generation_before):
+        """
+        After the daemon wrote to the database: its own write is no reason to
+        reload, unless another process wrote since the index was in sync.
+        """
+        if self.index is not None and generation_before == self._generation:
+            self._generation = storage_generation(self.tag_boundary_path)
+
+    def _update_index(self, changes):
+        """Apply (old url, new url) changes of committed moves to the index and the watches."""
+        added, removed = set(), set()
+        for old_url, new_url in changes:
+            if old_url is not None:
+                for directory in self.index.remove(old_url):
+                    if directory in added:
+                        added.discard(directory)
+                    else:
+                        removed.add(directory)
+            if new_url is not None:
+                for directory in self.index.add(new_url):
+                    if directory in removed:
+                        removed.discard(directory)
+                    else:
+                        added.add(directory)
+        if self.watch == WATCH_TRACKED:
+            self._apply_watch_changes(added, removed)
+
+    def _apply_watch_changes(self, added, removed):
+        if self.watcher is None:
+            return
+        # Remove first: a moved directory keeps its inode, and so its watch
+        for directory in removed:
+            try:
+                self.watcher.remove_watch(str(self.tag_boundary_path / directory))
+            except Exception as ex:  # the adapter raises its own InotifyError
+                logobj.debug("cannot remove watch on %s: %s", directory, ex)
+        for directory in added:
+            try:
+                self.watcher.add_watch(str(self.tag_boundary_path / directory), WATCH_MASK)
+            except Exception as ex:
+                logobj.warning("cannot watch %s: %s", directory, ex)
+
+    def relative_url(self, path):
+        """
+        The boundary-relative URL of an event path. Paths are not resolved: a
+        moved-from path no longer exists, and a renamed symlink is the link.
+        """
+        if path.startswith(self._boundary_prefix):
+            return path[len(self._boundary_prefix):]
+        return Path(os.path.relpath(path, self.tag_boundary_path)).as_posix()
+
+    def is_tracked(self, url, is_directory=False):
+        """
+        Whether a URL is tracked (for a directory: or anything below it),
+        counting moves that are not committed yet.
+        """
+        tracked = self._pending_tracked.get(url)
+        if tracked is not None:
+            return tracked
+        if self._pending_directory:
+            # A pending directory move may have carried url with it
+            self.commit_pending()
+        index = self.tracked_index()
+        return url in index or (is_directory and index.has_tracked_below(url))
+
+    def queue_move(self, url, new_url, is_directory=False):
+        """
+        Buffer a move (or, with new_url None, a removal from the boundary);
+        commits right away once commit_events moves are pending.
+        """
+        if not self.pending_moves:
+            self._pending_since = self.clock()
+        self.pending_moves.append((url, new_url, is_directory))
+        self._pending_directory = self._pending_directory or is_directory
+        self._pending_tracked[url] = False
+        if new_url is not None:
+            self._pending_tracked[new_url] = True
+        if len(self.pending_moves) >= self.commit_events:
+            self.commit_pending()
+
+    def expire_cookies(self, now=None):
+        """Treat MOVED_FROMs older than cookie_timeout as moves out of the boundary."""
+        now = self.clock() if now is None else now
+        while self.cookies:
+            cookie, (deadline, dir_or_file, url) = next(iter(self.cookies.items()))
+            if deadline > now:
+                break
+            del self.cookies[cookie]
+            self.counters["expired"] += 1
+            if self.watch != WATCH_TRACKED:
+                self.queue_move(url, None, dir_or_file == self.MOVED_DIR)
+            else:
+                logobj.info("%s moved out of sight, possibly to an unwatched directory", url)
+
+    def commit_pending(self):
+        """Apply the buffered moves, in order, in one transaction. Returns how many were applied."""
+        moves, self.pending_moves = self.pending_moves, []
+        self._pending_tracked = {}
+        self._pending_directory = False
+        self._pending_since = None
+        if not moves:
+            return 0
+        # (old url, new url) of every resource moved or untracked, for the index.
+        # Syncing first also refreshes a stale session before it writes, which
+        # matters most for untracks: they remove every tag the resource has.
+        changes = []
+        generation = self.sync_index()
+        with self.th_utils.batch():
+            for url, new_url, is_directory in moves:
+                try:
+                    if new_url is None:
+                        changes.extend((old_url, None) for old_url in self.untrack(url, is_directory))
+                    elif self.th_utils.th.move_resource(url, new_url):
+                        logobj.info("%s -> %s", url, new_url)
+                        changes.extend(self._moved_urls(url, new_url, is_directory))
+                except Exception as ex:
+                    logobj.error("Failed to update resource: %s", ex)
+            # Files may have been edited since relocate() last fingerprinted them
+            self.th_utils.refresh_stats([new_url for _, new_url in changes if new_url is not None])
+        self._update_index(changes)
+        self._own_write_done(generation)
+        self._last_flush = self.clock()
+        return len(moves)
+
+    def _moved_urls(self, url, new_url, is_directory):
+        """The (old url, new url) pairs of a move that was just applied."""
+        th = self.th_utils.th
+        moved = []
+        if th.get_resource_id(new_url) >= 0:
+            moved.append((url, new_url))
+        if is_directory:
+            moved.extend((url + url_below[len(new_url):], url_below)
+                         for url_below in th.get_resource_urls_under(new_url))
+        return moved
+
+    def untrack(self, url, is_directory):
+        """
+        Untrack a URL that left the boundary, and for a directory everything
+        below it. Returns the URLs untracked.
+        """
+        th = self.th_utils.th
+        untracked = []
+        if is_directory:
+            for url_below in th.get_resource_urls_under(url):
+                if th.del_resource(url_below):
+                    untracked.append(url_below)
+        if th.del_resource(url):
+            logobj.info("%s moved out of the boundary", url)
+            untracked.append(url)
+        return untracked
 
     def handle_event(self, event):
         """Route events to appropriate handlers."""
         ievent, type_names, path, filename = event
-        full_path = Path(path) / filename if filename else Path(path)
+        if 'IN_MOVED_FROM' not in type_names and 'IN_MOVED_TO' not in type_names:
+            return
+        url = self.relative_url(os.path.join(path, filename) if filename else path)
 
         if 'IN_MOVED_FROM' in type_names:
-            self.handle_moved_from(ievent, type_names, full_path)
-        elif 'IN_MOVED_TO' in type_names:
-            self.handle_moved_to(ievent, type_names, full_path)
+            self.handle_moved_from(ievent, type_names, url)
+        else:
+            self.handle_moved_to(ievent, type_names, url)
 
-    def handle_moved_from(self, ievent, type_names, originalpath):
+    def handle_moved_from(self, ievent, type_names, url):
         """Record a file/directory move start."""
-        if 'IN_ISDIR' not in type_names:
-            if not self.th_utils.is_resource_tracked(originalpath):
-                return
-            self.eventlist.append((ievent.cookie, self.MOVED_FROM, originalpath))
-        else:
-            self.eventlist.append((ievent.cookie, self.MOVED_DIR, originalpath))
+        is_directory = 'IN_ISDIR' in type_names
+        if not self.is_tracked(url, is_directory):
+            return
+        dir_or_file = self.MOVED_DIR if is_directory else self.MOVED_FROM
+        self.cookies[ievent.cookie] = (self.clock() + self.cookie_timeout, dir_or_file, url)
 
-    def handle_moved_to(self, ievent, type_names, movedpath):
-        """Match MOVED_FROM with MOVED_TO and update the database."""
-        for e in self.eventlist[:]:
-            event_cookie, dir_or_file, originalpath = e
-            try:
-                movedpath.relative_to(self.tag_boundary_path)
-            except ValueError:
-                self.eventlist.remove(e)
-                continue
-            if event_cookie == ievent.cookie:
-                try:
-                    if dir_or_file == self.MOVED_FROM:
-                        self.th_utils.move_resource(originalpath, movedpath)
-                    else:
-                        self.th_utils.move_resource(originalpath, movedpath)
-                    logobj.info("%s -> %s", originalpath, movedpath)
-                except Exception as ex:
-                    logobj.error("Failed to update resource: %s", ex)
-                self.eventlist.remove(e)
+    def handle_moved_to(self, ievent, type_names, new_url):
+        """Match MOVED_FROM with MOVED_TO and queue the database update."""
+        entry = self.cookies.pop(ievent.cookie, None)
+        if entry is None:
+            # Moved in from outside the boundary, or an untracked file
+            self.counters["unmatched"] += 1
+            return
+        _, dir_or_file, url = entry
+        self.counters["matched"] += 1
+        self.queue_move(url, new_url, dir_or_file == self.MOVED_DIR)
 
 
-if __name__ == '__main__':
-    path = sys.argv[1] if len(sys.argv) > 1 else find_tagfs_boundary()
+def main():
+    parser = argparse.ArgumentParser(description="Track file moves inside a tagfs boundary.")
+    parser.add_argument("path", nargs="?", help="tagfs boundary (default: the one containing the current directory)")
+    parser.add_argument("--commit-window", type=float, default=DEFAULT_COMMIT_WINDOW, metavar="SECONDS",
+                        help=f"how long moves are buffered before one commit (default {DEFAULT_COMMIT_WINDOW})")
+    parser.add_argument("--commit-events", type=int, default=DEFAULT_COMMIT_EVENTS, metavar="N",
+                        help=f"commit early once N moves are pending (default {DEFAULT_COMMIT_EVENTS})")
+    parser.add_argument("--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL, metavar="SECONDS",
+                        help=f"how often relationship state is flushed (default {DEFAULT_FLUSH_INTERVAL})")
+    parser.add_argument("--watch", choices=WATCH_MODES, default=WATCH_TREE,
+                        help="watch every directory (tree, the default) or only those leading to tracked resources")
+    parser.add_argument("--cookie-timeout", type=float, default=DEFAULT_COOKIE_TIMEOUT, metavar="SECONDS",
+                        help=f"when an unmatched move counts as leaving the boundary (default {DEFAULT_COOKIE_TIMEOUT})")
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO')
+    path = args.path if args.path else find_tagfs_boundary()
     if path is None:
         logobj.error("tagfs not initialized in path")
-        sys.exit(1)
+        return 1
 
-    daemon = TagfsInotifyDaemon(path)
+    daemon = TagfsInotifyDaemon(path, commit_window=args.commit_window,
+                                commit_events=args.commit_events, flush_interval=args.flush_interval,
+                                cookie_timeout=args.cookie_timeout, watch=args.watch)
     daemon.run()
-    sys.exit(0)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
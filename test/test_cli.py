@@ -0,0 +1,492 @@
+import io
+import os
+import sys
+import json
+import time
+import subprocess
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from htfs import cli, server
+
+
+class CLITestCase(unittest.TestCase):
+    """Runs CLI commands in-process inside a fresh tagfs boundary."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.boundary = os.path.realpath(self.tmpdir.name)
+        os.chdir(self.boundary)
+        self.run_cli("init")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def run_cli(self, *argv):
+        args = cli.create_parser().parse_args(list(argv))
+        out = io.StringIO()
+        with redirect_stdout(out):
+            code = cli.COMMANDS[args.command](args)
+        return code, out.getvalue()
+
+    def touch(self, name):
+        with open(os.path.join(self.boundary, name), "w", encoding="utf-8"):
+            pass
+
+
+class TestLazyRDFLoading(CLITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.touch("a.txt")
+        self.run_cli("addtags", "Project/Alpha")
+        self.run_cli("addresource", "a.txt")
+        self.run_cli("tagresource", "a.txt", "Alpha")
+
+    def test_sqlite_only_commands_never_build_a_graph(self):
+        self.touch("b.txt")
+        commands = [
+            ("getboundary",),
+            ("lstags",),
+            ("addresource", "b.txt"),
+            ("renametag", "Alpha", "Beta"),
+            ("mvresource", "b.txt", "c.txt"),
+        ]
+        with mock.patch("htfs.rdf_handler.new_graph", side_effect=AssertionError("RDF graph loaded")):
+            for argv in commands:
+                with self.subTest(command=argv[0]):
+                    code, _ = self.run_cli(*argv)
+                    self.assertEqual(code, 0)
+
+    def test_relationship_commands_still_load_rdf(self):
+        code, out = self.run_cli("lstags", "Project")
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(out.split()), ["Alpha", "Project"])
+        code, out = self.run_cli("getresourcetags", "a.txt")
+        self.assertEqual(out.split(), ["Alpha"])
+
+
+class TestLazyImports(CLITestCase):
+    """Cheap commands must not pay for the database layer or rdflib at start-up."""
+
+    def loaded_modules(self, *argv):
+        code = (
+            "import sys; sys.argv[0] = 'tagfs'\n"
+            "from htfs.cli import main\n"
+            "try:\n    main()\n"
+            "except SystemExit:\n    print(' '.join(sys.modules), file=sys.stderr)\n"
+        )
+        env = dict(os.environ, TAGFS_NO_SERVER="1",
+                   PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(cli.__file__))))
+        result = subprocess.run([sys.executable, "-c", code, *argv], env=env,
+                                capture_output=True, text=True)
+        return set(result.stderr.splitlines()[-1].split())
+
+    def test_getboundary_skips_database_modules(self):
+        modules = self.loaded_modules("getboundary")
+        self.assertNotIn("htfs.core", modules)
+        self.assertNotIn("sqlite3", modules)
+        self.assertNotIn("rdflib", modules)
+        self.assertNotIn("shutil", modules)
+
+    def test_lstags_skips_rdflib(self):
+        modules = self.loaded_modules("lstags")
+        self.assertIn("htfs.core", modules)
+        self.assertNotIn("rdflib", modules)
+        self.assertNotIn("htfs.query_evaluator", modules)
+        for module in ("htfs.rdf_handler", "htfs.sqlite_links", "htfs.bitmap_index", "htfs.edge_store"):
+            self.assertNotIn(module, modules)
+
+
+class TestBulkResources(CLITestCase):
+
+    def test_add_and_tag_from_stdin(self):
+        for name in ("a.txt", "b.txt", "c.txt"):
+            self.touch(name)
+        self.run_cli("addtags", "Project/Alpha")
+        with mock.patch("sys.stdin", io.StringIO("a.txt\nb.txt\n\nc.txt\na.txt\n")):
+            code, _ = self.run_cli("addresource", "--from-file", "-")
+        self.assertEqual(code, 0)
+
+        lines = "a.txt\tAlpha new\nb.txt\tProject/Alpha\nc.txt\tBad/Spec\nmissing.txt\tAlpha\n"
+        with mock.patch("sys.stdin", io.StringIO(lines)):
+            code, _ = self.run_cli("tagresource", "--stdin")
+        self.assertEqual(code, 1)
+
+        _, out = self.run_cli("lsresources", "Project")
+        self.assertEqual(sorted(out.split()), [os.path.join(self.boundary, name) for name in ("a.txt", "b.txt")])
+        _, out = self.run_cli("getresourcetags", "a.txt")
+        self.assertEqual(sorted(out.split()), ["Alpha", "new"])
+        _, out = self.run_cli("getresourcetags", "c.txt")
+        self.assertEqual(out, "")
+
+    def test_bulk_ids_are_allocated_after_existing(self):
+        htfs = cli.get_tagfs_utils()
+        try:
+            first = htfs.add_resource("x.txt")
+            ids = htfs.add_resources(["y.txt", "x.txt", "sub/z.txt"])
+            self.assertEqual(ids, [first + 1, first, first + 2])
+            self.assertEqual(htfs.add_resource("w.txt"), first + 3)
+        finally:
+            htfs.close()
+
+    def test_mvresource_moves_a_directory(self):
+        os.makedirs(os.path.join(self.boundary, "docs", "sub"))
+        self.run_cli("addtags", "Project")
+        for name in ("docs/a.txt", "docs/sub/b.txt"):
+            self.touch(name)
+            self.run_cli("addresource", name)
+        self.run_cli("tagresource", "docs/sub/b.txt", "Project")
+        os.mkdir(os.path.join(self.boundary, "archive"))
+        code, _ = self.run_cli("mvresource", "docs", "archive", "true")
+        self.assertEqual(code, 0)
+        self.assertTrue(os.path.isfile(os.path.join(self.boundary, "archive", "docs", "sub", "b.txt")))
+        _, out = self.run_cli("lsresources", "Project")
+        self.assertEqual(out.split(), [os.path.join(self.boundary, "archive", "docs", "sub", "b.txt")])
+        code, _ = self.run_cli("mvresource", "missing", "elsewhere", "false")
+        self.assertEqual(code, 1)
+
+
+class TestLinkBackendCommand(CLITestCase):
+
+    def test_convert_and_query(self):
+        self.touch("a.txt")
+        self.run_cli("addtags", "Project/Alpha")
+        self.run_cli("addresource", "a.txt")
+        self.run_cli("tagresource", "a.txt", "Alpha")
+        self.assertEqual(self.run_cli("linkbackend"), (0, "rdf\n"))
+        self.assertEqual(self.run_cli("linkbackend", "sqlite")[0], 0)
+        self.assertEqual(self.run_cli("linkbackend"), (0, "sqlite\n"))
+        for engine in ("native", "sparql"):
+            with self.subTest(engine=engine):
+                code, out = self.run_cli("lsresources", "--engine", engine, "Project")
+                self.assertEqual(out.split(), [os.path.join(self.boundary, "a.txt")])
+
+
+class TestResourceTagListing(CLITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ("a.txt", "b.txt", ".hidden"):
+            self.touch(name)
+        with mock.patch("sys.stdin", io.StringIO("a.txt\n")):
+            self.run_cli("addresource", "--from-file", "-")
+        self.run_cli("tagresource", "a.txt", "x", "y")
+
+    def test_getresourcetags_with_many_paths(self):
+        self.assertEqual(self.run_cli("getresourcetags", "a.txt"), (0, "x\ny\n"))
+        with mock.patch("sys.stdin", io.StringIO("b.txt\n")):
+            code, out = self.run_cli("getresourcetags", "a.txt", "--stdin")
+        self.assertEqual((code, out), (1, "a.txt\tx y\nb.txt\t\n"))
+
+    def test_ls_formats(self):
+        self.assertEqual(self.run_cli("ls"), (0, "a.txt\tx y\nb.txt\t\n"))
+        code, out = self.run_cli("ls", "--format", "jsonl", "-a")
+        rows = [json.loads(line) for line in out.splitlines()]
+        rows = {row["path"]: row for row in rows}
+        self.assertIn(".hidden", rows)
+        self.assertEqual(rows["a.txt"], {"path": "a.txt", "tracked": True, "tags": ["x", "y"]})
+        self.assertFalse(rows["b.txt"]["tracked"])
+
+    def test_ls_uses_the_listed_directorys_boundary(self):
+        with tempfile.TemporaryDirectory() as other:
+            os.chdir(other)
+            self.assertEqual(self.run_cli("ls", self.boundary), (0, "a.txt\tx y\nb.txt\t\n"))
+            # From inside another boundary too
+            self.run_cli("init")
+            self.assertEqual(self.run_cli("ls", self.boundary), (0, "a.txt\tx y\nb.txt\t\n"))
+            os.chdir(self.boundary)
+
+
+class TestPrompt(CLITestCase):
+
+    def setUp(self):
+        self.cache_home = tempfile.TemporaryDirectory()
+        patcher = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_home.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache_home.cleanup)
+        super().setUp()
+
+    def test_prompt_tags_and_cache(self):
+        os.makedirs(os.path.join(self.boundary, "proj", "sub"))
+        self.touch("a.txt")
+        self.run_cli("addresource", "proj")
+        self.run_cli("addresource", "a.txt")
+        self.run_cli("tagresource", "proj", "work")
+        self.run_cli("tagresource", "a.txt", "z", "y")
+
+        self.assertEqual(self.run_cli("prompt"), (0, "{work, y, z}\n"))
+        os.chdir(os.path.join(self.boundary, "proj", "sub"))
+        self.assertEqual(self.run_cli("prompt"), (0, "{work}\n"))
+        with mock.patch.object(cli, "get_tagfs_utils", side_effect=AssertionError("db opened")):
+            self.assertEqual(self.run_cli("prompt"), (0, "{work}\n"))
+
+        self.run_cli("tagresource", "../../proj", "urgent")
+        self.assertEqual(self.run_cli("prompt"), (0, "{work, urgent}\n"))
+
+    def test_cache_hits_at_the_boundary_root(self):
+        self.touch("a.txt")
+        self.run_cli("addresource", "a.txt")
+        self.run_cli("tagresource", "a.txt", "x")
+        self.assertEqual(self.run_cli("prompt"), (0, "{x}\n"))
+        with mock.patch.object(cli, "get_tagfs_utils", side_effect=AssertionError("db opened")):
+            self.assertEqual(self.run_cli("prompt"), (0, "{x}\n"))
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_home.name, "tagfs"))), 1)
+
+
+class TestRecursiveImport(CLITestCase):
+
+    def test_tree_is_filtered_and_tagged(self):
+        for name in ("docs/a.pdf", "docs/b.txt", "docs/sub/c.pdf", "docs/drafts/d.pdf",
+                     "docs/sub/e.pdf", "docs/tracked.pdf"):
+            os.makedirs(os.path.dirname(os.path.join(self.boundary, name)), exist_ok=True)
+            self.touch(name)
+        with open(os.path.join(self.boundary, ".tagfsignore"), "w", encoding="utf-8") as fp:
+            fp.write("# generated files\ne.pdf\n")
+        self.run_cli("addresource", "docs/tracked.pdf")
+
+        code, _ = self.run_cli("addresource", "--recursive", "docs", "--include", "*.pdf",
+                               "--exclude", "drafts/", "--tag", "Paper")
+        self.assertEqual(code, 0)
+        _, out = self.run_cli("lsresources", "Paper")
+        self.assertEqual(out.split(), [os.path.join(self.boundary, name)
+                                       for name in ("docs/a.pdf", "docs/sub/c.pdf")])
+        _, out = self.run_cli("getresourcetags", "docs/tracked.pdf")
+        self.assertEqual(out, "")
+
+    def test_boundary_patterns_are_anchored_at_the_boundary(self):
+        for name in ("sub/build/out", "sub/x/build/out", "sub/keep.txt"):
+            os.makedirs(os.path.dirname(os.path.join(self.boundary, name)), exist_ok=True)
+            self.touch(name)
+        with open(os.path.join(self.boundary, ".tagfsignore"), "w", encoding="utf-8") as fp:
+            fp.write("sub/build/out\n")
+        self.run_cli("addresource", "--recursive", "sub", "--tag", "Scanned")
+        _, out = self.run_cli("lsresources", "Scanned")
+        self.assertEqual(out.split(), [os.path.join(self.boundary, name)
+                                       for name in ("sub/keep.txt", "sub/x/build/out")])
+
+
+class TestSanitize(CLITestCase):
+
+    def setUp(self):
+        super().setUp()
+        # big/ is listed with scandir, small/ and gone/ are checked with lstat
+        self.names = [f"big/f{i}.txt" for i in range(6)] + ["small/kept.txt", "gone/a.txt", "top.txt"]
+        self.run_cli("addtags", "Keep")
+        for name in self.names:
+            os.makedirs(os.path.dirname(os.path.join(self.boundary, name)), exist_ok=True)
+            self.touch(name)
+            self.run_cli("addresource", name)
+            self.run_cli("tagresource", name, "Keep")
+        for name in ("big/f1.txt", "big/f4.txt", "gone/a.txt", "top.txt"):
+            os.remove(os.path.join(self.boundary, name))
+        os.rmdir(os.path.join(self.boundary, "gone"))
+        self.missing = [os.path.join(self.boundary, name) for name in ("big/f1.txt", "big/f4.txt", "gone/a.txt", "top.txt")]
+
+    def test_dry_run_reports_without_untracking(self):
+        code, out = self.run_cli("sanitize", "--dry-run", "--format", "jsonl")
+        self.assertEqual(code, 0)
+        self.assertEqual([json.loads(line) for line in out.splitlines()],
+                         [{"path": path, "untracked": False} for path in self.missing])
+        _, out = self.run_cli("lsresources", "Keep", "--count")
+        self.assertEqual(out.strip(), str(len(self.names)))
+
+    def test_missing_resources_are_untracked(self):
+        code, out = self.run_cli("sanitize", "-j", "2")
+        self.assertEqual(code, 0)
+        self.assertEqual(out.split(), self.missing)
+        _, out = self.run_cli("lsresources", "Keep")
+        self.assertEqual(sorted(out.split()), sorted(set(os.path.join(self.boundary, name) for name in self.names)
+                                                     - set(self.missing)))
+        _, out = self.run_cli("sanitize")
+        self.assertEqual(out, "")
+
+
+class TestRelocate(CLITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.run_cli("addtags", "Keep")
+        for name in ("docs/a.txt", "docs/b.txt", "c.txt", "gone.txt"):
+            os.makedirs(os.path.dirname(os.path.join(self.boundary, name)), exist_ok=True)
+            with open(os.path.join(self.boundary, name), "w", encoding="utf-8") as fp:
+                fp.write(name)
+            self.run_cli("addresource", name)
+            self.run_cli("tagresource", name, "Keep")
+
+    def path(self, name):
+        return os.path.join(self.boundary, name)
+
+    def test_moves_are_found_by_inode(self):
+        os.makedirs(self.path("archive"))
+        os.rename(self.path("docs"), self.path("archive/docs"))
+        os.rename(self.path("c.txt"), self.path("archive/c2.txt"))
+        os.remove(self.path("gone.txt"))
+        expected = [(self.path("c.txt"), self.path("archive/c2.txt")),
+                    (self.path("docs/a.txt"), self.path("archive/docs/a.txt")),
+                    (self.path("docs/b.txt"), self.path("archive/docs/b.txt"))]
+
+        code, out = self.run_cli("relocate", "--dry-run", "--format", "jsonl")
+        self.assertEqual(code, 0)
+        self.assertEqual([(row["path"], row["newpath"]) for row in map(json.loads, out.splitlines())], expected)
+        _, out = self.run_cli("lsresources", "Keep")
+        self.assertIn(self.path("c.txt"), out.split())
+
+        _, out = self.run_cli("relocate")
+        self.assertEqual([tuple(line.split("\t")) for line in out.splitlines()], expected)
+        _, out = self.run_cli("lsresources", "Keep")
+        self.assertEqual(sorted(out.split()), sorted([new for _, new in expected] + [self.path("gone.txt")]))
+
+    def test_unrecorded_resources_are_fingerprinted(self):
+        htfs = cli.get_tagfs_utils()
+        try:
+            htfs.th.db.sqlite.conn.execute("DROP TABLE RESOURCESTATS;")
+            self.assertEqual(htfs.relocate(), [])
+        finally:
+            htfs.close()
+        os.rename(self.path("c.txt"), self.path("d.txt"))
+        _, out = self.run_cli("relocate")
+        self.assertEqual(out.split(), [self.path("c.txt"), self.path("d.txt")])
+
+    def test_edited_files_and_directories_are_found(self):
+        with open(self.path("c.txt"), "a", encoding="utf-8") as fp:
+            fp.write("more")
+        self.run_cli("addresource", "docs")
+        self.touch("docs/new.txt")
+        os.makedirs(self.path("d"))
+        os.rename(self.path("c.txt"), self.path("d/c.txt"))
+        os.rename(self.path("docs"), self.path("papers"))
+        _, out = self.run_cli("relocate")
+        self.assertEqual([tuple(line.split("\t")) for line in out.splitlines()],
+                         [(self.path("c.txt"), self.path("d/c.txt")),
+                          (self.path("docs"), self.path("papers")),
+                          (self.path("docs/a.txt"), self.path("papers/a.txt")),
+                          (self.path("docs/b.txt"), self.path("papers/b.txt"))])
+        self.assertEqual(self.run_cli("sanitize", "--dry-run"), (0, ""))
+
+    def test_reused_inode_goes_to_the_matching_record(self):
+        htfs = cli.get_tagfs_utils()
+        try:
+            ids = htfs.th.get_resource_ids_by_url(["c.txt", "gone.txt"])
+            stats = htfs.th.get_resource_stats(ids.values())
+            # gone.txt once held the inode that c.txt now has, in an older version
+            dev, ino, size, mtime = stats[ids["c.txt"]]
+            htfs.th.set_resource_stats({ids["gone.txt"]: (dev, ino, size + 1, mtime - 1)})
+        finally:
+            htfs.close()
+        os.remove(self.path("gone.txt"))
+        os.rename(self.path("c.txt"), self.path("e.txt"))
+        _, out = self.run_cli("relocate")
+        self.assertEqual(out.split(), [self.path("c.txt"), self.path("e.txt")])
+
+    def test_reused_path_is_not_overwritten(self):
+        os.rename(self.path("c.txt"), self.path("e.txt"))
+        self.run_cli("addresource", "e.txt")
+        _, out = self.run_cli("relocate")
+        self.assertEqual(out, "")
+
+
+class TestServer(CLITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.touch("a.txt")
+        self.server = server.Server(self.boundary)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        while not os.path.exists(self.server.path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join()
+        super().tearDown()
+
+    def test_commands_are_forwarded(self):
+        self.assertEqual(server.forward(["addtags", "Project/Alpha"])[0], 0)
+        self.assertEqual(server.forward(["addresource", "a.txt"])[0], 0)
+        self.assertEqual(server.forward(["tagresource", "--stdin"], stdin="a.txt\tAlpha\n")[0], 0)
+        code, out, _ = server.forward(["lsresources", "Project"])
+        self.assertEqual((code, out), (0, os.path.join(self.boundary, "a.txt") + "\n"))
+        code, _, err = server.forward(["tagresource", "missing.txt", "Alpha"])
+        self.assertEqual(code, 1)
+        self.assertIn("resource not tracked", err)
+
+        # Changes made without the server are picked up by it
+        self.run_cli("addtags", "Beta")
+        self.assertIn("Beta", server.forward(["lstags"])[1].split())
+
+    def test_fallback_without_server(self):
+        self.assertIsNone(server.forward(["init"]))
+        self.server.stop()
+        self.thread.join()
+        self.assertFalse(os.path.exists(self.server.path))
+        self.assertIsNone(server.forward(["lstags"]))
+
+
+class TestWedgedServer(CLITestCase):
+    """A server that does not take requests must not hang the CLI."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(server, "CONNECT_TIMEOUT", 0.2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unresponsive_socket_falls_back(self):
+        srv = server.Server(self.boundary)
+        srv._bind()
+        try:
+            start = time.monotonic()
+            self.assertIsNone(server.forward(["lstags"]))
+            self.assertLess(time.monotonic() - start, 5)
+        finally:
+            srv.close()
+
+    def test_abandoned_request_is_not_run(self):
+        srv = server.Server(self.boundary)
+        opening = threading.Event()
+        release = threading.Event()
+        session = srv._session
+
+        def slow_session():
+            opening.set()
+            release.wait()
+            return session()
+
+        thread = threading.Thread(target=srv.serve_forever)
+        with mock.patch.object(srv, "_session", side_effect=slow_session):
+            thread.start()
+            opening.wait()
+            # Bound but busy: the client gives up and would run it itself
+            self.assertIsNone(server.forward(["addtags", "Abandoned"]))
+            release.set()
+            self.assertEqual(server.forward(["addtags", "Served"])[0], 0)
+            code, out, _ = server.forward(["lstags"])
+        srv.stop()
+        thread.join()
+        self.assertEqual((code, out.split()), (0, ["Served"]))
+
+
+class TestServerSocket(CLITestCase):
+
+    def test_socket_is_private_from_creation(self):
+        srv = server.Server(self.boundary)
+        # Without the chmod the socket must still be created owner-only
+        with mock.patch("htfs.server.os.chmod"):
+            srv._bind()
+        try:
+            self.assertEqual(os.stat(srv.path).st_mode & 0o077, 0)
+        finally:
+            srv._sock.close()
+            os.unlink(srv.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,300 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from htfs import HTFS
+from htfs.tag_service import TagService
+from tagfs_inotify_daemon import TagfsInotifyDaemon, WatchPlan
+
+FakeEvent = namedtuple("FakeEvent", "cookie")
+
+
+class DaemonTestCase(unittest.TestCase):
+    """A daemon on a fresh boundary, fed synthetic inotify events."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.boundary = os.path.realpath(self.tmpdir.name)
+        htfs = HTFS(self.boundary)
+        htfs.initialize()
+        for name in ("a.txt", "b.txt"):
+            htfs.add_resource(os.path.join(self.boundary, name))
+        htfs.close()
+        self.daemon = self.make_daemon()
+        self.cookie = 0
+
+    def tearDown(self):
+        self.daemon.close()
+        self.tmpdir.cleanup()
+
+    def make_daemon(self, **kwargs):
+        return TagfsInotifyDaemon(self.boundary, **kwargs)
+
+    def move(self, src, dst, isdir=False):
+        self.cookie += 1
+        kind = ["IN_ISDIR"] if isdir else []
+        self.daemon.handle_event((FakeEvent(self.cookie), ["IN_MOVED_FROM"] + kind, self.boundary, src))
+        self.daemon.handle_event((FakeEvent(self.cookie), ["IN_MOVED_TO"] + kind, self.boundary, dst))
+
+    def committed_urls(self):
+        with sqlite3.connect(os.path.join(self.boundary, ".tagfs.db")) as conn:
+            return sorted(row[0] for row in conn.execute("SELECT URL FROM RESOURCES;"))
+
+
+class TestGroupCommit(DaemonTestCase):
+
+    def test_moves_wait_for_the_window(self):
+        self.move("a.txt", "c.txt")
+        self.daemon.tick(now=self.daemon._pending_since + self.daemon.commit_window / 2)
+        self.assertEqual(self.committed_urls(), ["a.txt", "b.txt"])
+        self.daemon.tick(now=self.daemon._pending_since + self.daemon.commit_window * 2)
+        self.assertEqual(self.committed_urls(), ["b.txt", "c.txt"])
+
+    def test_chained_moves_commit_once(self):
+        self.move("a.txt", "c.txt")
+        self.move("c.txt", "d.txt")
+        self.move("b.txt", "a.txt")
+        self.assertEqual(len(self.daemon.pending_moves), 3)
+        conn = self.daemon.th_utils.th.db.sqlite.conn
+        statements = []
+        conn.set_trace_callback(statements.append)
+        self.assertEqual(self.daemon.commit_pending(), 3)
+        conn.set_trace_callback(None)
+        self.assertEqual(statements.count("COMMIT"), 1)
+        self.assertEqual(self.committed_urls(), ["a.txt", "d.txt"])
+
+    def test_directory_move_carries_tracked_files(self):
+        htfs = self.daemon.th_utils
+        htfs.add_resource(os.path.join(self.boundary, "docs", "x.txt"))
+        self.move("docs", "papers", isdir=True)
+        self.move("papers/x.txt", "y.txt")
+        self.daemon.commit_pending()
+        self.assertEqual(self.committed_urls(), ["a.txt", "b.txt", "y.txt"])
+
+    def test_moves_refresh_recorded_stats(self):
+        path = os.path.join(self.boundary, "c.txt")
+        with open(path, "w", encoding="utf-8") as fp:
+            fp.write("edited after it was tracked")
+        self.move("a.txt", "c.txt")
+        self.daemon.commit_pending()
+        th = self.daemon.th_utils.th
+        rid = th.get_resource_id("c.txt")
+        st = os.lstat(path)
+        self.assertEqual(th.get_resource_stats([rid]), {rid: (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)})
+
+    def test_untracked_moves_are_ignored(self):
+        self.move("a.txt", "c.txt")
+        self.move("a.txt", "e.txt")
+        self.assertEqual(self.daemon.pending_moves, [("a.txt", "c.txt", False)])
+
+    def test_event_count_forces_commit(self):
+        self.daemon.close()
+        self.daemon = self.make_daemon(commit_events=2)
+        self.move("a.txt", "c.txt")
+        self.assertEqual(self.committed_urls(), ["a.txt", "b.txt"])
+        self.move("b.txt", "d.txt")
+        self.assertEqual(self.daemon.pending_moves, [])
+        self.assertEqual(self.committed_urls(), ["c.txt", "d.txt"])
+
+    def test_stop_and_close_apply_pending_moves(self):
+        self.move("a.txt", "c.txt")
+        self.daemon.stop()
+        self.assertTrue(self.daemon._stopping)
+        self.daemon.close()
+        self.daemon = self.make_daemon()
+        self.assertEqual(self.committed_urls(), ["b.txt", "c.txt"])
+
+    def test_flush_on_interval(self):
+        # On the class: tick() may reopen the session, replacing th_utils.th
+        with mock.patch.object(TagService, "flush") as flush:
+            start = self.daemon._last_flush
+            self.daemon.tick(now=start + 1)
+            flush.assert_not_called()
+            self.daemon.tick(now=start + self.daemon.flush_interval)
+            flush.assert_called_once_with()
+            # Another process writes, so the next tick flushes a new session
+            htfs = HTFS(self.boundary)
+            htfs.add_resource(os.path.join(self.boundary, "e.txt"))
+            htfs.close()
+            self.daemon.tick(now=start + 2 * self.daemon.flush_interval)
+            self.assertEqual(flush.call_count, 2)
+
+
+class TestCookieMatching(DaemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = 100.0
+        self.daemon.clock = lambda: self.now
+
+    def moved_from(self, name, isdir=False):
+        self.cookie += 1
+        kind = ["IN_ISDIR"] if isdir else []
+        self.daemon.handle_event((FakeEvent(self.cookie), ["IN_MOVED_FROM"] + kind, self.boundary, name))
+
+    def test_matched_cookies_are_removed(self):
+        self.move("a.txt", "c.txt")
+        self.move("untracked.txt", "d.txt")
+        self.daemon.handle_event((FakeEvent(999), ["IN_MOVED_TO"], self.boundary, "incoming.txt"))
+        self.assertEqual(self.daemon.stats(), {"pending": 0, "matched": 1, "expired": 0, "unmatched": 2, "tracked": 2})
+
+    def test_expired_move_untracks_resource(self):
+        self.moved_from("a.txt")
+        self.now += self.daemon.cookie_timeout / 2
+        self.daemon.tick()
+        self.assertEqual(self.daemon.stats()["pending"], 1)
+        self.now += self.daemon.cookie_timeout
+        self.daemon.tick()
+        self.assertEqual(self.daemon.stats(), {"pending": 0, "matched": 0, "expired": 1, "unmatched": 0, "tracked": 2})
+        self.assertFalse(self.daemon.is_tracked("a.txt"))
+        self.daemon.commit_pending()
+        self.assertEqual(self.committed_urls(), ["b.txt"])
+
+    def test_expired_directory_untracks_everything_below(self):
+        htfs = self.daemon.th_utils
+        for name in ("docs/x.txt", "docs/sub/y.txt", "docs.txt"):
+            htfs.add_resource(os.path.join(self.boundary, name))
+        self.moved_from("docs", isdir=True)
+        self.now += self.daemon.cookie_timeout
+        self.daemon.expire_cookies()
+        self.daemon.commit_pending()
+        self.assertEqual(self.committed_urls(), ["a.txt", "b.txt", "docs.txt"])
+
+
+class TestTrackedIndex(DaemonTestCase):
+
+    def test_untracked_renames_need_no_queries(self):
+        self.daemon.sync_index()
+        statements = []
+        self.daemon.th_utils.th.db.sqlite.conn.set_trace_callback(statements.append)
+        for n in range(100):
+            self.move(f".a.txt.swp{n}", "a.txt~")
+            self.move(f"build{n}", f"build{n}.old", isdir=True)
+        self.daemon.th_utils.th.db.sqlite.conn.set_trace_callback(None)
+        self.assertEqual(statements, [])
+        self.assertEqual(self.daemon.stats()["unmatched"], 200)
+
+    def test_index_follows_commits_and_other_processes(self):
+        self.daemon.sync_index()
+        self.move("a.txt", "c.txt")
+        self.daemon.commit_pending()
+        self.assertEqual(sorted(self.daemon.index.urls), ["b.txt", "c.txt"])
+        htfs = HTFS(self.boundary)
+        htfs.add_resource(os.path.join(self.boundary, "docs", "d.txt"))
+        htfs.close()
+        self.daemon.sync_index()
+        self.assertTrue(self.daemon.is_tracked("docs/d.txt"))
+        self.assertTrue(self.daemon.is_tracked("docs", is_directory=True))
+        self.assertFalse(self.daemon.is_tracked("docs"))
+
+
+class TestExternalChanges(DaemonTestCase):
+    """Another process changes tags while the daemon runs."""
+
+    def path(self, name):
+        return os.path.join(self.boundary, name)
+
+    def tag_elsewhere(self, name, *tags):
+        htfs = HTFS(self.boundary)
+        htfs.tag_resource(self.path(name), list(tags))
+        htfs.close()
+
+    def test_session_sees_tags_added_between_events(self):
+        self.move("a.txt", "c.txt")
+        self.daemon.commit_pending()
+        # Loads the daemon session's relationships
+        self.assertEqual(self.daemon.th_utils.get_resource_tags(self.path("c.txt")), [])
+        self.tag_elsewhere("c.txt", "work")
+        self.move("c.txt", "d.txt")
+        self.daemon.commit_pending()
+        self.daemon.tick(now=self.daemon._last_flush + self.daemon.flush_interval)
+        self.assertEqual(self.daemon.th_utils.get_resource_tags(self.path("d.txt")), ["work"])
+        htfs = HTFS(self.boundary)
+        self.assertEqual(htfs.get_resource_tags(self.path("d.txt")), ["work"])
+        htfs.close()
+
+    def test_expiry_untracks_with_tags_added_elsewhere(self):
+        now = 100.0
+        self.daemon.clock = lambda: now
+        self.assertEqual(self.daemon.th_utils.get_resource_tags(self.path("a.txt")), [])
+        self.tag_elsewhere("a.txt", "work", "draft")
+        self.cookie += 1
+        self.daemon.handle_event((FakeEvent(self.cookie), ["IN_MOVED_FROM"], self.boundary, "a.txt"))
+        now += self.daemon.cookie_timeout
+        self.daemon.tick()
+        self.daemon.commit_pending()
+        self.daemon.close()
+        self.assertEqual(self.committed_urls(), ["b.txt"])
+        htfs = HTFS(self.boundary)
+        # No hasTag links are left behind for the untracked resource
+        self.assertEqual(htfs.th.db.links.get_all_resource_tag_links(), [])
+        htfs.close()
+        self.daemon = self.make_daemon()
+
+
+class RecordingWatcher:
+    """Stands in for inotify.adapters.Inotify, keeping the watched paths."""
+
+    def __init__(self):
+        self.paths = set()
+
+    def add_watch(self, path, mask):
+        self.paths.add(path)
+
+    def remove_watch(self, path):
+        self.paths.remove(path)
+
+
+class TestSelectiveWatches(DaemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        htfs = self.daemon.th_utils
+        for name in ("docs/x.txt", "docs/sub/y.txt", "src/z.txt"):
+            htfs.add_resource(os.path.join(self.boundary, name))
+        self.daemon.close()
+        self.daemon = self.make_daemon(watch="tracked")
+        self.daemon.watcher = RecordingWatcher()
+        self.daemon.sync_index()
+
+    def watched(self):
+        return sorted(os.path.relpath(path, self.boundary) for path in self.daemon.watcher.paths)
+
+    def test_plan_counts_ancestors(self):
+        plan = WatchPlan(["a/b/c.txt", "a/d.txt", "e.txt"])
+        self.assertEqual(sorted(plan), [".", "a", "a/b"])
+        self.assertEqual(plan.remove("a/b/c.txt"), ["a/b"])
+        self.assertEqual(plan.remove("a/d.txt"), ["a"])
+        self.assertEqual(plan.add("a/b/c.txt"), ["a", "a/b"])
+
+    def test_only_directories_leading_to_tracked_resources(self):
+        self.assertEqual(self.watched(), [".", "docs", "docs/sub", "src"])
+        self.assertEqual(self.daemon.stats()["watches"], 4)
+
+    def test_watches_follow_committed_moves(self):
+        self.move("docs", "papers", isdir=True)
+        self.move("src/z.txt", "z.txt")
+        self.daemon.commit_pending()
+        self.assertEqual(self.watched(), [".", "papers", "papers/sub"])
+
+    def test_resync_after_another_process_tracks(self):
+        htfs = HTFS(self.boundary)
+        htfs.add_resource(os.path.join(self.boundary, "lib", "w.txt"))
+        htfs.close()
+        self.daemon.sync_index()
+        self.assertEqual(self.watched(), [".", "docs", "docs/sub", "lib", "src"])
+
+    def test_expired_moves_stay_tracked(self):
+        self.cookie += 1
+        self.daemon.handle_event((FakeEvent(self.cookie), ["IN_MOVED_FROM"], self.boundary, "src/z.txt"))
+        self.daemon.expire_cookies(now=self.daemon.clock() + self.daemon.cookie_timeout)
+        self.daemon.commit_pending()
+        self.assertEqual(self.daemon.stats()["expired"], 1)
+        self.assertIn("src/z.txt", self.committed_urls())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,291 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from htfs.database import DatabaseManager
+from htfs.link_backend import LinkBackend
+from htfs.rdf_handler import RDFHandler
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """A connected DatabaseManager in a fresh boundary."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(self.tmpdir.name)
+        self.db.connect()
+        self.db.initialize()
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def reopen(self):
+        self.db.close()
+        self.db = DatabaseManager(self.tmpdir.name)
+        self.db.connect()
+
+    def tag_ids(self, *names):
+        return {self.db.get_tag_id(name) for name in names}
+
+
+class TestTagClosure(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # topics -> {math, physics} -> mathphysics (two parents) -> tensors
+        for child, parent in (("math", "topics"), ("physics", "topics"),
+                              ("mathphysics", "math"), ("mathphysics", "physics"),
+                              ("tensors", "mathphysics")):
+            self.db.link_tag_to_parent(child, parent)
+
+    def closure(self, name):
+        return self.db.get_tag_closure_ids([self.db.get_tag_id(name)])
+
+    def test_closure_is_materialized(self):
+        self.assertEqual(self.closure("topics"),
+                         self.tag_ids("topics", "math", "physics", "mathphysics", "tensors"))
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+
+    def test_unlink_keeps_paths_through_other_parents(self):
+        self.db.remove_tag_link(self.db.get_tag_id("mathphysics"), self.db.get_tag_id("math"))
+        self.assertEqual(self.closure("math"), self.tag_ids("math"))
+        self.assertEqual(self.closure("topics"),
+                         self.tag_ids("topics", "math", "physics", "mathphysics", "tensors"))
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+
+    def test_delete_tag_updates_descendants(self):
+        self.db.delete_tag("mathphysics")
+        self.assertEqual(self.closure("topics"), self.tag_ids("topics", "math", "physics"))
+        self.assertEqual(self.closure("tensors"), self.tag_ids("tensors"))
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+
+    def test_missing_table_is_rebuilt_from_hierarchy(self):
+        self.db.sqlite.conn.execute("DROP TABLE TAGCLOSURE;")
+        self.db.sqlite.conn.commit()
+        self.reopen()
+        self.assertEqual(self.closure("physics"), self.tag_ids("physics", "mathphysics", "tensors"))
+
+    def test_check_reports_drift(self):
+        math_id, tensors_id = self.tag_ids("math"), self.tag_ids("tensors")
+        self.db.sqlite.conn.execute("DELETE FROM TAGCLOSURE WHERE DESCENDANT=?;", tuple(tensors_id))
+        self.db.sqlite.conn.commit()
+        missing, extra = self.db.check_tag_closure()
+        self.assertIn((math_id.pop(), tensors_id.pop()), missing)
+        self.assertEqual(extra, [])
+        self.db.rebuild_tag_closure()
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+
+    def unlink_behind_the_database(self, child, parent):
+        """Remove a hierarchy link through the RDF files alone, as another writer might."""
+        child_id, parent_id = self.db.get_tag_id(child), self.db.get_tag_id(parent)
+        self.db.close()
+        rdf = RDFHandler(self.db.ttl_path)
+        rdf.remove_tag_link(child_id, parent_id)
+        rdf.close()
+
+    def test_closure_is_rebuilt_when_links_change_elsewhere(self):
+        self.unlink_behind_the_database("mathphysics", "math")
+        self.reopen()
+        self.assertEqual(self.closure("math"), self.tag_ids("math"))
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+
+    def test_read_only_session_reads_stale_closure_from_links(self):
+        self.unlink_behind_the_database("mathphysics", "math")
+        self.db = DatabaseManager(self.tmpdir.name, read_only=True)
+        self.db.connect()
+        self.assertEqual(self.closure("math"), self.tag_ids("math"))
+        # The stale table is reported, not rewritten
+        self.assertNotEqual(self.db.check_tag_closure(), ([], []))
+
+    def test_read_only_session_does_not_create_closure(self):
+        self.db.flush()
+        self.db.sqlite.conn.execute("DROP TABLE TAGCLOSURE;")
+        self.db.sqlite.conn.commit()
+        self.db.close()
+        self.db = DatabaseManager(self.tmpdir.name, read_only=True)
+        self.db.connect()
+        self.assertEqual(self.closure("physics"), self.tag_ids("physics", "mathphysics", "tensors"))
+        self.assertFalse(self.db.closure_repo.exists())
+
+    def test_unsaved_hierarchy_change_leaves_closure_stale(self):
+        self.db.flush()
+        self.db.link_tag_to_parent("tensors", "topics")
+        self.db.remove_tag_link(self.db.get_tag_id("tensors"), self.db.get_tag_id("mathphysics"))
+        # Crash before the links reach disk: SQLite has the change, RDF does not
+        self.db.sqlite.close()
+        self.db = DatabaseManager(self.tmpdir.name)
+        self.db.connect()
+        self.assertEqual(self.closure("math"), self.tag_ids("math", "mathphysics", "tensors"))
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+
+
+class TestBulkLookups(DatabaseTestCase):
+
+    def test_urls_resolved_in_chunked_queries(self):
+        ids = [self.db.add_resource(f"file{i}.txt") for i in range(5)]
+        statements = []
+        self.db.sqlite.conn.set_trace_callback(statements.append)
+        with mock.patch("htfs.sqlite_handler.CHUNK_SIZE", 2):
+            urls = self.db.get_resource_urls(list(reversed(ids)) + [999])
+        self.db.sqlite.conn.set_trace_callback(None)
+        self.assertEqual(urls, [f"file{i}.txt" for i in reversed(range(5))])
+        self.assertEqual(len(statements), 3)
+
+    def test_tag_names_follow_input_order(self):
+        self.db.link_tag_to_parent("child", "parent")
+        child_id, parent_id = self.db.get_tag_id("child"), self.db.get_tag_id("parent")
+        self.assertEqual(self.db.get_tag_names([child_id, -1, parent_id]), ["child", "parent"])
+        self.assertEqual(self.db.get_tag_names([]), [])
+
+    def test_prefix_rename_is_one_range_update(self):
+        urls = ["docs/a.txt", "docs/sub/b.txt", "docs.txt", "docs0/c.txt", "docsx/d.txt", "other/e.txt"]
+        self.db.add_resources(urls)
+        statements = []
+        self.db.sqlite.conn.set_trace_callback(statements.append)
+        self.assertEqual(self.db.update_resource_url_prefix("docs", "archive/docs"), 2)
+        self.db.sqlite.conn.set_trace_callback(None)
+        self.assertEqual([sql for sql in statements if sql.startswith("UPDATE")],
+                         ["UPDATE RESOURCES SET URL = 'archive/docs' || substr(URL, 5) "
+                          "WHERE URL >= 'docs/' AND URL < 'docs0';"])
+        self.assertEqual(sorted(self.db.get_resource_urls_under(".")),
+                         sorted(["archive/docs/a.txt", "archive/docs/sub/b.txt"] + urls[2:]))
+
+    def test_prefix_rename_refuses_collisions(self):
+        self.db.add_resources(["src/a.txt", "src/b.txt", "dst/b.txt"])
+        self.assertEqual(self.db.update_resource_url_prefix("src", "dst"), -1)
+        self.assertEqual(self.db.get_resource_urls_under("src"), ["src/a.txt", "src/b.txt"])
+        self.assertEqual(self.db.update_resource_url_prefix(".", "dst"), -1)
+
+
+class TestTransaction(DatabaseTestCase):
+
+    def committed_urls(self):
+        with sqlite3.connect(self.db.db_path) as conn:
+            return sorted(row[0] for row in conn.execute("SELECT URL FROM RESOURCES;"))
+
+    def test_commits_once_at_end_of_block(self):
+        with self.db.transaction():
+            for name in ("a.txt", "b.txt"):
+                res_id = self.db.add_resource(name)
+                self.db.add_resource_tag_link(res_id, self.db.add_tag(name + "-tag"))
+            self.db.flush()
+            self.assertEqual(self.committed_urls(), [])
+            self.assertFalse(os.path.exists(self.db.rdf.journal_path))
+        self.assertEqual(self.committed_urls(), ["a.txt", "b.txt"])
+        self.assertTrue(os.path.exists(self.db.rdf.journal_path))
+
+    def test_rollback_restores_sqlite_and_relationships(self):
+        self.db.link_tag_to_parent("child", "parent")
+        kept_id = self.db.add_resource("kept.txt")
+        child_id, parent_id = self.db.get_tag_id("child"), self.db.get_tag_id("parent")
+        self.db.add_resource_tag_link(kept_id, child_id)
+
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                res_id = self.db.add_resource("new.txt")
+                self.db.add_resource_tag_link(res_id, child_id)
+                self.db.remove_resource_tag_link(kept_id, child_id)
+                self.db.remove_tag_link(child_id, parent_id)
+                raise RuntimeError("import failed")
+
+        self.assertEqual(self.db.get_resource_id("new.txt"), -1)
+        self.assertEqual(self.db.get_resource_tag_ids(kept_id), [child_id])
+        self.assertEqual(self.db.get_parent_tag_ids(child_id), [parent_id])
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+        self.reopen()
+        self.assertEqual(self.db.get_resources_by_tag_ids([parent_id]), [kept_id])
+
+
+class TestLinkBackends(DatabaseTestCase):
+
+    def populate(self):
+        for child, parent in (("math", "topics"), ("physics", "topics"), ("tensors", "math")):
+            self.db.link_tag_to_parent(child, parent)
+        self.db.add_resources(["a.txt", "b.txt", "c.txt"])
+        self.db.tag_resources([("a.txt", ["tensors"]), ("b.txt", ["physics", "math"]), ("c.txt", ["other"])])
+
+    def snapshot(self):
+        """Everything observable about the links, keyed by names."""
+        def names(ids):
+            return sorted(self.db.get_tag_names(ids))
+        topics = self.db.get_tag_id("topics")
+        return {
+            "tag_links": sorted(self.db.links.get_all_tag_links()),
+            "resource_links": sorted(self.db.get_all_resource_tag_links()),
+            "closure": names(self.db.links.get_tag_closure_ids([topics])),
+            "ancestors": names(self.db.links.get_tag_ancestor_ids([self.db.get_tag_id("tensors")])),
+            "by_tag": self.db.get_resources_by_tags(["math"]),
+            "bitmap": list(self.db.get_resource_bitmap([topics, self.db.get_tag_id("math")])),
+            "tags": self.db.get_resources_tags(["a.txt", "b.txt", "c.txt"]),
+        }
+
+    def test_sqlite_backend_matches_rdf(self):
+        self.populate()
+        expected = self.snapshot()
+        other = tempfile.TemporaryDirectory()
+        self.addCleanup(other.cleanup)
+        self.db.close()
+        self.db = DatabaseManager(other.name)
+        self.db.connect()
+        self.db.initialize(link_backend="sqlite")
+        self.populate()
+        self.assertEqual(self.db.get_link_backend(), "sqlite")
+        self.assertEqual(self.snapshot(), expected)
+        self.assertFalse(os.path.exists(self.db.ttl_path))
+        self.db.delete_tag("math")
+        self.assertEqual(self.db.get_resource_tags("b.txt"), ["physics"])
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+
+    def test_conversion_round_trip_is_lossless(self):
+        self.populate()
+        expected = self.snapshot()
+        self.assertTrue(self.db.set_link_backend("sqlite"))
+        self.reopen()
+        self.assertEqual(self.db.get_link_backend(), "sqlite")
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(self.db.rdf.get_all_resource_tag_links(), self.db.links.get_all_resource_tag_links())
+        self.assertTrue(self.db.set_link_backend("rdf"))
+        self.reopen()
+        self.assertEqual(self.snapshot(), expected)
+        with sqlite3.connect(self.db.db_path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM RESOURCELINKS;").fetchone()[0], 0)
+        self.assertFalse(self.db.set_link_backend("graphdb"))
+
+    def test_sqlite_links_roll_back_with_ids(self):
+        self.db.set_link_backend("sqlite")
+        self.populate()
+        expected = self.snapshot()
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.tag_resources([("a.txt", ["physics"])])
+                self.db.delete_tag("math")
+                raise RuntimeError("import failed")
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(self.db.check_tag_closure(), ([], []))
+
+    def test_read_only_sqlite_backend_creates_no_tables(self):
+        self.db.settings.set("LINK_BACKEND", "sqlite")
+        self.db.close()
+        self.db = DatabaseManager(self.tmpdir.name, read_only=True)
+        self.db.connect()
+        self.assertEqual(self.db.links.get_all_tag_links(), [])
+        self.assertEqual(self.db.links.get_tag_closure_ids([1]), {1})
+        self.assertEqual(list(self.db.get_resource_bitmap([1])), [])
+        with sqlite3.connect(self.db.db_path) as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")}
+        self.assertNotIn("TAGLINKS", tables)
+        self.assertNotIn("RESOURCELINKS", tables)
+
+    def test_incomplete_backend_cannot_be_instantiated(self):
+        class HalfBackend(LinkBackend):
+            def connect(self):
+                return self
+        with self.assertRaises(TypeError):
+            HalfBackend()
+
+
+if __name__ == '__main__':
+    unittest.main()
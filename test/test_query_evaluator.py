@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+
+from htfs.query_evaluator import QueryEvaluator
+from htfs.tag_service import TagService
+
+
+class TestQueryEngines(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ts = TagService(self.tmpdir.name)
+        self.ts.initialize()
+        for child, parent in (("proj1", "projects"), ("proj2", "projects"),
+                              ("research", "topics"), ("draft", "status")):
+            self.ts.link_tag(child, parent)
+        resources = {
+            "a.txt": ["proj1", "research"],
+            "b.txt": ["proj2", "research", "draft"],
+            "c.txt": ["proj2"],
+            "d.txt": ["research"],
+            "e.txt": [],
+        }
+        for url, tags in resources.items():
+            self.ts.add_resource(url)
+            self.ts.add_resource_tags(url, tags)
+
+    def tearDown(self):
+        self.ts.close()
+        self.tmpdir.cleanup()
+
+    def evaluate(self, expression, engine="native", count=False):
+        result = QueryEvaluator(self.ts, engine=engine).evaluate(expression, count=count)
+        return result if count else sorted(result)
+
+    def test_native_engine_matches_sparql(self):
+        for expression in ("projects", "proj1|proj2", "projects&research",
+                           "(proj1|proj2)&research&~draft", "research&~projects",
+                           "unknown|proj1", "~projects", "research|~projects",
+                           "~draft&~research", "~~proj2", "~unknown"):
+            with self.subTest(expression=expression):
+                self.assertEqual(self.evaluate(expression),
+                                 self.evaluate(expression, engine="sparql"))
+
+    def test_native_engine_results(self):
+        self.assertEqual(self.evaluate("(proj1|proj2)&research&~draft"), ["a.txt"])
+        self.assertEqual(self.evaluate("~projects"), ["d.txt", "e.txt"])
+        self.assertEqual(self.evaluate("projects", count=True), 3)
+        self.assertEqual(self.evaluate("unknown&research"), [])
+
+    def test_negation_ranges_over_all_resources(self):
+        expected = {
+            "~projects": ["d.txt", "e.txt"],
+            "research|~projects": ["a.txt", "b.txt", "d.txt", "e.txt"],
+            "~(research|projects)": ["e.txt"],
+        }
+        for engine in ("native", "sparql"):
+            for expression, resources in expected.items():
+                with self.subTest(engine=engine, expression=expression):
+                    self.assertEqual(self.evaluate(expression, engine=engine), resources)
+                    self.assertEqual(self.evaluate(expression, engine=engine, count=True), len(resources))
+
+    def test_negated_union_operand_from_test_script(self):
+        # The hierarchy and resources of test/test_script.sh
+        for child, parent in (("mathematics", "topics"), ("physics", "topics"),
+                              ("calculus", "mathematics"), ("quantumphysics", "physics")):
+            self.ts.link_tag(child, parent)
+        for url, tag in (("dir1/calculus.txt", "calculus"), ("dir1/math.txt", "mathematics"),
+                         ("dir2/physics.txt", "physics"),
+                         ("dir2/quantummechanics.txt", "quantumphysics")):
+            self.ts.add_resource(url)
+            self.ts.add_resource_tags(url, [tag])
+        expression = "calculus | (~(mathematics))"
+        expected = ["a.txt", "b.txt", "c.txt", "d.txt", "dir1/calculus.txt",
+                    "dir2/physics.txt", "dir2/quantummechanics.txt", "e.txt"]
+        self.assertEqual(self.evaluate(expression), expected)
+        self.assertEqual(self.evaluate(expression, engine="sparql"), expected)
+
+    def test_count_ignores_links_of_untracked_resources(self):
+        # A hasTag link whose resource row is gone, as a crash can leave behind
+        self.ts.db.add_resource_tag_link(999, self.ts.db.get_tag_id("proj1"))
+        self.assertEqual(self.evaluate("projects"), ["a.txt", "b.txt", "c.txt"])
+        self.assertEqual(self.evaluate("projects", count=True), 3)
+        self.assertEqual(self.evaluate("proj1|~research", count=True), 3)
+
+    def test_unknown_engine_is_rejected(self):
+        with self.assertRaises(ValueError):
+            QueryEvaluator(self.ts, engine="bogus")
+
+
+if __name__ == '__main__':
+    unittest.main()
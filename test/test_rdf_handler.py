@@ -0,0 +1,243 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from htfs.bitmap_index import Bitmap
+from htfs.rdf_handler import RDFHandler
+
+
+class TestRDFHandlerJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ttl_path = os.path.join(self.tmpdir.name, ".tagfs.ttl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_changes_are_journaled_and_replayed(self):
+        rdf = RDFHandler(self.ttl_path)
+        rdf.add_tag_link(2, 1)
+        rdf.add_resource_tag_link(10, 2)
+        rdf.add_resource_tag_link(11, 2)
+        rdf.close()
+
+        # Only the journal is written; no full Turtle rewrite
+        self.assertFalse(os.path.exists(self.ttl_path))
+        self.assertTrue(os.path.exists(rdf.journal_path))
+
+        rdf = RDFHandler(self.ttl_path)
+        rdf.remove_resource_tag_link(11, 2)
+        rdf.close()
+
+        rdf = RDFHandler(self.ttl_path)
+        self.assertEqual(rdf.get_parent_tag_ids(2), [1])
+        self.assertEqual(rdf.get_resource_tag_ids(10), [2])
+        self.assertEqual(rdf.get_resource_tag_ids(11), [])
+        rdf.close()
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        rdf = RDFHandler(self.ttl_path, compact_threshold=3)
+        rdf.add_tag_link(2, 1)
+        rdf.add_tag_link(3, 1)
+        rdf.add_resource_tag_link(10, 3)
+        rdf.close()
+
+        self.assertTrue(os.path.exists(self.ttl_path))
+        self.assertTrue(os.path.exists(rdf.snapshot_path))
+        self.assertFalse(os.path.exists(rdf.journal_path))
+
+        rdf = RDFHandler(self.ttl_path)
+        self.assertEqual(rdf.get_tag_closure_ids([1]), {1, 2, 3})
+        self.assertEqual(rdf.get_resource_tag_ids(10), [3])
+        rdf.close()
+
+    def test_torn_journal_entry_is_ignored(self):
+        rdf = RDFHandler(self.ttl_path)
+        rdf.add_tag_link(2, 1)
+        rdf.close()
+        with open(rdf.journal_path, "a", encoding="utf-8") as fp:
+            fp.write("+ <http://htfs.example.org/ontology#tag_3")
+
+        rdf = RDFHandler(self.ttl_path)
+        self.assertEqual(rdf.get_all_tag_links(), [(2, 1)])
+        rdf.close()
+
+    def test_compaction_keeps_changes_from_other_handlers(self):
+        first = RDFHandler(self.ttl_path)
+        first.add_tag_link(1, 3)
+        first.flush()
+        second = RDFHandler(self.ttl_path)
+        second.add_tag_link(2, 3)
+        second.close()
+
+        first.compact()
+        self.assertEqual(sorted(first.get_child_tag_ids(3)), [1, 2])
+        first.close()
+
+        rdf = RDFHandler(self.ttl_path)
+        self.assertEqual(sorted(rdf.get_all_tag_links()), [(1, 3), (2, 3)])
+        rdf.close()
+
+    def test_append_after_another_handler_compacted(self):
+        first = RDFHandler(self.ttl_path)
+        first.add_resource_tag_link(10, 1)
+        first.flush()
+        second = RDFHandler(self.ttl_path)
+        second.add_resource_tag_link(11, 1)
+        second.compact()
+        second.close()
+
+        first.remove_resource_tag_link(10, 1)
+        first.close()
+
+        rdf = RDFHandler(self.ttl_path)
+        self.assertEqual(rdf.get_all_resource_tag_links(), [(11, 1)])
+        rdf.close()
+
+    def test_append_drops_torn_tail_before_writing(self):
+        rdf = RDFHandler(self.ttl_path)
+        rdf.add_tag_link(2, 1)
+        rdf.close()
+        with open(rdf.journal_path, "a", encoding="utf-8") as fp:
+            fp.write("+ <http://htfs.example.org/ontology#tag_3")
+
+        rdf = RDFHandler(self.ttl_path)
+        rdf.add_tag_link(4, 1)
+        rdf.close()
+
+        rdf = RDFHandler(self.ttl_path)
+        self.assertEqual(sorted(rdf.get_all_tag_links()), [(2, 1), (4, 1)])
+        rdf.close()
+
+
+class TestRDFHandlerHierarchy(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rdf = RDFHandler(os.path.join(self.tmpdir.name, ".tagfs.ttl"))
+        # 1 -> {2, 3} -> 4 (4 has two parents)
+        for child_id, parent_id in ((2, 1), (3, 1), (4, 2), (4, 3)):
+            self.rdf.add_tag_link(child_id, parent_id)
+
+    def tearDown(self):
+        self.rdf.close()
+        self.tmpdir.cleanup()
+
+    def test_adjacency_follows_link_changes(self):
+        self.assertEqual(self.rdf.get_tag_closure_ids([1]), {1, 2, 3, 4})
+        self.assertEqual(sorted(self.rdf.get_parent_tag_ids(4)), [2, 3])
+
+        self.rdf.remove_tag_link(4, 2)
+        self.assertEqual(self.rdf.get_tag_closure_ids([2]), {2})
+        self.assertEqual(self.rdf.get_tag_closure_ids([1]), {1, 2, 3, 4})
+
+        self.rdf.remove_all_links_for_tag(3)
+        self.assertEqual(self.rdf.get_tag_closure_ids([1]), {1, 2})
+        self.assertEqual(self.rdf.get_parent_tag_ids(4), [])
+        self.assertEqual(self.rdf.get_child_tag_ids(1), [2])
+
+    def test_resources_by_tag_ids_walks_closure_once(self):
+        for resource_id, tag_id in ((12, 4), (10, 1), (11, 3)):
+            self.rdf.add_resource_tag_link(resource_id, tag_id)
+        self.assertEqual(self.rdf.get_resources_by_tag_ids([2, 3]), [11, 12])
+        closure = self.rdf.get_tag_closure_ids([1])
+        with mock.patch.object(self.rdf, "get_tag_closure_ids", side_effect=AssertionError("re-walked")):
+            self.assertEqual(self.rdf.get_resources_by_tag_ids(closure, closed=True), [10, 11, 12])
+
+
+class TestRDFHandlerSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ttl_path = os.path.join(self.tmpdir.name, ".tagfs.ttl")
+        rdf = RDFHandler(self.ttl_path)
+        rdf.add_tag_link(2, 1)
+        rdf.add_resource_tag_link(10, 2)
+        rdf.compact()
+        rdf.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fresh_snapshot_skips_turtle_parsing(self):
+        rdf = RDFHandler(self.ttl_path)
+        with mock.patch("htfs.rdf_handler.new_graph", side_effect=AssertionError("Turtle parsed")):
+            self.assertEqual(rdf.get_child_tag_ids(1), [2])
+            self.assertEqual(rdf.get_resources_by_tag_ids([1]), [10])
+        rdf.close()
+
+    def test_newer_turtle_wins_over_snapshot(self):
+        with open(self.ttl_path, "a", encoding="utf-8") as fp:
+            fp.write("htfs:resource_11 htfs:hasTag htfs:tag_1 .\n")
+        snapshot_mtime = os.stat(RDFHandler(self.ttl_path).snapshot_path).st_mtime_ns
+        os.utime(self.ttl_path, ns=(snapshot_mtime, snapshot_mtime + 10**9))
+
+        rdf = RDFHandler(self.ttl_path)
+        self.assertEqual(sorted(rdf.get_resources_by_tag_ids([1])), [10, 11])
+        rdf.close()
+
+    def test_corrupt_snapshot_falls_back_to_turtle(self):
+        snapshot_path = RDFHandler(self.ttl_path).snapshot_path
+        with open(snapshot_path, "r+b") as fp:
+            fp.seek(-1, os.SEEK_END)
+            fp.write(b"\xff")
+
+        rdf = RDFHandler(self.ttl_path)
+        self.assertEqual(rdf.get_all_resource_tag_links(), [(10, 2)])
+        rdf.close()
+
+    def test_read_only_handler_maps_snapshot(self):
+        rdf = RDFHandler(self.ttl_path, read_only=True)
+        self.assertEqual(rdf.get_resource_tag_ids(10), [2])
+        self.assertEqual(rdf.get_resources_by_tag_ids([1]), [10])
+        self.assertIsInstance(rdf.has_tag.fwd_src, memoryview)
+        with self.assertRaises(RuntimeError):
+            rdf.add_resource_tag_link(11, 1)
+        rdf.close()
+        self.assertIsNone(rdf._mapping)
+
+
+class TestRDFHandlerBitmaps(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ttl_path = os.path.join(self.tmpdir.name, ".tagfs.ttl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_bitmap_algebra(self):
+        a = Bitmap.from_ids([1, 5, 70000, 10**7])
+        b = Bitmap.from_ids([5, 10**7, 42])
+        self.assertEqual(list(a | b), [1, 5, 42, 70000, 10**7])
+        self.assertEqual(list(a & b), [5, 10**7])
+        self.assertEqual(list(a - b), [1, 70000])
+        self.assertEqual(len(a), 4)
+        a.discard(70000)
+        self.assertNotIn(70000, a)
+
+    def test_saved_index_plus_journal_matches_links(self):
+        rdf = RDFHandler(self.ttl_path)
+        rdf.add_resource_tag_link(10, 1)
+        rdf.add_resource_tag_link(11, 1)
+        rdf.compact()
+        rdf.remove_resource_tag_link(10, 1)
+        rdf.add_resource_tag_link(12, 2)
+        rdf.close()
+        self.assertTrue(os.path.exists(rdf.bitmaps_path))
+
+        rdf = RDFHandler(self.ttl_path)
+        with mock.patch.object(rdf, "connect", side_effect=AssertionError("links loaded")):
+            bitmaps = rdf.get_tag_bitmaps()
+        self.assertEqual(list(bitmaps.get(1)), [11])
+        self.assertEqual(list(bitmaps.union([1, 2])), [11, 12])
+
+        rdf.remove_all_tags_for_resource(11)
+        self.assertEqual(list(rdf.get_tag_bitmaps().get(1)), [])
+        rdf.close()
+
+
+if __name__ == '__main__':
+    unittest.main()